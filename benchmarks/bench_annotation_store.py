@@ -0,0 +1,218 @@
+"""
+    Memory per box and load/save times of the annotation stores, and the
+    open/save times of the json and binary annotation files.
+
+    Writes an annotation file with --boxes random boxes and loads it as
+    annotation objects, every frame accessed like the annotations were held
+    before the columnar store, and as NumPy columns. Both are saved back to
+    json. The memory is the traced allocations of the loaded store, measured
+    in a separate load so that tracing does not slow the timed load. The
+    annotation objects take close to 500 bytes per box, about 5 GB with the
+    default 10M boxes.
+
+    The json file is then saved as a binary .annbin file, which is saved
+    back to json. Every frame of the round trip is compared to the original,
+    including the text and derived keys of every --extras_every box.
+
+    python benchmarks/bench_annotation_store.py --boxes 10000000 --boxes_per_frame 10
+"""
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from pyannotate.annotation_loader import AnnotationLoader
+from pyannotate.binary_format import BINARY_EXTENSION
+from pyannotate.columnar_store import COLUMNS, ColumnarFrameStore
+
+
+def random_store(box_count, boxes_per_frame, class_count, extras_every, seed=0):
+    """
+        A columnar store of random boxes, boxes_per_frame objects are tracked through the frames.
+        Every extras_every box has a text and every other of them is derived.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    frame_count = -(-box_count // boxes_per_frame)
+    rows = np.arange(box_count, dtype=np.int32)
+
+    x1 = rng.integers(0, 1800, box_count, dtype=np.int32)
+    y1 = rng.integers(0, 1000, box_count, dtype=np.int32)
+
+    columns = {
+              'frame' : rows // boxes_per_frame,
+              'object_id' : rows % boxes_per_frame,
+              'class_id' : rows % boxes_per_frame % class_count,
+              'x1' : x1,
+              'y1' : y1,
+              'x2' : x1 + rng.integers(10, 120, box_count, dtype=np.int32),
+              'y2' : y1 + rng.integers(10, 80, box_count, dtype=np.int32)
+    }
+    columns['class_name'] = columns['class_id'].copy()
+
+    class_names = [f"class{ind}" for ind in range(class_count)]
+
+    extras = dict()
+    for count, row in enumerate(range(0, box_count, extras_every) if extras_every > 0 else []):
+        extras[row] = {'text': f"box {row}"}
+        if count % 2 == 1:
+            extras[row]['derived'] = True
+
+    return ColumnarFrameStore(frame_count, {name: columns[name] for name in COLUMNS}, class_names, extras, None)
+
+
+def load_objects(file_path):
+    """The annotation objects of every frame"""
+
+    loader = AnnotationLoader()
+    frame_annotations = loader.load_annotation_file(file_path)[0]
+
+    for _ in frame_annotations:
+        pass
+
+    return loader, frame_annotations
+
+
+def load_columns(file_path):
+
+    loader = AnnotationLoader(columnar=True)
+
+    return loader, loader.load_annotation_file(file_path)[0]
+
+
+def open_file(file_path):
+    """The annotations of a json file indexed lazily or a memory-mapped binary file"""
+
+    loader = AnnotationLoader()
+
+    return loader, loader.load_annotation_file(file_path)[0]
+
+
+def changed_frames(original, loaded):
+    """Indices of the frames whose detections differ between the two stores"""
+
+    if len(original) != len(loaded):
+        raise RuntimeError(f"{len(loaded)} frames after the round trip, expected {len(original)}")
+
+    return [frame_ind for frame_ind in range(len(original)) if original.frame_json(frame_ind) != loaded.frame_json(frame_ind)]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def traced_bytes(function, *args):
+    """Bytes allocated by the function that are still in use when it returns"""
+
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        allocated = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    result[1].close()
+
+    return allocated
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the memory and load/save times of the annotation stores.')
+
+    parser.add_argument(
+        '--boxes', type=int, default=10000000,
+        help='number of boxes in the annotation file'
+    )
+
+    parser.add_argument(
+        '--boxes_per_frame', type=int, default=10,
+        help='number of boxes in each frame'
+    )
+
+    parser.add_argument(
+        '--classes', type=int, default=4,
+        help='number of annotation classes'
+    )
+
+    parser.add_argument(
+        '--extras_every', type=int, default=100,
+        help='every this many boxes have a text and every other of them is derived, 0 none'
+    )
+
+    parser.add_argument(
+        '--tmp_dir', type=str, default=None,
+        help='directory the annotation files are written to, the system temp directory by default'
+    )
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp_dir:
+
+        annotation_file = os.path.join(tmp_dir, 'annotations.json')
+
+        store = random_store(args.boxes, args.boxes_per_frame, args.classes, args.extras_every)
+        _, write_time = timed(AnnotationLoader().save_annotation_file, annotation_file, store)
+        del store
+
+        print(f"{args.boxes} boxes in {-(-args.boxes // args.boxes_per_frame)} frames, "
+              f"{os.path.getsize(annotation_file) / 2**20:.1f} MB json written in {write_time:.1f} s")
+        print(f"{'store':>8} {'bytes/box':>10} {'load s':>8} {'save s':>8}")
+
+        for name, load in (('objects', load_objects), ('columnar', load_columns)):
+
+            allocated = traced_bytes(load, annotation_file)
+
+            (loader, frame_annotations), load_time = timed(load, annotation_file)
+
+            if frame_annotations.total_detection_count() != args.boxes:
+                raise RuntimeError(f"Loaded {frame_annotations.total_detection_count()} boxes "
+                                   f"as {name}, expected {args.boxes}")
+
+            _, save_time = timed(loader.save_annotation_file, os.path.join(tmp_dir, f'{name}.json'), frame_annotations)
+
+            frame_annotations.close()
+            del frame_annotations
+
+            print(f"{name:>8} {allocated / args.boxes:>10.1f} {load_time:>8.2f} {save_time:>8.2f}")
+
+        binary_file = os.path.join(tmp_dir, 'annotations' + BINARY_EXTENSION)
+        round_trip_file = os.path.join(tmp_dir, 'round_trip.json')
+
+        print(f"{'file':>8} {'MB':>10} {'open s':>8} {'save s':>8}")
+
+        (_, json_annotations), json_open_time = timed(open_file, annotation_file)
+
+        # the binary file is saved from the json file and saved back to json from the binary file
+        _, binary_save_time = timed(AnnotationLoader(binary=True).save_annotation_file, binary_file, json_annotations)
+
+        (_, binary_annotations), binary_open_time = timed(open_file, binary_file)
+
+        _, json_save_time = timed(AnnotationLoader().save_annotation_file, round_trip_file, binary_annotations)
+
+        print(f"{'json':>8} {os.path.getsize(annotation_file) / 2**20:>10.1f} {json_open_time:>8.2f} {json_save_time:>8.2f}")
+        print(f"{'annbin':>8} {os.path.getsize(binary_file) / 2**20:>10.1f} {binary_open_time:>8.2f} {binary_save_time:>8.2f}")
+
+        _, round_trip_annotations = open_file(round_trip_file)
+
+        changed = changed_frames(json_annotations, binary_annotations) + \
+            changed_frames(json_annotations, round_trip_annotations)
+
+        for frame_annotations in (json_annotations, binary_annotations, round_trip_annotations):
+            frame_annotations.close()
+
+        if changed:
+            raise RuntimeError(f"The json -> annbin -> json round trip changed {len(changed)} frames, "
+                               f"first frame {min(changed)}")
+
+        print(f"json -> annbin -> json round trip is lossless, {len(json_annotations)} frames compared")
+
+
+if __name__ == '__main__':
+    main()
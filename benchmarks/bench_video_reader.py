@@ -0,0 +1,104 @@
+"""
+    Frames/sec of reading a video by stepping, skipping and playing back.
+
+    Compares seeking the capture to every frame, which is how frames were
+    read before VideoReader, with VideoReader without and with a keyframe
+    index. Playback is get_next_frame of VideoAnnotations.
+
+    python benchmarks/bench_video_reader.py video.mp4 --frames 300 --skips 0 4 16
+"""
+import os
+import time
+import argparse
+import tempfile
+import cv2
+
+from pyannotate.annotation_holder import VideoAnnotations
+from pyannotate.keyframe_index import KeyframeIndex
+from pyannotate.video_reader import VideoReader
+
+
+def seek_every_frame(video_file, frame_indices):
+
+    cap = cv2.VideoCapture(video_file)
+
+    for frame_index in frame_indices:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        success, frame = cap.read()
+        if not success:
+            break
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    cap.release()
+
+
+def video_reader(video_file, frame_indices, keyframe_index=None):
+
+    reader = VideoReader(cv2.VideoCapture(video_file), keyframe_index)
+
+    for frame_index in frame_indices:
+        reader.read(frame_index)
+
+    reader.release()
+
+
+def playback(video_file, frame_count, skip):
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        vann = VideoAnnotations(video_file, os.path.join(tmp_dir, 'annotations.json'), index_keyframes=True)
+        vann.frame_skip_count = skip
+
+        for _ in range(frame_count):
+            vann.get_next_frame()
+
+        vann.close()
+
+
+def frames_per_second(frame_count, function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return frame_count / (time.perf_counter() - start)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark reading video frames by stepping, skipping and playing back.')
+
+    parser.add_argument('video', type=str,
+                        help='the video to read')
+
+    parser.add_argument(
+        '--frames', type=int, default=300,
+        help='number of frames to read in each run'
+    )
+
+    parser.add_argument(
+        '--skips', type=int, nargs='+', default=[0, 4, 16],
+        help='frames skipped between the frames read, 0 steps through every frame'
+    )
+
+    args = parser.parse_args()
+
+    keyframe_index = KeyframeIndex.load_or_build(args.video)
+    keyframes = keyframe_index.keyframes
+    gop = keyframes[1] - keyframes[0] if len(keyframes) > 1 else None
+
+    print(f"{args.video}: {keyframe_index.frame_count} frames, {len(keyframes)} keyframes, GOP {gop}")
+    print(f"{'skip':>6} {'seek':>10} {'reader':>10} {'keyframes':>10} {'playback':>10}   frames/sec")
+
+    for skip in args.skips:
+
+        frame_indices = range(0, min(args.frames * (skip + 1), keyframe_index.frame_count), skip + 1)
+        # playback starts from the first frame, which is read when the video is opened
+        frame_count = len(frame_indices)
+
+        print(f"{skip:>6} "
+              f"{frames_per_second(frame_count, seek_every_frame, args.video, frame_indices):>10.1f} "
+              f"{frames_per_second(frame_count, video_reader, args.video, frame_indices):>10.1f} "
+              f"{frames_per_second(frame_count, video_reader, args.video, frame_indices, keyframe_index):>10.1f} "
+              f"{frames_per_second(frame_count, playback, args.video, frame_count - 1, skip):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
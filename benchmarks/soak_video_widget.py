@@ -0,0 +1,133 @@
+"""
+    Soak test of showing frames in the video widget.
+
+    Shows frames with AnnotationWidget.update_frame many times in a row and
+    reports the memory use of the process, the time per frame and the number
+    of canvas items every --report_every frames. With the PhotoImage reused,
+    all three should stay flat. The widget window is withdrawn, Tk still needs
+    a display, for example a virtual one:
+
+    xvfb-run python benchmarks/soak_video_widget.py video.mp4 --frames 100000
+"""
+import os
+import time
+import argparse
+import resource
+import tempfile
+import cv2
+
+from pyannotate.annotate_video import AnnotationWidget
+from pyannotate.annotation_holder import VideoAnnotations
+
+
+def rss_bytes():
+    """Resident memory of the process, the peak where the current value is not available"""
+
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # kilobytes on linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SoakWidget(AnnotationWidget):
+    """The annotation widget running the soak test in place of the Tk main loop"""
+
+    def __init__(self, video_annotations, frames, frame_count, report_every, resize_every):
+
+        self.soak_frames = frames
+        self.soak_frame_count = frame_count
+        self.report_every = report_every
+        self.resize_every = resize_every
+
+        super().__init__(video_annotations, thumbnail_count=0)
+
+    def mainloop(self, n=0):
+
+        self.withdraw()
+
+        print(f"{'frames':>8} {'rss MB':>8} {'ms/frame':>9} {'max ms':>8} {'items':>6}")
+
+        reports = []
+        window_time = 0.0
+        window_max = 0.0
+
+        for ind in range(1, self.soak_frame_count + 1):
+
+            frame = self.soak_frames[ind % len(self.soak_frames)]
+
+            # a frame of another size, like switching between the proxy and full resolution frames
+            if self.resize_every > 0 and ind % self.resize_every == 0:
+                frame = cv2.resize(frame, (frame.shape[1] // 2, frame.shape[0] // 2))
+
+            start = time.perf_counter()
+
+            self.update_frame(frame)
+            self.update_idletasks()
+
+            elapsed = time.perf_counter() - start
+            window_time += elapsed
+            window_max = max(window_max, elapsed)
+
+            if ind % self.report_every == 0:
+
+                reports.append((rss_bytes(), window_time / self.report_every))
+
+                print(f"{ind:>8} {reports[-1][0] / 2**20:>8.1f} {1000 * reports[-1][1]:>9.3f} "
+                      f"{1000 * window_max:>8.2f} {len(self.image_area.find_all()):>6}")
+
+                window_time = 0.0
+                window_max = 0.0
+
+        if len(reports) > 1:
+            print(f"rss {(reports[-1][0] - reports[0][0]) / 2**20:+.1f} MB and time per frame "
+                  f"{reports[-1][1] / reports[0][1]:.2f}x from the first report to the last")
+
+        self.destroy()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Soak test of showing frames in the video widget.')
+
+    parser.add_argument('video', type=str,
+                        help='the video the shown frames are decoded from')
+
+    parser.add_argument(
+        '--frames', type=int, default=100000,
+        help='number of frames to show'
+    )
+
+    parser.add_argument(
+        '--distinct_frames', type=int, default=50,
+        help='number of frames decoded in the beginning, they are shown in turns'
+    )
+
+    parser.add_argument(
+        '--report_every', type=int, default=10000,
+        help='frames between the reports'
+    )
+
+    parser.add_argument(
+        '--resize_every', type=int, default=0,
+        help='show a half size frame every this many frames, 0 never'
+    )
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        vann = VideoAnnotations(args.video, os.path.join(tmp_dir, 'annotations.json'))
+
+        # the frames are decoded up front so that only showing them is measured
+        frames = [vann.go_to_frame(frame_ind) for frame_ind in range(min(args.distinct_frames, vann.frame_count))]
+        vann.go_to_frame(0)
+
+        SoakWidget(vann, frames, args.frames, args.report_every, args.resize_every)
+
+        vann.close()
+
+
+if __name__ == '__main__':
+    main()
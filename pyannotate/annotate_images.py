@@ -7,6 +7,8 @@ import time
 import logging
 
 from pyannotate.annotation_holder import ImageAnnotations
+from pyannotate.gui_update import GuiUpdateScheduler
+from pyannotate.object_selector import ObjectSelector
 from PIL import Image, ImageTk
 
 
@@ -70,6 +72,11 @@ class TextEntryWidget(tkinter.Tk):
 
 class AnnotationWidget(tkinter.Tk):
 
+    # ms between checking if the image being loaded is ready
+    load_poll_interval = 10
+
+    # ms between checking if an autosave is due
+    autosave_poll_interval = 1000
 
     def __init__(self, image_annotations):
 
@@ -87,6 +94,9 @@ class AnnotationWidget(tkinter.Tk):
         self._drawing = False        
         self._original_click_pos = (0,0)
 
+        # gui updates requested by the event handlers are done together when tkinter is idle
+        self.gui_updates = GuiUpdateScheduler(self, self.on_gui_update)
+
         ################################## header ##################################
 
          # Header info labels
@@ -97,7 +107,9 @@ class AnnotationWidget(tkinter.Tk):
         self.info_labels = [UpdateLabel(self.info_parent, 'Class: ', 'active_annotation_class', self.annotator),
                             UpdateLabel(self.info_parent, 'Object id: ', 'active_annotation_object_id', self.annotator),
                             UpdateLabel(self.info_parent, 'Image count', 'frame_count', self.annotator),
-                            UpdateLabel(self.info_parent, 'Current Image', 'current_frame', self.annotator)]
+                            UpdateLabel(self.info_parent, 'Current Image', 'current_frame', self.annotator),
+                            UpdateLabel(self.info_parent, 'Frame cache', 'frame_cache_stats', self.annotator),
+                            UpdateLabel(self.info_parent, 'Last save', 'save_status', self.annotator)]
 
         for ind, label in enumerate(self.info_labels):
             label.pack(side=tkinter.LEFT, padx=5)
@@ -107,6 +119,10 @@ class AnnotationWidget(tkinter.Tk):
         self.current_object_text_label = tkinter.Label(self.info_parent, textvariable=self.current_object_text_var)
         self.current_object_text_label.pack(side=tkinter.LEFT, padx=5)
 
+        self.coalesced_updates_var = tkinter.StringVar()
+        self.coalesced_updates_label = tkinter.Label(self.info_parent, textvariable=self.coalesced_updates_var)
+        self.coalesced_updates_label.pack(side=tkinter.LEFT, padx=5)
+
         ################################## class and object optionmenus  ##################################
 
         self.menu_parent = tkinter.Label(self)
@@ -122,9 +138,9 @@ class AnnotationWidget(tkinter.Tk):
         self.obj_string = tkinter.IntVar()
         self.obj_string.set(self.annotator.active_annotation_object_id)
         logger.debug(f"current_frame_objects: {self.annotator.current_frame_object_ids}")        
-        self.annotator_obj_select_widget = tkinter.OptionMenu(self.menu_parent, self.obj_string, *self.annotator.current_frame_object_ids, command=self.annotator_object_selection_callback)
+        self.annotator_obj_select_widget = ObjectSelector(self.menu_parent, self.obj_string, self.annotator_object_selection_callback, width=20)
+        self.annotator_obj_select_widget.set_options(self.annotator.current_frame_object_ids, key=(self.annotator.current_frame, self.annotator.frame_version()))
         self.annotator_obj_select_widget.pack(side=tkinter.LEFT, padx=10)
-        self.annotator_obj_select_widget.config(width=20)
 
         self.menu_parent.pack(fill=tkinter.X)
 
@@ -135,6 +151,14 @@ class AnnotationWidget(tkinter.Tk):
         self.image_area = tkinter.Canvas(self)
         self.image_area.pack(fill=tkinter.X)
 
+        # the canvas image item and the PhotoImage shown in it, reused for every image
+        self._image_ref = None
+        self.curr_frame = None
+        # the image currently converted into curr_frame
+        self._shown_frame = None
+        # annotations that have a box drawn on the canvas
+        self._drawn_annotations = []
+
 
 
 
@@ -147,10 +171,16 @@ class AnnotationWidget(tkinter.Tk):
 
         self.buttons = [tkinter.Button(self.button_parent, text="Next frame (a)", command=self.next_frame),
                         tkinter.Button(self.button_parent, text="Previous frame (d)", command=self.prev_frame),                                                
+                        tkinter.Button(self.button_parent, text="Previous occurrence ([)", command=self.prev_object_frame),
+                        tkinter.Button(self.button_parent, text="Next occurrence (])", command=self.next_object_frame),
+                        tkinter.Button(self.button_parent, text="Track start", command=self.first_object_frame),
+                        tkinter.Button(self.button_parent, text="Track end", command=self.last_object_frame),
                         tkinter.Button(self.button_parent, text="Mark annotation (m)", command=self.mark_annotation),
                         tkinter.Button(self.button_parent, text="Save annotations", command=self.save_annotations),
                         tkinter.Button(self.button_parent, text="Add text (t)", command=self.request_active_object_text)]
 
+        if self.annotator.journal is not None:
+            self.buttons.append(tkinter.Button(self.button_parent, text="Compact annotations", command=self.compact_annotations))
 
 
         # order buttons 
@@ -163,14 +193,27 @@ class AnnotationWidget(tkinter.Tk):
         # bind events 
         self.bind_events()
 
+        self.autosave_loop()
+
         # Start the GUI
         self.mainloop() 
 
 
     class update_gui:
-        """ Creating a class for wrapping gui updates in a decorator """
-        def __init__(self, func, *args, **kwargs):
+        """ 
+            Creating a class for wrapping gui updates in a decorator 
+
+            The gui is not updated right away, the updated parts are marked 
+            dirty and updated together on the next tkinter idle cycle.
+        """
+        def __init__(self, func, flags=GuiUpdateScheduler.ALL):
             self._func = func
+            self.flags = flags
+
+        @classmethod
+        def only(cls, flags):
+            """ Decorator for updating only the given parts of the gui """
+            return lambda func: cls(func, flags)
 
         def __get__(self, instance, owner):
             """
@@ -183,7 +226,7 @@ class AnnotationWidget(tkinter.Tk):
 
         def __call__(self, *args, **kwargs):                  
             self._func(self.obj, *args, **kwargs)
-            self.obj.on_gui_update()        
+            self.obj.gui_updates.schedule(self.flags)
             
 
     def bind_events(self):
@@ -210,6 +253,10 @@ class AnnotationWidget(tkinter.Tk):
                 self.prev_frame()
             elif event.char == "d":
                 self.next_frame()
+            elif event.char == "[":
+                self.prev_object_frame()
+            elif event.char == "]":
+                self.next_object_frame()
             elif event.char == "q":
                 self.quit()
         
@@ -219,86 +266,106 @@ class AnnotationWidget(tkinter.Tk):
 
 
     def update_frame(self):
+        """
+            Show the current image and draw the annotations on top of it as canvas 
+            items. The image is converted for tkinter only when the image changes, 
+            the annotation boxes are separate canvas items that are moved in place.
+        """
 
         if self._current_frame is None:
             raise RuntimeError("should always have frame")
 
-        # copied frame
-        frame_copy = self._current_frame.copy()
+        if self._current_frame is not self._shown_frame:
+            self.update_base_image(self._current_frame)
 
         # draw the detections 
-        self.draw_detections(frame_copy)
+        self.draw_detections()
 
-        # Convert the Image object into a TkPhoto object
-        image = Image.fromarray(frame_copy)
-        self.curr_frame = ImageTk.PhotoImage(image=image) 
-       
-        image_ref = self.image_area.create_image((0,0,), anchor=tkinter.NW, image=self.curr_frame)
-        self.image_area.tag_lower(image_ref)
+    def update_base_image(self, frame):
 
-        height, width, clrs = frame_copy.shape
-        self.image_area.config(width=width, height=height)
+        height, width, clrs = frame.shape
 
-        
+        image = Image.fromarray(frame)
+
+        if self.curr_frame is not None and (self.curr_frame.width(), self.curr_frame.height()) == (width, height):
+            self.curr_frame.paste(image)
+        else:
+            # Convert the Image object into a TkPhoto object
+            self.curr_frame = ImageTk.PhotoImage(image=image) 
+
+            if self._image_ref is None:
+                self._image_ref = self.image_area.create_image((0,0,), anchor=tkinter.NW, image=self.curr_frame)
+                self.image_area.tag_lower(self._image_ref)
+            else:
+                self.image_area.itemconfig(self._image_ref, image=self.curr_frame)
 
+            self.image_area.config(width=width, height=height)
 
-    def on_gui_update(self):
+        self._shown_frame = frame
+
+    def on_gui_update(self, flags=GuiUpdateScheduler.ALL):
         """
-            update everything that needs updating
+            update everything that needs updating, flags tell which 
+            parts of the gui have changed
         """
-        for label in self.info_labels:
-            label.update_text()
+        if flags & GuiUpdateScheduler.LABELS:
 
-        if self.annotator.active_annotation_object:
-            self.current_object_text_var.set("Text: {}".format(self.annotator.active_annotation_object.text))
-        
+            for label in self.info_labels:
+                label.update_text()
 
-        self.class_string.set(self.annotator.active_annotation_class)
-        self.obj_string.set(self.annotator.active_annotation_object_id)
+            if self.annotator.active_annotation_object:
+                self.current_object_text_var.set("Text: {}".format(self.annotator.active_annotation_object.text))
+
+            self.coalesced_updates_var.set("Coalesced updates: {}".format(self.gui_updates.coalesced))
+
+            self.class_string.set(self.annotator.active_annotation_class)
+            self.obj_string.set(self.annotator.active_annotation_object_id)
 
-        # update the possible available frame objects
-        self.update_menu_options(self.annotator_obj_select_widget,
-                                 self.annotator.current_frame_object_ids,
-                                 self.annotator_object_selection_callback)  
+        if flags & GuiUpdateScheduler.MENUS:
+            # update the possible available frame objects, 
+            # the options are only rebuilt if the annotations of the frame have changed
+            self.annotator_obj_select_widget.set_options(self.annotator.current_frame_object_ids,
+                                                         key=(self.annotator.current_frame, self.annotator.frame_version()))
 
-        self.update_frame()
+        if flags & (GuiUpdateScheduler.FRAME | GuiUpdateScheduler.OVERLAY):
+            self.update_frame()
+        elif flags & GuiUpdateScheduler.ACTIVE_BOX:
+            active_annotation = self.annotator.active_annotation_object
+            if active_annotation is not None:
+                self.draw_annotation(active_annotation, active=True)
 
-    def draw_detections(self, frame):
+    def draw_detections(self):
 
         # get the annotations for this frame
         annotations = self.annotator.get_frame_annotations()
         active_annotation = self.annotator.active_annotation_object
 
+        # remove the boxes of annotations that are not on this frame anymore
+        current = set(id(annotation) for annotation in annotations)
+        for annotation in self._drawn_annotations:
+            if id(annotation) not in current:
+                annotation.erase_annotation(self.image_area)
+
         for annotation in annotations:    
             annotation.update_annotation(visible=True)        
-            active = annotation.obj_id == active_annotation.obj_id            
-            annotation.draw_annotation_to_array(frame,
-                                       self.annotator.get_class_color(annotation.class_name), active)
+            self.draw_annotation(annotation, annotation is active_annotation)
 
-    def update_menu_options(self, optionmenu, new_options, command):
-        """
-            Update the shown options for the argument optionmenu.
-            Also needs a reference to the function to be called 
-            when the new options are selected.
-        """
-        menu = optionmenu['menu']
+        self._drawn_annotations = list(annotations)
 
-        # delete previous values
-        menu.delete(0, "end")
-
-        # add new options
-        for option in new_options:
-            menu.add_command(label=option, command=command)
+    def draw_annotation(self, annotation, active=False):
+        annotation.draw_annotation(self.image_area,
+                                   self.annotator.get_class_color(annotation.class_name),
+                                   active=active)
 
     def image_area_clicked(self, event):
         self._original_click_pos = (event.x, event.y)
         self._drawing = True
 
-    @update_gui
+    @update_gui.only(GuiUpdateScheduler.ACTIVE_BOX)
     def image_area_dragged(self, event):
         """
-            redraw the active bbox as dragging
-            bboxes are found through their tag (which is their class_name)
+            redraw the active bbox as dragging, only the box of the 
+            active annotation is moved on the canvas
         """
         # if tag is just a number string, tkinter mixes it with id :/
         active_annotation_object = self.annotator.active_annotation_object
@@ -330,9 +397,9 @@ class AnnotationWidget(tkinter.Tk):
         TextEntryWidget(callback_from_text_finished)
 
     @update_gui
-    def annotator_object_selection_callback(self):
+    def annotator_object_selection_callback(self, object_id):
         """callback gets the new selected option as argument"""           
-        self.annotator.active_annotation_object = self.obj_string.get() 
+        self.annotator.active_annotation_object = object_id
 
     @update_gui
     def annotator_class_selection_callback(self, active_name):
@@ -353,15 +420,75 @@ class AnnotationWidget(tkinter.Tk):
 
     @update_gui
     def next_frame(self):        
-        self._current_frame = self.annotator.get_next_frame()        
+        self.show_frame(self.annotator.get_next_frame(block=False))
 
     @update_gui
     def prev_frame(self):        
-        self._current_frame = self.annotator.get_prev_frame()        
+        self.show_frame(self.annotator.get_prev_frame(block=False))
+
+    @update_gui
+    def go_to_object_frame(self, where):
+        """Go to a frame of the track of the active object and keep the object active"""
+
+        object_id = self.annotator.active_annotation_object_id
+        frame_index = self.annotator.object_frame(where, object_id)
+
+        if frame_index is None:
+            return
+
+        self.show_frame(self.annotator.go_to_frame(frame_index, block=False))
+
+        self.annotator.active_annotation_object = object_id
+
+    def next_object_frame(self):
+        self.go_to_object_frame('next')
+
+    def prev_object_frame(self):
+        self.go_to_object_frame('previous')
+
+    def first_object_frame(self):
+        self.go_to_object_frame('first')
+
+    def last_object_frame(self):
+        self.go_to_object_frame('last')
+
+    def show_frame(self, frame):
+        """
+            Show the new image, or if it is still loading keep showing the 
+            previous image and show the new one as soon as it is ready
+        """
+        if frame is not None:
+            self._current_frame = frame
+        else:
+            self.after(self.load_poll_interval, self.poll_loading_frame, self.annotator.current_frame)
+
+    def poll_loading_frame(self, frame_index):
+
+        # the user has moved on to another image, that image is polled instead
+        if frame_index != self.annotator.current_frame:
+            return
+
+        frame = self.annotator.read_frame_if_ready()
+
+        if frame is None:
+            self.after(self.load_poll_interval, self.poll_loading_frame, frame_index)
+        else:
+            self._current_frame = frame
+            self.gui_updates.schedule(GuiUpdateScheduler.FRAME)
 
     @update_gui
     def save_annotations(self):
-        self.annotator.save_annotations()
+        self.annotator.save_in_background()
+
+    @update_gui
+    def compact_annotations(self):
+        self.annotator.compact_in_background()
+
+    def autosave_loop(self):
+        """Start autosaves that are due and keep the save status in the header up to date"""
+        self.annotator.autosave_if_due()
+        self.gui_updates.schedule(GuiUpdateScheduler.LABELS)
+        self.after(self.autosave_poll_interval, self.autosave_loop)
 
     @update_gui
     def increase_skip_frames(self):
@@ -409,12 +536,74 @@ def main():
         help='path to json file with already annotated frames, see example_json.json.'
     )
 
+    parser.add_argument(
+        '--frame_cache_mb', type=int, default=512,
+        help='memory budget in megabytes for keeping recently visited frames decoded, 0 disables the cache'
+    )
+
+    parser.add_argument(
+        '--prefetch', type=int, default=4,
+        help='number of images to load before and after the current image in background threads, 0 disables prefetching'
+    )
+
+    parser.add_argument(
+        '--io_threads', type=int, default=4,
+        help='number of threads loading images'
+    )
+
+    parser.add_argument(
+        '-r', '--recursive', action='store_true',
+        help='include the images in the subfolders of the image folder'
+    )
+
+    parser.add_argument(
+        '--journal', action='store_true',
+        help='save only the edited frames to a journal next to the output file, the full output file is written on compaction'
+    )
+
+    parser.add_argument(
+        '--autosave_interval', type=int, default=0,
+        help='save the annotations in the background every this many seconds when there are unsaved edits, 0 disables (default)'
+    )
+
+    parser.add_argument(
+        '--autosave_edits', type=int, default=0,
+        help='save the annotations in the background after this many edits, 0 disables (default)'
+    )
+
+    parser.add_argument(
+        '--binary', action='store_true',
+        help='save the annotations in the compact binary format, also used when the output file has the .annbin extension'
+    )
+
+    parser.add_argument(
+        '--database', type=str,
+        help='keep the annotations in this SQLite database, a json annotation file given with --annotation_file is imported to it'
+    )
+
+    parser.add_argument(
+        '--sparse', action='store_true',
+        help='save only the frames with annotations to the json output file'
+    )
+
     args = parser.parse_args()
 
-    vann = ImageAnnotations(args.image_folder, args.annotation_out, args.class_file, args.annotation_file)
+    vann = ImageAnnotations(args.image_folder, args.annotation_out, args.class_file, args.annotation_file,
+                            frame_cache_bytes=args.frame_cache_mb * 2**20,
+                            prefetch_count=args.prefetch,
+                            io_threads=args.io_threads,
+                            journal=args.journal,
+                            autosave_interval=args.autosave_interval,
+                            autosave_edits=args.autosave_edits,
+                            binary_annotations=args.binary,
+                            annotation_database=args.database,
+                            sparse_annotations=args.sparse,
+                            recursive=args.recursive)
 
     AnnotationWidget(vann)
 
+    vann.close()
+
 
 
 if __name__ == "__main__":
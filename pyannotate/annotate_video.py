@@ -5,8 +5,14 @@ import tkinter
 import math
 import time
 import logging
+from collections import deque
 
 from pyannotate.annotation_holder import VideoAnnotations
+from pyannotate.gui_update import GuiUpdateScheduler
+from pyannotate.interpolation import INTERPOLATIONS
+from pyannotate.object_selector import ObjectSelector
+from pyannotate.thumbnail_timeline import ThumbnailGenerator
+from pyannotate.tracker_propagation import TRACKERS
 from PIL import Image, ImageTk
 
 
@@ -45,10 +51,121 @@ class UpdateLabel(tkinter.Label):
         self.text = new_text
 
 
+class ThumbnailStrip(tkinter.Canvas):
+    """
+        A timeline of video thumbnails. The thumbnails are decoded in worker 
+        processes and shown as they arrive. Frames with annotations are marked 
+        under the thumbnails and clicking a thumbnail seeks to its frame.
+    """
+
+    mark_height = 6
+
+    # ms between checking for finished thumbnails
+    poll_interval = 100
+
+    def __init__(self, parent, video_annotations, thumbnail_count, thumbnail_width, seek_callback):
+
+        self.vann = video_annotations
+        self.seek_callback = seek_callback
+
+        frame_width, frame_height = self.vann.frame_size
+        self.thumbnail_size = (thumbnail_width, max(int(round(thumbnail_width * frame_height / frame_width)), 1))
+        self.strip_width = thumbnail_count * thumbnail_width
+
+        super().__init__(parent, width=self.strip_width, height=self.thumbnail_size[1] + self.mark_height)
+
+        self.generator = ThumbnailGenerator(self.vann.video_file,
+                                            self.vann.frame_count,
+                                            thumbnail_count,
+                                            self.thumbnail_size)
+
+        # frame index -> position of the thumbnail in the strip
+        self._slots = {frame_index: ind for ind, frame_index in enumerate(self.generator.frame_indices)}
+
+        # keep references to the images, tkinter does not
+        self._photos = dict()
+
+        # frame index -> canvas item marking annotations on that frame
+        self._marks = dict()
+
+        self._cursor = self.create_line(0, 0, 0, self.thumbnail_size[1] + self.mark_height, fill='#ff0000', width=2)
+
+        for frame_index in self.vann.annotated_frame_indices():
+            self.set_frame_marked(frame_index, True)
+
+        self.bind('<Button-1>', self.clicked)
+
+        self.generator.start()
+        self.poll_thumbnails()
+
+    def frame_x(self, frame_index):
+        return int(frame_index * self.strip_width / max(self.vann.frame_count, 1))
+
+    def poll_thumbnails(self):
+
+        for frame_index, thumbnail in self.generator.poll():
+
+            x = self._slots[frame_index] * self.thumbnail_size[0]
+
+            if thumbnail is None:
+                # a gray slot for a thumbnail that could not be decoded
+                self._photos[frame_index] = None
+                item = self.create_rectangle(x, 0, x + self.thumbnail_size[0] - 1, self.thumbnail_size[1] - 1,
+                                             fill='#404040', outline='#808080')
+                self.tag_lower(item)
+                continue
+
+            photo = ImageTk.PhotoImage(image=Image.fromarray(thumbnail))
+            self._photos[frame_index] = photo
+            image_ref = self.create_image((x, 0), anchor=tkinter.NW, image=photo)
+            self.tag_lower(image_ref)
+
+        if len(self._photos) < len(self._slots):
+            self.after(self.poll_interval, self.poll_thumbnails)
+
+    def clicked(self, event):
+        slot = min(max(event.x // self.thumbnail_size[0], 0), len(self.generator.frame_indices) - 1)
+        self.seek_callback(self.generator.frame_indices[slot])
+
+    def set_current_frame(self, frame_index):
+        x = self.frame_x(frame_index)
+        self.coords(self._cursor, x, 0, x, self.thumbnail_size[1] + self.mark_height)
+        self.tag_raise(self._cursor)
+
+    def set_frame_marked(self, frame_index, marked):
+
+        if marked and frame_index not in self._marks:
+            x = self.frame_x(frame_index)
+            top = self.thumbnail_size[1]
+            self._marks[frame_index] = self.create_rectangle(x, top, x + 1, top + self.mark_height,
+                                                             fill='#ffff00', outline='#ffff00')
+
+        elif not marked and frame_index in self._marks:
+            self.delete(self._marks.pop(frame_index))
+
+    def stop(self):
+        self.generator.stop()
+
+
 class AnnotationWidget(tkinter.Tk):
 
+    # seconds to stay on a proxy frame before the full resolution frame is shown
+    full_resolution_delay = 0.3
+
+    # limits of the playback rate multiplier
+    min_playback_rate = 0.25
+    max_playback_rate = 8.0
+
+    # ms between checks while the video is paused
+    paused_poll_interval = 50
+
+    # ms between checking if an autosave is due
+    autosave_poll_interval = 1000
 
-    def __init__(self, video_annotations):
+    # ms between adding the boxes tracked in the background
+    propagation_poll_interval = 200
+
+    def __init__(self, video_annotations, thumbnail_count=20, thumbnail_width=64):
 
         """
             Give a VideoAnnotations object as argument
@@ -64,9 +181,26 @@ class AnnotationWidget(tkinter.Tk):
         self._drawing = False        
         self._original_click_pos = (0,0)
 
+        # gui updates requested by the event handlers are done together when tkinter is idle
+        self.gui_updates = GuiUpdateScheduler(self, self.on_gui_update)
+
+        # decoded frame waiting to be shown on the next gui update
+        self._pending_frame = None
+
         # for controlling the video playing
         self._video_playing = False
-        self._last_frame_change = time.time()
+
+        # playback clock, the frames to show are counted from the monotonic time since the clock started
+        self._playback_rate = 1.0
+        self._playback_start = time.monotonic()
+        self._playback_frames_shown = 0
+        self._dropped_frames = 0
+        # times the latest frames were shown for measuring the achieved fps
+        self._frame_show_times = deque(maxlen=512)
+
+        # when navigating the proxy video, the full resolution frame is shown after pausing on a frame
+        self._last_navigation = time.time()
+        self._showing_full_resolution = False
 
         ################################## header ##################################
 
@@ -83,13 +217,26 @@ class AnnotationWidget(tkinter.Tk):
                             UpdateLabel(self.info_parent, 'Current frame', 'current_frame', self.vann),
                             UpdateLabel(self.info_parent, 'FPS', 'fps', self.vann),
                             UpdateLabel(self.info_parent, 'Frames to skip', 'frame_skip_count', self.vann),
-                            UpdateLabel(self.info_parent, 'Time between frames', 'time_between_frames', self.vann)]
+                            UpdateLabel(self.info_parent, 'Time between frames', 'time_between_frames', self.vann),
+                            UpdateLabel(self.info_parent, 'Prefetch hit rate', 'prefetch_hit_rate', self.vann),
+                            UpdateLabel(self.info_parent, 'Frame cache', 'frame_cache_stats', self.vann),
+                            UpdateLabel(self.info_parent, 'Proxy', 'proxy_status', self.vann),
+                            UpdateLabel(self.info_parent, 'Last save', 'save_status', self.vann),
+                            UpdateLabel(self.info_parent, 'Tracking', 'propagation_status', self.vann)]
 
 
         
         for ind, label in enumerate(self.info_labels):
             label.pack(side=tkinter.LEFT, padx=5)
 
+        self.coalesced_updates_var = tkinter.StringVar()
+        self.coalesced_updates_label = tkinter.Label(self.info_parent, textvariable=self.coalesced_updates_var)
+        self.coalesced_updates_label.pack(side=tkinter.LEFT, padx=5)
+
+        self.playback_fps_var = tkinter.StringVar()
+        self.playback_fps_label = tkinter.Label(self.info_parent, textvariable=self.playback_fps_var)
+        self.playback_fps_label.pack(side=tkinter.LEFT, padx=5)
+
         ################################## class and object optionmenus  ##################################
 
         self.menu_parent = tkinter.Label(self)
@@ -105,9 +252,15 @@ class AnnotationWidget(tkinter.Tk):
         self.obj_string = tkinter.IntVar()
         self.obj_string.set(self.vann.active_annotation_object_id)
         logger.debug(f"current_frame_objects: {self.vann.current_frame_object_ids}")        
-        self.ann_obj_select_widget = tkinter.OptionMenu(self.menu_parent, self.obj_string, *self.vann.current_frame_object_ids, command=self.ann_object_selection_callback)
+        self.ann_obj_select_widget = ObjectSelector(self.menu_parent, self.obj_string, self.ann_object_selection_callback, width=20)
+        self.ann_obj_select_widget.set_options(self.vann.current_frame_object_ids, key=(self.vann.current_frame, self.vann.frame_version()))
         self.ann_obj_select_widget.pack(side=tkinter.LEFT, padx=10)
-        self.ann_obj_select_widget.config(width=20)
+
+        # tracker used for propagating the active box
+        self.tracker_string = tkinter.StringVar()
+        self.tracker_string.set(self.vann.tracker)
+        self.tracker_select_widget = tkinter.OptionMenu(self.menu_parent, self.tracker_string, *TRACKERS, command=self.tracker_selection_callback)
+        self.tracker_select_widget.pack(side=tkinter.LEFT, padx=10)
 
         self.menu_parent.pack(fill=tkinter.X)
 
@@ -118,6 +271,15 @@ class AnnotationWidget(tkinter.Tk):
         self.image_area = tkinter.Canvas(self)
         self.image_area.pack(fill=tkinter.X)
 
+        # the canvas image item and the PhotoImage shown in it, reused for every frame
+        self._image_ref = None
+        self.curr_frame = None
+
+        # video timeline
+        self.thumbnail_strip = None
+        if thumbnail_count > 0:
+            self.thumbnail_strip = ThumbnailStrip(self, self.vann, thumbnail_count, thumbnail_width, self.seek_to_frame)
+            self.thumbnail_strip.pack()
 
 
 
@@ -132,11 +294,23 @@ class AnnotationWidget(tkinter.Tk):
                         tkinter.Button(self.button_parent, text="Pause", command=self.pause_video),
                         tkinter.Button(self.button_parent, text="Next frame", command=self.next_frame),
                         tkinter.Button(self.button_parent, text="Previous frame", command=self.prev_frame),                        
+                        tkinter.Button(self.button_parent, text="Slower", command=self.decrease_playback_rate),
+                        tkinter.Button(self.button_parent, text="Faster", command=self.increase_playback_rate),
                         tkinter.Button(self.button_parent, text="Increase skipped frames", command=self.increase_skip_frames),
                         tkinter.Button(self.button_parent, text="Decrease skipped frames", command=self.decrease_skip_frames),
+                        tkinter.Button(self.button_parent, text="Previous occurrence ([)", command=self.prev_object_frame),
+                        tkinter.Button(self.button_parent, text="Next occurrence (])", command=self.next_object_frame),
+                        tkinter.Button(self.button_parent, text="Track start", command=self.first_object_frame),
+                        tkinter.Button(self.button_parent, text="Track end", command=self.last_object_frame),
                         tkinter.Button(self.button_parent, text="Mark annotations", command=self.mark_annotation),
+                        tkinter.Button(self.button_parent, text="Mark keyframe (k)", command=self.mark_keyframe),
+                        tkinter.Button(self.button_parent, text="Interpolate (i)", command=self.interpolate_object),
+                        tkinter.Button(self.button_parent, text="Propagate (p)", command=self.propagate_object),
+                        tkinter.Button(self.button_parent, text="Cancel tracking", command=self.cancel_propagation),
                         tkinter.Button(self.button_parent, text="Save annotations", command=self.save_annotations)]
 
+        if self.vann.journal is not None:
+            self.buttons.append(tkinter.Button(self.button_parent, text="Compact annotations", command=self.compact_annotations))
 
 
         # order buttons 
@@ -152,14 +326,30 @@ class AnnotationWidget(tkinter.Tk):
         # ready to play the video
         self.play_video_loop()
 
+        self.autosave_loop()
+
         # Start the GUI
         self.mainloop() 
 
+        if self.thumbnail_strip is not None:
+            self.thumbnail_strip.stop()
+
 
     class update_gui:
-        """ Creating a class for wrapping gui updates in a decorator """
-        def __init__(self, func, *args, **kwargs):
+        """ 
+            Creating a class for wrapping gui updates in a decorator 
+
+            The gui is not updated right away, the updated parts are marked 
+            dirty and updated together on the next tkinter idle cycle.
+        """
+        def __init__(self, func, flags=GuiUpdateScheduler.ALL):
             self._func = func
+            self.flags = flags
+
+        @classmethod
+        def only(cls, flags):
+            """ Decorator for updating only the given parts of the gui """
+            return lambda func: cls(func, flags)
 
         def __get__(self, instance, owner):
             """
@@ -172,7 +362,7 @@ class AnnotationWidget(tkinter.Tk):
 
         def __call__(self, *args, **kwargs):      
             self._func(self.obj, *args, **kwargs)
-            self.obj.on_gui_update()        
+            self.obj.gui_updates.schedule(self.flags)
 
     def bind_events(self):
 
@@ -191,6 +381,16 @@ class AnnotationWidget(tkinter.Tk):
                 self.mark_annotation()
             elif event.char == "c":
                 self.next_annotation()
+            elif event.char == "k":
+                self.mark_keyframe()
+            elif event.char == "i":
+                self.interpolate_object()
+            elif event.char == "p":
+                self.propagate_object()
+            elif event.char == "[":
+                self.prev_object_frame()
+            elif event.char == "]":
+                self.next_object_frame()
         
         # tkinter only allows binding general key pressed, use an inner function to do the work
         self.bind('<Key>', delegate_key_presses)                
@@ -198,37 +398,77 @@ class AnnotationWidget(tkinter.Tk):
 
 
     def update_frame(self, new_frame):
+        """
+            Show the frame in the single image item of the canvas. While the 
+            frame size stays the same, the pixels of the PhotoImage are replaced 
+            in place and the canvas is not reconfigured.
+        """
+
+        height, width, clrs = new_frame.shape
 
-        # Convert the Image object into a TkPhoto object
         image = Image.fromarray(new_frame)
-        self.curr_frame = ImageTk.PhotoImage(image=image) 
-       
-        image_ref = self.image_area.create_image((0,0,), anchor=tkinter.NW, image=self.curr_frame)
-        self.image_area.tag_lower(image_ref)
 
-        height, width, clrs = new_frame.shape
-        self.image_area.config(width=width, height=height)
+        if self.curr_frame is not None and (self.curr_frame.width(), self.curr_frame.height()) == (width, height):
+            self.curr_frame.paste(image)
+        else:
+            # Convert the Image object into a TkPhoto object
+            self.curr_frame = ImageTk.PhotoImage(image=image) 
+
+            if self._image_ref is None:
+                self._image_ref = self.image_area.create_image((0,0,), anchor=tkinter.NW, image=self.curr_frame)
+                self.image_area.tag_lower(self._image_ref)
+            else:
+                self.image_area.itemconfig(self._image_ref, image=self.curr_frame)
+
+            self.image_area.config(width=width, height=height)
 
         # draw the detections 
         self.draw_detections()
 
 
-    def on_gui_update(self):
+    def on_gui_update(self, flags=GuiUpdateScheduler.ALL):
         """
-            update everything that needs updating
+            update everything that needs updating, flags tell which 
+            parts of the gui have changed
         """
-        for label in self.info_labels:
-            label.update_text()
+        if flags & GuiUpdateScheduler.LABELS:
 
-        self.class_string.set(self.vann.active_annotation_class)
-        self.obj_string.set(self.vann.active_annotation_object_id)
+            for label in self.info_labels:
+                label.update_text()
 
-        # update the possible available frame objects
-        self.update_menu_options(self.ann_obj_select_widget,
-                                 self.vann.current_frame_object_ids,
-                                 self.ann_object_selection_callback)        
+            self.coalesced_updates_var.set("Coalesced updates: {}".format(self.gui_updates.coalesced))
 
-        self.draw_detections()
+            self.playback_fps_var.set("Playback FPS: {:.1f} / {:.1f} ({}x), dropped {}".format(self.achieved_fps,
+                                                                                                self.target_fps,
+                                                                                                self._playback_rate,
+                                                                                                self._dropped_frames))
+
+            self.class_string.set(self.vann.active_annotation_class)
+            self.obj_string.set(self.vann.active_annotation_object_id)
+
+        if flags & GuiUpdateScheduler.MENUS:
+            # update the possible available frame objects, 
+            # the options are only rebuilt if the annotations of the frame have changed
+            self.ann_obj_select_widget.set_options(self.vann.current_frame_object_ids,
+                                                   key=(self.vann.current_frame, self.vann.frame_version()))
+
+        # only the latest decoded frame is shown
+        if flags & GuiUpdateScheduler.FRAME and self._pending_frame is not None:
+            self.update_frame(self._pending_frame)
+            self._pending_frame = None
+
+        if flags & GuiUpdateScheduler.OVERLAY:
+
+            if self.thumbnail_strip is not None:
+                self.thumbnail_strip.set_current_frame(self.vann.current_frame)
+                self.thumbnail_strip.set_frame_marked(self.vann.current_frame, len(self.vann.get_frame_annotations()) > 0)
+
+            self.draw_detections()
+
+        elif flags & GuiUpdateScheduler.ACTIVE_BOX:
+            active_annotation = self.vann.active_annotation_object
+            if active_annotation is not None:
+                self.draw_annotation(active_annotation)
 
     def draw_detections(self):
 
@@ -236,61 +476,113 @@ class AnnotationWidget(tkinter.Tk):
         annotations = self.vann.get_frame_annotations()
 
         for annotation in annotations:            
-            annotation.draw_annotation(self.image_area,
-                                       self.vann.get_class_color(annotation.class_name))
+            self.draw_annotation(annotation)
 
-    def update_menu_options(self, optionmenu, new_options, command):
+    def draw_annotation(self, annotation):
+        annotation.draw_annotation(self.image_area,
+                                   self.vann.get_class_color(annotation.class_name),
+                                   self.vann.display_scale)
+
+    
+
+    def show_full_resolution_when_paused(self):
         """
-            Update the shown options for the argument optionmenu.
-            Also needs a reference to the function to be called 
-            when the new options are selected.
+            While the proxy video is navigated, replace the proxy frame with the 
+            full resolution frame when the user has stayed on the frame for a while
         """
-        menu = optionmenu['menu']
+        if self._video_playing or self._showing_full_resolution or not self.vann.proxy_active:
+            return
 
-        # delete previous values
-        menu.delete(0, "end")
+        if time.time() - self._last_navigation < self.full_resolution_delay:
+            return
 
-        # add new options
-        for option in new_options:
-            menu.add_command(label=option, command=command)
+        self._showing_full_resolution = True
+        self.update_frame(self.vann.read_full_resolution_frame())
 
+    @property
+    def target_fps(self):
+        return self.vann.fps * self._playback_rate
 
+    @property
+    def achieved_fps(self):
+        """Frames shown during the last second"""
+        now = time.monotonic()
+        return sum(1 for show_time in self._frame_show_times if now - show_time <= 1.0)
 
-    
+    def restart_playback_clock(self):
+        self._playback_start = time.monotonic()
+        self._playback_frames_shown = 0
 
     def play_video_loop(self):
-        if self._video_playing:
-            self.next_frame()
-        
-        # how long should we wait based on the fps
-        target_wait_time = self.vann.time_between_frames
-        # how long has it actually been from the latest frame change
-        actual_wait = time.time() - self._last_frame_change                
+        """
+            Show the frames at the exact fps of the video times the playback rate.
+
+            The frame to show is counted from the time since the playback clock 
+            started, so the time spent decoding and drawing does not slow the 
+            playback down. If showing frames falls behind, the frames there was 
+            no time for are dropped, the reader goes over them with grab() 
+            without decoding them.
+        """
 
-        # TODO: make this better
-        # slowly correct towards more appropriate wait time
-        correction = .2
-        # store the last frame change
-        self._last_frame_change = time.time()
+        if not self._video_playing or self.target_fps <= 0:
+            self.show_full_resolution_when_paused()
+            self.after(self.paused_poll_interval, self.play_video_loop)
+            return
 
-        # schedule fps based update in ms
-        self.after(int(correction*self.vann.time_between_frames*1000), self.play_video_loop)
+        now = time.monotonic()
+
+        # number of frames that should have been shown by now
+        frames_due = int((now - self._playback_start) * self.target_fps)
+        frames_behind = frames_due - self._playback_frames_shown
+
+        if frames_behind > 0:
+
+            self._dropped_frames += frames_behind - 1
+            self._playback_frames_shown = frames_due
+            self._frame_show_times.append(now)
+
+            self.advance_playback(frames_behind * (1 + self.vann.frame_skip_count))
+
+            if self.vann.current_frame >= self.vann.frame_count - 1:
+                self.pause_video()
+
+        # schedule the next frame at the time it is due
+        next_frame_time = self._playback_start + (self._playback_frames_shown + 1) / self.target_fps
+        self.after(max(int((next_frame_time - time.monotonic()) * 1000), 1), self.play_video_loop)
+
+    @update_gui
+    def advance_playback(self, frame_count):
+        self._pending_frame = self.vann.advance_frames(frame_count)
+        self.frame_navigated()
 
     def toggle_play(self, event):
-        self._video_playing = not self._video_playing
+        if self._video_playing:
+            self.pause_video()
+        else:
+            self.play_video()
 
     def play_video(self):
+        self.restart_playback_clock()
         self._video_playing = True
 
     def pause_video(self):
         self._video_playing = False
 
+    @update_gui.only(GuiUpdateScheduler.LABELS)
+    def increase_playback_rate(self):
+        self._playback_rate = min(self._playback_rate * 2, self.max_playback_rate)
+        self.restart_playback_clock()
+
+    @update_gui.only(GuiUpdateScheduler.LABELS)
+    def decrease_playback_rate(self):
+        self._playback_rate = max(self._playback_rate / 2, self.min_playback_rate)
+        self.restart_playback_clock()
+
 
     def image_area_clicked(self, event):
 
         self._original_click_pos = (event.x, event.y)
 
-    @update_gui
     def image_area_dragged(self, event):
         """
             redraw the active bbox as dragging
@@ -308,9 +600,11 @@ class AnnotationWidget(tkinter.Tk):
             if active_annotation_object is None:
 
                 self.vann.add_annotation((*self._original_click_pos, event.x, event.y))
+                self.gui_updates.schedule(GuiUpdateScheduler.ALL)
 
             else:
                 self.vann.update_annotation(points=(*self._original_click_pos, event.x, event.y))
+                self.gui_updates.schedule(GuiUpdateScheduler.ACTIVE_BOX)
 
     @update_gui
     def image_area_released(self, event):
@@ -323,6 +617,44 @@ class AnnotationWidget(tkinter.Tk):
         self._drawing = True
         logger.debug("starting annotation marking")   
 
+    @update_gui
+    def mark_keyframe(self):
+        """Draw a keyframe for the object that was active on the previous frame"""
+        if self.vann.add_keyframe():
+            self._drawing = True
+
+    @update_gui
+    def interpolate_object(self):
+        self.vann.interpolate_object()
+
+    @update_gui
+    def propagate_object(self):
+        """Track the active box forward in the background, annotating can continue meanwhile"""
+        # a running propagation loop continues with the new tracking
+        polling = self.vann.propagating
+        if self.vann.propagate_active_object() and not polling:
+            self.after(self.propagation_poll_interval, self.propagation_loop)
+
+    @update_gui
+    def cancel_propagation(self):
+        self.vann.cancel_propagation()
+
+    def propagation_loop(self):
+        """Add the tracked boxes to the annotations until the tracking ends"""
+
+        running = self.vann.propagating
+
+        if self.vann.apply_propagated_boxes() > 0:
+            self.gui_updates.schedule(GuiUpdateScheduler.ALL)
+        else:
+            self.gui_updates.schedule(GuiUpdateScheduler.LABELS)
+
+        if running:
+            self.after(self.propagation_poll_interval, self.propagation_loop)
+
+    def tracker_selection_callback(self, tracker):
+        self.vann.tracker = tracker
+
     @update_gui
     def ann_object_selection_callback(self, object_id):
         """callback gets the new selected option as argument"""   
@@ -340,17 +672,63 @@ class AnnotationWidget(tkinter.Tk):
 
     @update_gui
     def next_frame(self):
-        frame = self.vann.get_next_frame()
-        self.update_frame(frame)
+        self._pending_frame = self.vann.get_next_frame()
+        self.frame_navigated()
 
     @update_gui
     def prev_frame(self):
-        frame = self.vann.get_prev_frame()
-        self.update_frame(frame)
+        self._pending_frame = self.vann.get_prev_frame()
+        self.frame_navigated()
+
+    @update_gui
+    def seek_to_frame(self, frame_index):
+        self._pending_frame = self.vann.go_to_frame(frame_index)
+        self.frame_navigated()
+
+    @update_gui
+    def go_to_object_frame(self, where):
+        """Go to a frame of the track of the active object and keep the object active"""
+
+        object_id = self.vann.active_annotation_object_id
+        frame_index = self.vann.object_frame(where, object_id)
+
+        if frame_index is None:
+            return
+
+        self._pending_frame = self.vann.go_to_frame(frame_index)
+        self.frame_navigated()
+
+        self.vann.active_annotation_object = object_id
+
+    def next_object_frame(self):
+        self.go_to_object_frame('next')
+
+    def prev_object_frame(self):
+        self.go_to_object_frame('previous')
+
+    def first_object_frame(self):
+        self.go_to_object_frame('first')
+
+    def last_object_frame(self):
+        self.go_to_object_frame('last')
+
+    def frame_navigated(self):
+        self._last_navigation = time.time()
+        self._showing_full_resolution = False
 
     @update_gui
     def save_annotations(self):
-        self.vann.save_annotations()
+        self.vann.save_in_background()
+
+    @update_gui
+    def compact_annotations(self):
+        self.vann.compact_in_background()
+
+    def autosave_loop(self):
+        """Start autosaves that are due and keep the save status in the header up to date"""
+        self.vann.autosave_if_due()
+        self.gui_updates.schedule(GuiUpdateScheduler.LABELS)
+        self.after(self.autosave_poll_interval, self.autosave_loop)
 
     @update_gui
     def increase_skip_frames(self):
@@ -398,11 +776,114 @@ def main():
         help='path to json file with already annotated frames, see example_json.json.'
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        '--prefetch', type=int, default=16,
+        help='number of frames to decode ahead of the current frame in a background thread, 0 disables prefetching'
+    )
+
+    parser.add_argument(
+        '--prefetch_behind', type=int, default=0,
+        help='number of frames to keep decoded behind the current frame'
+    )
 
-    vann = VideoAnnotations(args.video, args.annotation_out, args.class_file, args.annotation_file)
+    parser.add_argument(
+        '--frame_cache_mb', type=int, default=512,
+        help='memory budget in megabytes for keeping recently visited frames decoded, 0 disables the cache'
+    )
+
+    parser.add_argument(
+        '--no_keyframe_index', action='store_true',
+        help='do not index the keyframes of the video, seeks rely on the container and may be inaccurate'
+    )
+
+    parser.add_argument(
+        '--proxy_width', type=int, default=0,
+        help='transcode a proxy video of this width in the background and navigate it, 0 disables the proxy'
+    )
+
+    parser.add_argument(
+        '--thumbnails', type=int, default=20,
+        help='number of thumbnails in the video timeline, 0 hides the timeline'
+    )
+
+    parser.add_argument(
+        '--columnar', action='store_true',
+        help='keep the loaded annotations in compact numpy arrays instead of reading them from the annotation file when visited'
+    )
+
+    parser.add_argument(
+        '--journal', action='store_true',
+        help='save only the edited frames to a journal next to the output file, the full output file is written on compaction'
+    )
+
+    parser.add_argument(
+        '--autosave_interval', type=int, default=0,
+        help='save the annotations in the background every this many seconds when there are unsaved edits, 0 disables (default)'
+    )
+
+    parser.add_argument(
+        '--autosave_edits', type=int, default=0,
+        help='save the annotations in the background after this many edits, 0 disables (default)'
+    )
+
+    parser.add_argument(
+        '--binary', action='store_true',
+        help='save the annotations in the compact binary format, also used when the output file has the .annbin extension'
+    )
+
+    parser.add_argument(
+        '--database', type=str,
+        help='keep the annotations in this SQLite database, a json annotation file given with --annotation_file is imported to it'
+    )
+
+    parser.add_argument(
+        '--sparse', action='store_true',
+        help='save only the frames with annotations to the json output file'
+    )
+
+    parser.add_argument(
+        '--tracker', type=str, default='CSRT', choices=sorted(TRACKERS),
+        help='opencv tracker used for propagating the active box to the next frames'
+    )
+
+    parser.add_argument(
+        '--propagate_frames', type=int, default=100,
+        help='number of frames the active box is tracked forward when propagating'
+    )
+
+    parser.add_argument(
+        '--min_confidence', type=float, default=0.3,
+        help='propagating stops when the confidence of the tracker falls below this'
+    )
+
+    parser.add_argument(
+        '--interpolation', type=str, default='linear', choices=sorted(INTERPOLATIONS),
+        help='how the boxes between the keyframes of an object are filled in'
+    )
+
+    args = parser.parse_args()
 
-    AnnotationWidget(vann)
+    vann = VideoAnnotations(args.video, args.annotation_out, args.class_file, args.annotation_file,
+                            prefetch_window=args.prefetch,
+                            prefetch_behind=args.prefetch_behind,
+                            frame_cache_bytes=args.frame_cache_mb * 2**20,
+                            index_keyframes=not args.no_keyframe_index,
+                            proxy_width=args.proxy_width,
+                            columnar_annotations=args.columnar,
+                            journal=args.journal,
+                            autosave_interval=args.autosave_interval,
+                            autosave_edits=args.autosave_edits,
+                            binary_annotations=args.binary,
+                            annotation_database=args.database,
+                            sparse_annotations=args.sparse,
+                            interpolation=args.interpolation,
+                            tracker=args.tracker,
+                            propagate_frames=args.propagate_frames,
+                            tracker_min_confidence=args.min_confidence)
+
+    AnnotationWidget(vann, thumbnail_count=args.thumbnails)
+
+    vann.close()
 
 
 
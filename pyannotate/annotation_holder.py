@@ -1,16 +1,36 @@
 from typing import List, Dict
 import os
-import colorsys
+import time
 import cv2
 import logging 
 
-from pyannotate.annotation_loader import AnnotationLoader
-from pyannotate.annotation_object import BoxAnnotation, TextBoxAnnotation
+from pyannotate.annotation_loader import AnnotationLoader, SqliteAnnotationLoader
+from pyannotate.annotation_object import BoxAnnotation, TextBoxAnnotation, class_colors, merge_class_names
+from pyannotate.background_saver import BackgroundSaver
+from pyannotate.edit_journal import EditJournal
+from pyannotate.frame_cache import FrameCache
+from pyannotate.frame_prefetcher import FramePrefetcher
+from pyannotate.frame_store import FrameStore, SnapshotFrameStore
+from pyannotate.image_index import ImageIndex
+from pyannotate.image_prefetcher import ImagePrefetcher, load_image
+from pyannotate.interpolation import INTERPOLATIONS, interpolate_track, linear_interpolation
+from pyannotate.keyframe_index import KeyframeIndex
+from pyannotate.proxy_video import ProxyTranscoder
+from pyannotate.track_index import TrackIndex
+from pyannotate.tracker_propagation import TrackerPropagator
+from pyannotate.video_reader import VideoReader
 
 # load logger
 logger = logging.getLogger("VideoAnnotations")
 
 
+def merge_journal_snapshots(older, newer):
+    """Merge the edited frames of two journal saves waiting in the background saver"""
+    frames, base_file = older
+    frames.update(newer[0])
+    return frames, base_file
+
+
 class Annotations:
 
     _frames = []
@@ -27,11 +47,24 @@ class Annotations:
         'annotation_classes': ["class1", "class2"]
     }
 
-    def __init__(self, output_file, annotation_class_file=None, annotation_file=None, annotation_loader=None):
+    # compact the edit journal to the output file when it grows larger than this
+    journal_compact_bytes = 64 * 2**20
+
+    # fills the frames between the keyframes of an object, see interpolation.py
+    interpolation = staticmethod(linear_interpolation)
+
+    def __init__(self, output_file, annotation_class_file=None, annotation_file=None, annotation_loader=None,
+                 frame_cache_bytes=0, journal=False, autosave_interval=0, autosave_edits=0):
 
         # set up default values
         self.__dict__.update(self._defaults) 
 
+        # decoded frames of recently visited frames
+        self.frame_cache = FrameCache(frame_cache_bytes)
+
+        # size of the frames given by read_new_frame relative to the size the annotations are stored in
+        self.display_scale = 1.0
+
         self.output_file = output_file if output_file is not None else self.output_file
 
         # load class names from file or use defaults if no file given
@@ -42,9 +75,53 @@ class Annotations:
         # init an annotation loader 
         self.annotation_loader = AnnotationLoader() if annotation_loader is None else annotation_loader
 
+        # frames edited since the last save
+        self._edited_frames = set()
+
+        # the frame whose annotations were shown last
+        self._shown_index = 0
+
+        # objects whose derived boxes are recomputed before the next frame is shown or saved
+        self._dirty_tracks = set()
+
+        # the object active on the last frame left, add_keyframe adds boxes for it
+        self.keyframe_object_id = -1
+
+        # save in the background every autosave_interval seconds or after autosave_edits edits, 0 disables
+        self.autosave_interval = autosave_interval
+        self.autosave_edits = autosave_edits
+        self.saver = None
+        self._edit_count = 0
+        self._last_save_request = time.monotonic()
+
+        # in journal mode saving appends the edited frames next to the output file
+        self.journal = EditJournal(self.output_file) if journal else None
+        journal_header = self.journal.read_header() if self.journal is not None else None
+        if journal_header is not None:
+            # the journal is replayed over the annotation file it was started from
+            if journal_header['base'] != (os.path.abspath(annotation_file) if annotation_file is not None else None):
+                print(f"Continuing the edit journal {self.journal.path} started from annotation file {journal_header['base']}")
+            annotation_file = journal_header['base']
+
+        # the annotation file the current annotations are based on
+        self._base_file = annotation_file
+
         # add the annotation file class names to the pool of possible classes
         self.frame_annotations = self.load_saved_annotations(annotation_file)
 
+        if journal_header is not None:
+            self.replay_journal(journal_header)
+
+        # object id -> frames the object appears in
+        self.track_index = self.build_track_index()
+
+        # the next new object id, ids are not reused
+        self._next_object_id = max(self.annotation_object_ids, default=-1) + 1
+
+        # frame index -> number of times the annotations of the frame have been added or removed,
+        # lets the gui rebuild the object lists only when they have changed
+        self._frame_versions = dict()
+
         # dictionary of class name -> color
         self.class_colors = self.get_class_colors()
 
@@ -57,15 +134,68 @@ class Annotations:
         # index of the object we are currently annotating
         self._active_annotation_object_index = -1
 
-    def get_next_frame(self):
+    def close(self):
+        """
+            Finish the background saves, with autosave the unsaved edits are saved first.
+            Release the annotation file read by a lazily loaded frame store
+        """
+        if self._edited_frames and (self.autosave_interval > 0 or self.autosave_edits > 0):
+            self.save_in_background()
+
+        if self.saver is not None:
+            self.saver.stop()
+            self.saver = None
+
+        if isinstance(self.frame_annotations, FrameStore):
+            self.frame_annotations.close()
+
+    def get_next_frame(self, block=True):
 
         self._cur_index = min(self._cur_index + 1, self.frame_count-1)
 
-        return self.read_new_frame()
+        return self.read_new_frame(block)
 
-    def read_new_frame(self):
+    def read_new_frame(self, block=True):
         """
-            reads an image in at _cur_index 
+            reads an image in at _cur_index, from the frame cache if it has been read recently
+
+            If block is False and the image is not available without waiting, 
+            None is returned and the image can be polled with read_frame_if_ready.
+
+            @return: rgb image as numpy array
+        """
+        self.init_new_frame()
+
+        if not block:
+            return self.read_frame_if_ready()
+
+        return self.read_frame()
+
+    def read_frame(self):
+
+        frame = self.frame_cache.get(self._cur_index)
+
+        if frame is None:
+            frame = self.decode_frame(self._cur_index)
+            self.frame_cache.put(self._cur_index, frame)
+
+        return frame
+
+    def read_frame_if_ready(self):
+        """Return the image at _cur_index if it can be read without waiting, otherwise None"""
+
+        if self._cur_index not in self.frame_cache and not self.frame_available(self._cur_index):
+            return None
+
+        return self.read_frame()
+
+    def frame_available(self, frame_index):
+        """Whether decode_frame can return the frame without waiting"""
+        return True
+
+    def decode_frame(self, frame_index):
+        """
+            reads the image at frame_index from the source
 
             @return: rgb image as numpy array
         """
@@ -75,6 +205,18 @@ class Annotations:
         """
             A method to be called after changing frames
         """
+        # the frames left without annotations are not kept in memory
+        if self._shown_index != self._cur_index:
+            shown_annotations = self.frame_annotations[self._shown_index]
+            if 0 <= self._active_annotation_object_index < len(shown_annotations):
+                self.keyframe_object_id = shown_annotations[self._active_annotation_object_index].obj_id
+            self.track_index.forget_positions(self._shown_index)
+            if isinstance(self.frame_annotations, FrameStore):
+                self.frame_annotations.discard_if_empty(self._shown_index)
+        self._shown_index = self._cur_index
+
+        self.update_derived_boxes()
+
         # update the annotation objects for this frame
         if len(self.frame_annotations[self._cur_index]) > 0:
             self._active_annotation_object_index = 0        
@@ -82,21 +224,211 @@ class Annotations:
             self._active_annotation_object_index = -1
 
 
-    def get_prev_frame(self):
+    def get_prev_frame(self, block=True):
 
         self._cur_index = max(self._cur_index -1, 0)
 
-        return self.read_new_frame()
+        return self.read_new_frame(block)
+
+    def go_to_frame(self, frame_index, block=True):
+
+        self._cur_index = min(max(frame_index, 0), self.frame_count-1)
+
+        return self.read_new_frame(block)
 
     def save_annotations(self, file_name=None):
 
+        self.update_derived_boxes()
+
+        if self.journal is not None and file_name is None:
+            self.append_to_journal()
+            return
+
         out_file = file_name if file_name is not None else self.output_file
 
         print(f"saving annotations to: ", out_file)        
 
         self.annotation_loader.save_annotation_file(out_file, self.frame_annotations)
 
-    def load_class_names(self, default_values, annotation_class_file: str) -> List[str]:
+        self._edited_frames.clear()
+
+    def append_to_journal(self):
+        """Save the frames edited since the last save to the edit journal"""
+
+        journal_snapshot = self.take_journal_snapshot()
+
+        try:
+            self.write_journal(journal_snapshot)
+        except Exception:
+            self.restore_edited_frames(journal_snapshot[0])
+            raise
+
+        if self.journal.size() > self.journal_compact_bytes:
+            self.compact_annotations()
+
+    def compact_annotations(self):
+        """Write the full annotation file and remove the edit journal"""
+
+        self.update_derived_boxes()
+
+        self.write_compacted(self.frame_annotations)
+
+        self._edited_frames.clear()
+        self._base_file = self.output_file
+
+    def save_in_background(self):
+        """
+            Take a snapshot of the annotations and save it in the background saver thread.
+            Saves requested while a save is running are coalesced.
+        """
+
+        if self.saver is None:
+            self.saver = BackgroundSaver()
+            self.saver.start()
+
+        if self.journal is not None:
+            journal_snapshot = self.take_journal_snapshot()
+            self.saver.request(self.write_journal, journal_snapshot, merge=merge_journal_snapshots,
+                               failed=lambda error: self.restore_edited_frames(journal_snapshot[0]))
+
+            if self.journal.size() > self.journal_compact_bytes:
+                self.compact_in_background()
+        else:
+            snapshot = self.snapshot_annotations()
+            edited_frames = set(self._edited_frames)
+            self._edited_frames.clear()
+            self.saver.request(self.write_annotation_file, snapshot,
+                               failed=lambda error: self.restore_edited_frames(edited_frames))
+
+        self._edit_count = 0
+        self._last_save_request = time.monotonic()
+
+    def compact_in_background(self):
+        """Compact the edit journal in the background saver thread"""
+
+        if self.saver is None:
+            self.saver = BackgroundSaver()
+            self.saver.start()
+
+        snapshot = self.snapshot_annotations()
+        edited_frames = set(self._edited_frames)
+        base_file = self._base_file
+
+        self._edited_frames.clear()
+        self._base_file = self.output_file
+
+        def compaction_failed(error):
+            # the journal is kept, it is still based on the previous file
+            self._base_file = base_file
+            self.restore_edited_frames(edited_frames)
+
+        self.saver.request(self.write_compacted, snapshot, failed=compaction_failed)
+
+    def autosave_if_due(self):
+        """
+            Save in the background if there are unsaved edits and autosave_interval
+            seconds have passed or autosave_edits edits have been made since the last save
+        """
+
+        if not self._edited_frames:
+            return False
+
+        due = (self.autosave_edits > 0 and self._edit_count >= self.autosave_edits) or \
+              (self.autosave_interval > 0 and time.monotonic() - self._last_save_request >= self.autosave_interval)
+
+        if due:
+            self.save_in_background()
+
+        return due
+
+    def restore_edited_frames(self, frame_indices):
+        """
+            Mark the frames of a failed save edited again, so that the next save
+            writes them. Called in the saver thread for background saves.
+        """
+        logger.error(f"Saving {len(frame_indices)} edited frames failed, they are saved with the next save")
+        self._edited_frames.update(frame_indices)
+
+    def snapshot_annotations(self):
+        """Copy of the annotations that can be saved in the background"""
+
+        self.update_derived_boxes()
+
+        if isinstance(self.frame_annotations, FrameStore):
+            return self.frame_annotations.snapshot()
+
+        frames = {frame_ind: [detection.detection_to_json() for detection in annotations]
+                  for frame_ind, annotations in enumerate(self.frame_annotations) if len(annotations) > 0}
+
+        return SnapshotFrameStore(len(self.frame_annotations), frames)
+
+    def take_journal_snapshot(self):
+        """The frames edited since the last save and the base file of the journal"""
+
+        self.update_derived_boxes()
+
+        frames = {frame_ind: [detection.detection_to_json() for detection in self.frame_annotations[frame_ind]]
+                  for frame_ind in sorted(self._edited_frames)}
+
+        self._edited_frames.clear()
+
+        return frames, self._base_file
+
+    def write_annotation_file(self, annotations):
+
+        print(f"saving annotations to: ", self.output_file)
+
+        self.annotation_loader.save_annotation_file(self.output_file, annotations)
+
+    def write_journal(self, journal_snapshot):
+
+        frames, base_file = journal_snapshot
+
+        print(f"saving {len(frames)} edited frames to: ", self.journal.path)
+
+        self.journal.append(frames, base_file, self.frame_count)
+
+    def write_compacted(self, annotations):
+
+        print(f"compacting annotations to: ", self.output_file)
+
+        self.annotation_loader.save_annotation_file(self.output_file, annotations)
+
+        if self.journal is not None:
+            self.journal.remove()
+
+    def replay_journal(self, journal_header):
+        """Apply the edits in the journal over the loaded annotations"""
+
+        frames = self.journal.read_records()
+
+        if not journal_header['frame_count'] == self.frame_count:
+            frames = self.fit_journal_frame_count(frames, journal_header['frame_count'])
+
+        class_names = set()
+
+        for frame_ind, objects in frames.items():
+
+            annotations = [self.annotation_loader.create_detection_object(detection) for detection in objects]
+            self.frame_annotations[frame_ind] = annotations
+
+            for annotation in annotations:
+                class_names.add(annotation.class_name)
+                self.annotation_object_ids.add(annotation.obj_id)
+
+        self.annotation_classes = merge_class_names(self.annotation_classes, class_names)
+
+        print(f"replayed {len(frames)} edited frames from the edit journal {self.journal.path}")
+
+    def fit_journal_frame_count(self, frames, journal_frame_count):
+        """
+            Called when the edit journal was started for a different number of frames,
+            returns the journal records to replay
+        """
+        raise RuntimeError("Wrong frame count in the edit journal.")
+
+    @staticmethod
+    def load_class_names(default_values, annotation_class_file: str) -> List[str]:
         """ 
             Load class names from file if given. Class names on separate lines
         """
@@ -127,36 +459,52 @@ class Annotations:
             of the annotation file are valid for this video.
         """
 
-        frame_annotations = []
-
         if annotation_file is None:
 
-            for ind in range(self.frame_count):
-                # add an empty list of detections for each frame
-                frame_annotations.append([])               
+            # an empty list of detections for each frame, or the annotations of a database that is continued
+            frame_annotations, new_class_names, new_ids = self.annotation_loader.create_annotations(self.frame_count)
+
+            self.annotation_classes = merge_class_names(self.annotation_classes, new_class_names)
+            self.annotation_object_ids = self.annotation_object_ids.union(new_ids)
+
+            if not len(frame_annotations) == self.frame_count:
+                frame_annotations = self.fit_frame_count(frame_annotations, "annotation database")
 
         else:
 
             frame_annotations, new_class_names, new_ids = self.annotation_loader.load_annotation_file(annotation_file)
 
             # combine the new and old classes
-            self.annotation_classes = list(set(self.annotation_classes).union(new_class_names))
+            self.annotation_classes = merge_class_names(self.annotation_classes, new_class_names)
 
             # combine the new and old obj ids
             self.annotation_object_ids = self.annotation_object_ids.union(new_ids)
 
             if not len(frame_annotations) == self.frame_count:
-                raise RuntimeError("Wrong amount of annotations in the annotation file.")
+                frame_annotations = self.fit_frame_count(frame_annotations, "annotation file")
 
-            total_objects = sum([len(detects) for detects in frame_annotations]) 
+            total_objects = frame_annotations.total_detection_count()
 
             print(f"loaded {len(frame_annotations)} annotations")
             print(f"And {total_objects} objects")
 
         return frame_annotations
 
-    def add_annotation(self, points=None):
-        """Add new annotation for current frame"""    
+    def fit_frame_count(self, frame_annotations, source):
+        """
+            Called when the loaded annotations have a different number of frames
+            than there are to annotate, returns the annotations to use
+        """
+        raise RuntimeError(f"Wrong amount of annotations in the {source}.")
+
+    def to_annotation_coords(self, points):
+        """Scale coordinates on the displayed frame to the coordinates the annotations are stored in"""
+        if self.display_scale == 1.0:
+            return points
+        return tuple(int(round(point / self.display_scale)) for point in points)
+
+    def add_annotation(self, points=None, object_id=None):
+        """Add new annotation for current frame, for a new object unless object_id is given"""    
 
         if len(self.active_annotation_class) == 0:
             self.next_annotation_class()
@@ -164,13 +512,13 @@ class Annotations:
         class_name = self.active_annotation_class
 
         # if the there is no current annotation object create new
-        new_obj_id = self.create_annotation_object()
+        new_obj_id = self.create_annotation_object() if object_id is None else object_id
 
         print(f"new obj_id is {new_obj_id}")
 
         new_points = (0,0,0,0)
         if points is not None:
-            new_points = points
+            new_points = self.to_annotation_coords(points)
 
         """
             The annotation class is either:
@@ -186,6 +534,7 @@ class Annotations:
                                                             color=self.class_colors[class_name])
 
         self.frame_annotations[self._cur_index].append(annotation)  
+        self.frame_annotations_changed(self._cur_index)
 
         self.active_annotation_object = new_obj_id   
 
@@ -195,24 +544,61 @@ class Annotations:
 
         if self.active_annotation_object:            
             # the detection object currently active            
-            self.active_annotation_object.update_annotation(coords=points)
+            self.active_annotation_object.update_annotation(coords=self.to_annotation_coords(points))
+            self.frame_edited(self._cur_index, count_edit=False)
+
+            # a derived box moved by hand becomes a keyframe
+            self.active_annotation_object.derived = False
+            self.keyframe_changed(self._cur_index, self.active_annotation_object.obj_id)
         else:
             print(f"trying to annotate nonexisting object")
 
     def create_annotation_object(self):
         """Adds a new object id """
-        obj_ids = self.annotation_object_ids
 
-        new_id = 0
-        # handle empty object ids
-        if len(obj_ids) > 0:
-            largest_obj_id = max(obj_ids) 
-            new_id = largest_obj_id + 1
+        new_id = self._next_object_id
+        self._next_object_id += 1
 
         self.annotation_object_ids.add(new_id)
 
         return new_id
 
+    def build_track_index(self):
+        """Index the frames of the objects in the stored frames and in the frames already in memory"""
+
+        if isinstance(self.frame_annotations, FrameStore):
+            track_index = TrackIndex(self.frame_annotations.stored_object_frames())
+            accessed_frames = self.frame_annotations.accessed_frame_indices()
+        else:
+            track_index = TrackIndex(dict())
+            accessed_frames = range(len(self.frame_annotations))
+
+        for frame_ind in accessed_frames:
+            track_index.update_frame(frame_ind, [annotation.obj_id for annotation in self.frame_annotations[frame_ind]])
+
+        return track_index
+
+    def object_frame(self, where, object_id=None):
+        """
+            Index of the 'next' or 'previous' frame the object appears in, or of the
+            'first' or 'last' frame of its track. The active object by default.
+            Returns None if there is no such frame.
+        """
+
+        if object_id is None:
+            object_id = self.active_annotation_object_id
+
+        if where == 'next':
+            return self.track_index.next_frame(object_id, self._cur_index)
+        elif where == 'previous':
+            return self.track_index.previous_frame(object_id, self._cur_index)
+        elif where == 'first':
+            return self.track_index.first_frame(object_id)
+        elif where == 'last':
+            return self.track_index.last_frame(object_id)
+
+        raise ValueError(f"Unknown object frame {where}")
+
 
     def get_class_color(self, class_name):
         if class_name in self.class_colors:
@@ -224,20 +610,7 @@ class Annotations:
         """
             create distinct colors in hsv space
         """
-        colors = dict()
-
-        nclasses = len(self.annotation_classes)
-
-        for ind, class_name in enumerate(self.annotation_classes):
-            hsv_color = (1.0*ind / nclasses,  .5, .5 )
-            rgb_color = tuple([int(255*clr) for clr in colorsys.hsv_to_rgb(*hsv_color)])
-            colors[class_name] = '#%02x%02x%02x' % rgb_color
-
-        #from pprint import pprint
-        #print("class colors: ")
-        #pprint(colors)
-
-        return colors
+        return class_colors(self.annotation_classes)
 
     def get_class_id(self, class_name):
         if class_name in self.class_ids:
@@ -284,11 +657,188 @@ class Annotations:
             return
 
         self.frame_annotations[self._cur_index].pop(self._active_annotation_object_index)
+        self.frame_annotations_changed(self._cur_index)
+
+        if not active_object.derived:
+            self.keyframe_changed(self._cur_index, active_object.obj_id)
 
         # after taking the active out of the list, the active annotation object index should be updated
         self.next_annotation_object_in_current_frame()
  
 
+    def object_box(self, frame_ind, object_id):
+        """The annotation of the object in the frame or None"""
+        for annotation in self.frame_annotations[frame_ind]:
+            if annotation.obj_id == object_id:
+                return annotation
+        return None
+
+    def add_keyframe(self, points=None):
+        """
+            Add a box on the current frame for the object that was active on the frame
+            shown before, or make its derived box on this frame a keyframe. The box
+            becomes the active object. Returns False if there is no such object.
+        """
+
+        object_id = self.keyframe_object_id
+
+        if object_id < 0:
+            return False
+
+        box = self.object_box(self._cur_index, object_id)
+
+        if box is None:
+            self.add_annotation(points, object_id=object_id)
+        else:
+            box.derived = False
+            self.frame_edited(self._cur_index)
+            self.active_annotation_object = object_id
+
+        self.keyframe_changed(self._cur_index, object_id)
+
+        return True
+
+    def interpolate_object(self, object_id=None):
+        """
+            Fill the frames between the keyframes of the object, the active object by default,
+            with derived boxes. Returns the number of frames changed.
+        """
+
+        if object_id is None:
+            object_id = self.active_annotation_object_id
+
+        if object_id < 0:
+            return 0
+
+        self._dirty_tracks.discard(object_id)
+
+        return self.update_track(object_id, fill=True)
+
+    def keyframe_changed(self, frame_ind, object_id):
+        """
+            Call after a keyframe of the object has been moved, added or removed. If the
+            frames next to it in the track have derived boxes, they are recomputed before
+            the next frame is shown or saved.
+        """
+
+        if object_id in self._dirty_tracks:
+            return
+
+        for neighbour in (self.track_index.previous_frame(object_id, frame_ind),
+                          self.track_index.next_frame(object_id, frame_ind)):
+
+            if neighbour is None:
+                continue
+
+            box = self.object_box(neighbour, object_id)
+            if box is not None and box.derived:
+                self._dirty_tracks.add(object_id)
+                return
+
+    def update_derived_boxes(self):
+        """Recompute the derived boxes of the objects whose keyframes have changed"""
+
+        while self._dirty_tracks:
+            self.update_track(self._dirty_tracks.pop())
+
+    def update_track(self, object_id, fill=False):
+        """
+            Recompute the derived boxes of the object from its keyframes in one pass.
+            With fill all the frames between the first and the last keyframe get a box,
+            otherwise the existing derived boxes are moved. Derived boxes outside the
+            keyframes are removed. Returns the number of frames changed.
+        """
+
+        # frame index -> annotation of the object
+        boxes = dict()
+        for frame_ind in self.track_index.object_frames(object_id):
+            box = self.object_box(frame_ind, object_id)
+            if box is not None:
+                boxes[frame_ind] = box
+
+        key_frames = [frame_ind for frame_ind, box in boxes.items() if not box.derived]
+
+        if len(key_frames) >= 2:
+            if fill:
+                frames = [frame_ind for frame_ind in range(key_frames[0] + 1, key_frames[-1])
+                          if frame_ind not in boxes or boxes[frame_ind].derived]
+            else:
+                frames = [frame_ind for frame_ind, box in boxes.items()
+                          if box.derived and key_frames[0] < frame_ind < key_frames[-1]]
+        else:
+            frames = []
+
+        coords = interpolate_track(key_frames, [boxes[frame_ind].coords for frame_ind in key_frames],
+                                   frames, self.interpolation)
+
+        changed = 0
+        key_ind = 0
+
+        for frame_ind, box_coords in zip(frames, coords):
+
+            # the class of the box is the class on the previous keyframe
+            while key_frames[key_ind + 1] < frame_ind:
+                key_ind += 1
+            keyframe_box = boxes[key_frames[key_ind]]
+
+            box = boxes.pop(frame_ind, None)
+
+            if box is None:
+                box = self.annotation_loader.annotation_class(box_coords,
+                                                              keyframe_box.class_name,
+                                                              keyframe_box.class_id,
+                                                              object_id,
+                                                              color=self.get_class_color(keyframe_box.class_name))
+                box.derived = True
+                self.frame_annotations[frame_ind].append(box)
+                self.frame_annotations_changed(frame_ind)
+                changed += 1
+
+            elif tuple(box.coords) != box_coords or box.class_name != keyframe_box.class_name:
+                box.update_annotation(coords=box_coords, class_name=keyframe_box.class_name,
+                                      class_id=keyframe_box.class_id, color=keyframe_box.color)
+                self.frame_edited(frame_ind, count_edit=False)
+                changed += 1
+
+        # derived boxes no longer between two keyframes
+        for frame_ind, box in boxes.items():
+            if box.derived:
+                self.frame_annotations[frame_ind].remove(box)
+                self.frame_annotations_changed(frame_ind)
+                changed += 1
+
+        if changed > 0:
+            print(f"updated {changed} derived boxes of object {object_id}")
+
+        return changed
+
+    def frame_annotations_changed(self, frame_ind):
+        """Call after adding or removing annotations of the frame"""
+        self._frame_versions[frame_ind] = self._frame_versions.get(frame_ind, 0) + 1
+        self.track_index.update_frame(frame_ind, [annotation.obj_id for annotation in self.frame_annotations[frame_ind]])
+        self.frame_edited(frame_ind)
+
+    def frame_edited(self, frame_ind, count_edit=True):
+        """
+            Call after any change to the annotations of the frame, the frame is saved on the next save.
+            Moving a box calls this for every mouse motion and does not count as an edit for autosave.
+        """
+        self._edited_frames.add(frame_ind)
+        if count_edit:
+            self._edit_count += 1
+
+    def frame_version(self, frame_ind=None):
+        """Changes every time an annotation is added to or removed from the frame"""
+        if frame_ind is None:
+            frame_ind = self._cur_index
+        return self._frame_versions.get(frame_ind, 0)
+
+    def annotated_frame_indices(self):
+        """Return the indices of the frames that have annotations"""
+        if isinstance(self.frame_annotations, FrameStore):
+            return self.frame_annotations.annotated_frame_indices()
+        return [ind for ind, annotations in enumerate(self.frame_annotations) if len(annotations) > 0]
+
     def get_frame_annotations(self, frame_ind=None):
         """Return the detection objects for current frame"""        
 
@@ -305,6 +855,27 @@ class Annotations:
     def current_frame(self):
         return self._cur_index
 
+    @property
+    def frame_cache_stats(self):
+        return repr(self.frame_cache)
+
+    @property
+    def save_status(self):
+        """Time and duration of the last background save"""
+        if self.saver is None:
+            return "not saved"
+
+        status = "saving, " if self.saver.busy else ""
+
+        if self.saver.last_save_time is None:
+            return status + "not saved"
+
+        if self.saver.last_error is not None:
+            status += f"failed: {self.saver.last_error}, last try "
+
+        return status + "{} ({:.1f} s)".format(time.strftime('%H:%M:%S', time.localtime(self.saver.last_save_time)),
+                                               self.saver.last_save_duration)
+
     @property
     def active_annotation_class(self):
         if self._active_annotation_class_index < 0:
@@ -330,6 +901,8 @@ class Annotations:
             # change the annotation class of the object
             active_object = self.active_annotation_object
             if active_object is not None:
+                if active_object.class_name != self.active_annotation_class:
+                    self.frame_edited(self._cur_index)
                 active_object.update_annotation(class_name=self.active_annotation_class,
                                                 class_id=self._active_annotation_class_index,
                                                 color=self.class_colors[self.active_annotation_class])
@@ -360,14 +933,11 @@ class Annotations:
             Find the index of the annotation with the object 
             id from the current frames annotations 
         """
-        found = False        
-        for ind, annotation in enumerate(self.frame_annotations[self._cur_index]):
-            if annotation.obj_id == object_id:
-                self._active_annotation_object_index = ind                
-                found = True
-        self._active_annotation_object_index = -1 if not found else self._active_annotation_object_index
+        self._active_annotation_object_index = self.track_index.position(self._cur_index, object_id,
+                                                                         self.frame_annotations[self._cur_index])
 
-        self.active_annotation_class = self.active_annotation_object.class_name
+        if self._active_annotation_object_index >= 0:
+            self.active_annotation_class = self.active_annotation_object.class_name
         
     
     @property
@@ -380,21 +950,83 @@ class Annotations:
             return [-1]
 
 class VideoAnnotations(Annotations):
-    
 
-    def __init__(self, annotation_vid, output_file, annotation_class_file=None, annotation_file=None):
+    # frames prefetched ahead while playback catches up, at the step of the frames shown
+    catch_up_prefetch = 1
+
+    def __init__(self, annotation_vid, output_file, annotation_class_file=None, annotation_file=None,
+                 prefetch_window=0, prefetch_behind=0, frame_cache_bytes=0, index_keyframes=False,
+                 proxy_width=0, columnar_annotations=False, journal=False, autosave_interval=0, autosave_edits=0,
+                 binary_annotations=False, annotation_database=None, sparse_annotations=False,
+                 interpolation='linear', tracker='CSRT', propagate_frames=100, tracker_min_confidence=0.3):
+
+        self.video_file = annotation_vid
+
+        # the name of the interpolation in INTERPOLATIONS or an interpolation function
+        self.interpolation = interpolation if callable(interpolation) else INTERPOLATIONS[interpolation]
+
+        # propagate_active_object tracks the active box this many frames forward with the tracker
+        self.tracker = tracker
+        self.propagate_frames = propagate_frames
+        self.tracker_min_confidence = tracker_min_confidence
+        self.propagator = None
+        # (object id, class name, class id) of the tracked box
+        self._propagated_object = None
+
+        # the keyframe index gives the true frame count and exact seeks, it is built once per video
+        self._keyframe_index = KeyframeIndex.load_or_build(annotation_vid) if index_keyframes else None
 
         # open video capture, the size of the video is used to deduce the frame count. This needs 
         # to happen before initializing the parent class
-        self.cap = self.open_video(annotation_vid)
+        self.reader = VideoReader(self.open_video(annotation_vid), self._keyframe_index)
+
+        # the properties of the video are read once, after this the prefetcher thread owns the capture
+        self._frame_count = self.reader.frame_count
+        self._fps = self.reader.fps
+        self._frame_size = (self.reader.frame_width, self.reader.frame_height)
+
+        # decode frames ahead of the current frame in a worker thread
+        self._prefetch_window = prefetch_window
+        self._prefetch_behind = prefetch_behind
+        self.prefetcher = None
+        self.start_prefetching()
+
+        # navigate a downscaled proxy of the video once it has been transcoded
+        self.proxy_transcoder = None
+        self._proxy_active = False
+        self._proxy_scale = 1.0
+        # full resolution reader for the frame the user pauses on while the proxy is used
+        self._still_reader = None
+        if 0 < proxy_width < self.reader.frame_width:
+            self.proxy_transcoder = ProxyTranscoder(annotation_vid, proxy_width)
+            self.proxy_transcoder.start()
+
+        # keep the annotations in a database, which is also saved to by default
+        if annotation_database is not None:
+            annotation_loader = SqliteAnnotationLoader(annotation_database)
+            output_file = annotation_database if output_file is None else output_file
+        else:
+            annotation_loader = AnnotationLoader(columnar=columnar_annotations, binary=binary_annotations,
+                                                 sparse=sparse_annotations)
 
         # call the parent constructor
-        super().__init__(output_file, annotation_class_file, annotation_file)
+        super().__init__(output_file, annotation_class_file, annotation_file,
+                         annotation_loader=annotation_loader,
+                         frame_cache_bytes=frame_cache_bytes,
+                         journal=journal,
+                         autosave_interval=autosave_interval,
+                         autosave_edits=autosave_edits)
 
 
         # number of frames to skip in the next/previous frame call
         self._frame_skip_count = 0
 
+        # 1 when going forward in the video, -1 when going backward
+        self._direction = 1
+
+        # frames advanced at a time while advance_frames skips frames to catch up with playback
+        self._catch_up_step = None
+
     def open_video(self, video_file):
 
         cap = cv2.VideoCapture(video_file)
@@ -404,30 +1036,274 @@ class VideoAnnotations(Annotations):
 
         return cap
 
-    def get_next_frame(self):
+    def fit_frame_count(self, frame_annotations, source):
+        """
+            Annotations saved with the frame count estimated from the container
+            are fitted to the frame count of the video, which is exact with the
+            keyframe index. Missing frames are added empty and the frames past
+            the end of the video are left out, also from the next save.
+        """
+
+        left_out = [frame_ind for frame_ind in frame_annotations.annotated_frame_indices()
+                    if frame_ind >= self.frame_count]
+
+        logger.warning(f"The {source} has {len(frame_annotations)} frames and the video {self.frame_count}, "
+                       f"using {self.frame_count} frames")
+
+        if left_out:
+            logger.warning(f"Leaving out the annotations of {len(left_out)} frames past the end of the video, "
+                           f"frames {left_out[0]}-{left_out[-1]}")
+
+        frame_annotations.resize(self.frame_count)
+
+        return frame_annotations
+
+    def fit_journal_frame_count(self, frames, journal_frame_count):
+        """Replay the frames of the journal that are in the video, see fit_frame_count"""
+
+        left_out = sorted(frame_ind for frame_ind in frames if frame_ind >= self.frame_count)
+
+        logger.warning(f"The edit journal {self.journal.path} has {journal_frame_count} frames and the video "
+                       f"{self.frame_count}, using {self.frame_count} frames")
+
+        if left_out:
+            logger.warning(f"Leaving out the edits of {len(left_out)} frames past the end of the video, "
+                           f"frames {left_out[0]}-{left_out[-1]}")
+
+        return {frame_ind: objects for frame_ind, objects in frames.items() if frame_ind < self.frame_count}
+
+    def start_prefetching(self):
+        if self._prefetch_window > 0 or self._prefetch_behind > 0:
+            self.prefetcher = FramePrefetcher(self.reader, self._prefetch_window, self._prefetch_behind)
+            self.prefetcher.start()
+
+    def close(self):
+        """Stop the background work and release the video"""
+        if self.proxy_transcoder is not None:
+            self.proxy_transcoder.stop()
+
+        if self.propagator is not None:
+            self.propagator.stop()
+
+        if self._still_reader is not None:
+            self._still_reader.release()
+
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
+        else:
+            self.reader.release()
+
+        super().close()
+
+    def use_proxy_if_ready(self):
+        """
+            Switch the navigation to the proxy video when it has been transcoded
+        """
+        if self._proxy_active or self.proxy_transcoder is None or not self.proxy_transcoder.finished.is_set():
+            return
+
+        if self.prefetcher is not None:
+            # the prefetcher releases the full resolution capture it owns
+            self.prefetcher.stop()
+            self.prefetcher = None
+            self._still_reader = VideoReader(self.open_video(self.video_file), self._keyframe_index)
+        else:
+            self._still_reader = self.reader
+
+        self.reader = VideoReader(self.open_video(self.proxy_transcoder.proxy_file))
+        self.start_prefetching()
+
+        # the cached frames are full resolution frames
+        self.frame_cache.clear()
+
+        self._proxy_scale = self.proxy_transcoder.scale
+        self._proxy_active = True
+
+        logger.info(f"Navigating the proxy video {self.proxy_transcoder.proxy_file}")
+
+    def get_next_frame(self, block=True):
+
+        self._direction = 1
 
         self._cur_index = min(self._cur_index + 1 + self.frame_skip_count, self.frame_count-1)
 
-        return self.read_new_frame()
+        return self.read_new_frame(block)
 
-    def read_new_frame(self):
+    def read_new_frame(self, block=True):
 
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, self._cur_index)
+        self.use_proxy_if_ready()
 
-        _, frame = self.cap.read()        
+        self.display_scale = self._proxy_scale
 
-        #Rearrange the color channel
-        frame = frame[:,:,::-1]
+        # keep the prefetch window following the current frame also when the frame is cached
+        if self.prefetcher is not None:
+            self.prefetcher.move_to(self._cur_index,
+                                    step=self.prefetch_step,
+                                    direction=self._direction,
+                                    ahead=self.prefetch_ahead)
 
-        self.init_new_frame()
-        
-        return frame
+        return super().read_new_frame(block)
+
+    @property
+    def prefetch_step(self):
+        """Frames between the frames in the prefetch window"""
+        return self._catch_up_step if self._catch_up_step is not None else 1 + self.frame_skip_count
+
+    @property
+    def prefetch_ahead(self):
+        """Frames prefetched ahead, None for the whole prefetch window"""
+        return self.catch_up_prefetch if self._catch_up_step is not None else None
+
+    def read_full_resolution_frame(self):
+        """
+            Decode the current frame from the original video. While the proxy is 
+            used, the frames given by read_new_frame are downscaled.
+        """
+        if not self._proxy_active:
+            return self.read_new_frame()
+
+        self.display_scale = 1.0
+
+        return self._still_reader.read(self._cur_index)
+
+    def decode_frame(self, frame_index):
+
+        if self.prefetcher is not None:
+            return self.prefetcher.get_frame(frame_index,
+                                             step=self.prefetch_step,
+                                             direction=self._direction,
+                                             ahead=self.prefetch_ahead)
+        else:
+            return self.reader.read(frame_index)
+
+    def advance_frames(self, frame_count):
+        """
+            Go forward frame_count frames, the frames in between are not decoded
+        """
+
+        self._direction = 1
 
-    def get_prev_frame(self):
+        self._cur_index = min(self._cur_index + frame_count, self.frame_count-1)
+
+        # when playback has fallen behind, the window follows the frames shown while catching up
+        # and is shrunk, the skipped frames are grabbed by the reader instead of decoded into the window
+        if frame_count > 1 + self.frame_skip_count:
+            self._catch_up_step = frame_count
+
+        try:
+            return self.read_new_frame()
+        finally:
+            self._catch_up_step = None
+
+    def get_prev_frame(self, block=True):
+
+        self._direction = -1
 
         self._cur_index = max(self._cur_index -1 - self.frame_skip_count, 0)
 
-        return self.read_new_frame()    
+        return self.read_new_frame(block)
+
+    @property
+    def frame_size(self):
+        """(width, height) of the full resolution frames"""
+        return self._frame_size
+
+    @property
+    def proxy_active(self):
+        return self._proxy_active
+
+    def propagate_active_object(self):
+        """
+            Track the active box forward in the background. The tracked boxes are added
+            with the same object id by apply_propagated_boxes. Returns False if there is
+            no active box.
+        """
+
+        active_object = self.active_annotation_object
+
+        if active_object is None:
+            return False
+
+        self.cancel_propagation()
+
+        self._propagated_object = (active_object.obj_id, active_object.class_name, active_object.class_id)
+
+        self.propagator = TrackerPropagator(self.video_file, self._cur_index, active_object.coords,
+                                            self.propagate_frames,
+                                            tracker=self.tracker,
+                                            min_confidence=self.tracker_min_confidence,
+                                            keyframe_index=self._keyframe_index)
+        self.propagator.start()
+
+        return True
+
+    def apply_propagated_boxes(self):
+        """
+            Add the boxes tracked since the last call to the annotations, called on the
+            UI thread while propagating. The tracked boxes replace derived boxes, a frame
+            where the object already has a drawn box stops the propagation.
+            Returns the number of boxes added or moved.
+        """
+
+        if self.propagator is None:
+            return 0
+
+        object_id, class_name, class_id = self._propagated_object
+
+        applied = 0
+
+        for frame_ind, box_coords in self.propagator.take_boxes():
+
+            box = self.object_box(frame_ind, object_id)
+
+            if box is not None and not box.derived:
+                reason = f"reached the box on frame {frame_ind}"
+                self.propagator.cancel(reason)
+                if self.propagator.finished.is_set():
+                    self.propagator.stop_reason = reason
+                break
+
+            if box is None:
+                box = self.annotation_loader.annotation_class(box_coords, class_name, class_id, object_id,
+                                                              color=self.get_class_color(class_name))
+                self.frame_annotations[frame_ind].append(box)
+                self.frame_annotations_changed(frame_ind)
+            else:
+                box.update_annotation(coords=box_coords)
+                box.derived = False
+                self.frame_edited(frame_ind)
+
+            applied += 1
+
+        return applied
+
+    def cancel_propagation(self):
+        if self.propagator is not None:
+            self.propagator.cancel()
+
+    @property
+    def propagating(self):
+        return self.propagator is not None and not self.propagator.finished.is_set()
+
+    @property
+    def propagation_status(self):
+
+        if self.propagator is None:
+            return "off"
+
+        if self.propagating:
+            return "{}%, confidence {:.2f}".format(int(100 * self.propagator.progress), self.propagator.last_confidence)
+
+        return f"{self.propagator.frames_done} frames, {self.propagator.stop_reason}"
+
+    @property
+    def proxy_status(self):
+        if self.proxy_transcoder is None:
+            return "off"
+        if self._proxy_active:
+            return "in use"
+        return f"{int(100 * self.proxy_transcoder.progress)}%"
 
     @property
     def time_between_frames(self):
@@ -438,17 +1314,18 @@ class VideoAnnotations(Annotations):
 
     @property
     def frame_count(self):
-        if self.cap is not None:
-            return int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        else:
-            return 0    
+        return self._frame_count
 
     @property
     def fps(self):
-        if self.cap is not None:
-            return int(self.cap.get(cv2.CAP_PROP_FPS))
+        return self._fps
+
+    @property
+    def prefetch_hit_rate(self):
+        if self.prefetcher is not None:
+            return round(self.prefetcher.hit_rate, 2)
         else:
-            return 0
+            return 0.0
 
     @property
     def frame_skip_count(self):
@@ -469,18 +1346,37 @@ class ImageAnnotations(Annotations):
     # TODO: add more image types that are supported by opencv
     supported_file_types = ('png', 'jpg', 'jpeg')
 
-    def __init__(self, input_directory, output_file, annotation_class_file=None, annotation_file=None):
+    def __init__(self, input_directory, output_file, annotation_class_file=None, annotation_file=None,
+                 frame_cache_bytes=0, prefetch_count=0, io_threads=4, recursive=False, journal=False,
+                 autosave_interval=0, autosave_edits=0, binary_annotations=False, annotation_database=None,
+                 sparse_annotations=False):
 
         # image files in folder
-        self._image_files = self.read_image_names(input_directory)
+        self._image_files = self.read_image_names(input_directory, recursive)
 
-        print(f"Found image files: {self._image_files}")
+        print(f"Found {len(self._image_files)} image files")
+
+        # load the images around the current image in a thread pool
+        self.prefetcher = None
+        if prefetch_count > 0:
+            self.prefetcher = ImagePrefetcher(self._image_files, prefetch_count, io_threads)
+
+        # keep the annotations in a database, which is also saved to by default
+        if annotation_database is not None:
+            annotation_loader = SqliteAnnotationLoader(annotation_database, TextBoxAnnotation)
+            output_file = annotation_database if output_file is None else output_file
+        else:
+            annotation_loader = AnnotationLoader(TextBoxAnnotation, binary=binary_annotations, sparse=sparse_annotations)
 
         # call the parent constructor
         super().__init__(output_file,
                          annotation_class_file,
                          annotation_file,
-                         annotation_loader=AnnotationLoader(TextBoxAnnotation))
+                         annotation_loader=annotation_loader,
+                         frame_cache_bytes=frame_cache_bytes,
+                         journal=journal,
+                         autosave_interval=autosave_interval,
+                         autosave_edits=autosave_edits)
 
     def add_text_to_current_annotation_object(self, text):
 
@@ -490,39 +1386,44 @@ class ImageAnnotations(Annotations):
         print(f"Got an active annotation object: {self.active_annotation_object}")
 
         self.active_annotation_object.update_annotation(text=text)
+        self.frame_edited(self._cur_index)
 
-    def read_image_names(self, folder):
+    def read_image_names(self, folder, recursive=False):
+        """
+            Index the images in the folder in natural order, so that the image 
+            indices stay the same between runs
+        """
 
         print(f"looking at image in folder {folder}")
 
-        if not os.path.exists(folder):
-            return None
+        if not os.path.isdir(folder):
+            raise OSError(f"No image folder found at path: {folder}")
 
-        image_file_paths = []
+        return ImageIndex.scan(folder, ImageAnnotations.supported_file_types, recursive)
 
-        for fname in os.listdir(folder):
 
-            file_name, file_ext = os.path.splitext(fname)
+    def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
 
-            # take extension without dot, .png -> png
-            if file_ext[1:] in ImageAnnotations.supported_file_types:
-                image_file_paths.append(os.path.join(folder, fname))
+        super().close()
 
-        return image_file_paths
+    def frame_available(self, frame_index):
 
+        if self.prefetcher is None:
+            return True
 
-    def read_new_frame(self):
-        
-        cur_image_path = self._image_files[self._cur_index]
+        self.prefetcher.move_to(frame_index)
 
-        if not os.path.exists(cur_image_path):
-            raise OSError(f"No image file found at path: {cur_image_path} for image index {self._cur_index}")
+        return self.prefetcher.is_ready(frame_index)
 
-        frame = cv2.cvtColor(cv2.imread(cur_image_path), cv2.COLOR_BGR2RGB)
+    def decode_frame(self, frame_index):
 
-        self.init_new_frame()
+        if self.prefetcher is not None:
+            self.prefetcher.move_to(frame_index)
+            return self.prefetcher.get(frame_index)
 
-        return frame
+        return load_image(self._image_files[frame_index])
     
     @property
     def frame_count(self):
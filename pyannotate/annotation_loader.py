@@ -1,55 +1,225 @@
 
+import re
+import os
 import json
+import array
 import logging
 
 from pyannotate.annotation_object import BoxAnnotation
+from pyannotate.binary_format import BINARY_EXTENSION, is_binary_file, load_binary_file, save_binary_file
+from pyannotate.columnar_store import ColumnBuilder
+from pyannotate.frame_store import FrameStore, JsonFrameStore, MemoryFrameStore
+from pyannotate.sqlite_store import SqliteFrameStore, is_sqlite_file, save_sqlite_file
 
 # load logger
 logger = logging.getLogger("AnnotationLoader")
 
+# start of the list of frames and the frame count in the annotation file
+FRAMES_START = re.compile(r'"frames"\s*:\s*\[')
+FRAME_COUNT = re.compile(r'"frame_count"\s*:\s*(\d+)')
+SPARSE = re.compile(r'"sparse"\s*:\s*true')
+# whitespace and commas between the frames
+SEPARATOR = re.compile(r'[\s,]*')
+
+
+def latin1_to_utf8(text):
+	"""Fix a string parsed from utf-8 bytes that were decoded as latin-1"""
+	try:
+		return text.encode('latin-1').decode('utf-8')
+	except UnicodeError:
+		# escaped characters outside latin-1, already decoded correctly
+		return text
+
 class AnnotationLoader:
 	"""
 		Basically a BoxAnnotationLoader, since load detected boxes by default
 	"""
 
-	def __init__(self, annotation_class=BoxAnnotation):
+	def __init__(self, annotation_class=BoxAnnotation, columnar=False, binary=False, sparse=False):
+
+		"""
+			With columnar the loaded annotations are stored in numpy arrays,
+			otherwise the frames are read lazily from the annotation file.
+
+			With binary the annotations are saved in the binary format, which is
+			also used for files with the binary extension. Binary files are
+			recognized when loading.
+
+			With sparse only the frames with annotations are saved to json files,
+			both sparse and dense files are loaded.
+		"""
 
 		self.annotation_class = annotation_class
+		self.columnar = columnar
+		self.binary = binary
+		self.sparse = sparse
+
+
+	# size of the chunks the annotation file is read in
+	chunk_size = 1 << 22
+
+	def create_annotations(self, frame_count):
 
+		"""
+			Storage for the annotations when no annotation file is given,
+			an empty list of detections for each frame.
+			Returns the annotations, class names and object ids like load_annotation_file.
+		"""
+
+		return MemoryFrameStore(frame_count, self.create_detection_object), set(), set()
 
 	def load_annotation_file(self, file_path):
 
-		json_data = None 
+		"""
+			Load the annotation file without creating the annotation objects.
 
-		with open(file_path, 'r') as f:			
-			json_data = json.load(f)
+			The file is parsed frame by frame and either the byte offset of each frame
+			or the detections of the frame in columns are stored. The annotation objects
+			of a frame are created when the frame is first accessed.
+			The class names and object ids are gathered in the same pass.
 
-		# should have annotations for each frame (can be empty)
-		if not len(json_data['frames']) == json_data['frame_count']:
-			raise RuntimeError('Annotation file invalid, number of annotations and frame count disagree.')
+			Only the frames with detections are kept, by their frame index. A dense file
+			has a frame for every frame index, a sparse file only the annotated frames.
 
-		objects_for_frames = []
+			Binary annotation files are memory-mapped and SQLite databases are queried instead.
+		"""
+
+		if is_binary_file(file_path):
+			return load_binary_file(file_path, self.create_detection_object)
+
+		if is_sqlite_file(file_path):
+			frame_annotations = SqliteFrameStore(file_path, self.create_detection_object)
+			return frame_annotations, frame_annotations.class_names(), frame_annotations.object_ids()
 
 		# keep track of all the loaded class names
 		class_names = set()
 		obj_ids = set()
 
-		# load all the frames
-		for frame_ind, frame in enumerate(json_data['frames']):
+		# frame index -> (byte offset, byte length) and number of detections of the frames with detections
+		frame_offsets = dict()
+		detection_counts = dict()
+		columns = ColumnBuilder()
+		# object id -> indices of the frames the object appears in
+		object_frames = dict()
+
+		# number of frames in the file and the index of the last frame
+		parsed = {'frames': 0, 'last_index': -1}
+
+		def add_frame(offset, length, frame):
+
+			frame_ind = frame.get('frame_index', parsed['frames'])
 
-			# create a list of list of detection for this frame
-			objects_for_frames.append( [self.create_detection_object(det) for det in frame['objects']])
+			if frame_ind <= parsed['last_index']:
+				raise RuntimeError(f'Annotation file invalid, frame {frame_ind} is not in frame order.')
+
+			parsed['frames'] += 1
+			parsed['last_index'] = frame_ind
+
+			if len(frame['objects']) == 0:
+				return
 
 			# keep track which class names and object ids are found in the file
-			for annotation in objects_for_frames[frame_ind]:
-				class_names = class_names.union([annotation.class_name])
-				obj_ids = obj_ids.union([annotation.obj_id])
+			for detection in frame['objects']:
+				class_names.add(latin1_to_utf8(detection['class_name']))
+				obj_ids.add(detection['object_id'])
+
+			if self.columnar:
+				columns.add_frame(frame_ind, frame['objects'], fix_string=latin1_to_utf8)
+			else:
+				frame_offsets[frame_ind] = (offset, length)
+				for object_id in dict.fromkeys(detection['object_id'] for detection in frame['objects']):
+					object_frames.setdefault(object_id, array.array('i')).append(frame_ind)
+
+			detection_counts[frame_ind] = len(frame['objects'])
+
+		frame_count, sparse = self.index_annotation_file(file_path, add_frame)
+
+		# dense files should have annotations for each frame (can be empty)
+		if not sparse and not parsed['frames'] == frame_count:
+			raise RuntimeError('Annotation file invalid, number of annotations and frame count disagree.')
+
+		if parsed['last_index'] >= frame_count:
+			raise RuntimeError('Annotation file invalid, frame index outside the frame count.')
+
+		if self.columnar:
+			frame_annotations = columns.build(frame_count, self.create_detection_object)
+		else:
+			frame_annotations = JsonFrameStore(file_path, frame_count, frame_offsets, detection_counts,
+											   self.create_detection_object, object_frames)
+
+		return frame_annotations, class_names, obj_ids
+
+	def index_annotation_file(self, file_path, frame_callback):
+
+		"""
+			Parse the frames of the annotation file one by one, frame_callback is called
+			with the byte offset and length of the frame in the file and the parsed frame.
+			Returns the frame count of the file and whether the file is sparse.
+
+			The file is decoded as latin-1 so that the character offsets in the
+			decoded text are the byte offsets in the file.
+		"""
+
+		decoder = json.JSONDecoder()
+		parsed_frames = 0
+
+		with open(file_path, 'rb') as f:
+
+			# read until the start of the frame list
+			text = ''
+			frames_start = None
+			while frames_start is None:
+				chunk = f.read(self.chunk_size).decode('latin-1')
+				if not chunk:
+					raise RuntimeError('Annotation file invalid, no frames found.')
+				text += chunk
+				frames_start = FRAMES_START.search(text)
+
+			header = text[:frames_start.start()]
+
+			# byte offset of the start of text in the file
+			text_offset = 0
+			pos = frames_start.end()
+			end_of_file = False
+
+			while True:
+
+				pos = SEPARATOR.match(text, pos).end()
 
+				if pos == len(text) or text[pos] != ']':
 
-		return objects_for_frames, class_names, obj_ids
+					try:
+						frame, end = decoder.raw_decode(text, pos)
+					except json.JSONDecodeError:
+						# the frame continues in the next chunk
+						if end_of_file:
+							raise RuntimeError(f'Annotation file invalid, could not parse frame {parsed_frames}.')
+						chunk = f.read(self.chunk_size).decode('latin-1')
+						end_of_file = not chunk
+						# drop the parsed frames from the text
+						text = text[pos:] + chunk
+						text_offset += pos
+						pos = 0
+						continue
+
+					frame_callback(text_offset + pos, end - pos, frame)
+					parsed_frames += 1
+
+					pos = end
+
+				else:
+					# end of the frame list, the frame count may come after the frames
+					footer = text[pos:] + f.read().decode('latin-1')
+					break
+
+		frame_count = FRAME_COUNT.search(header) or FRAME_COUNT.search(footer)
+		if frame_count is None:
+			raise RuntimeError('Annotation file invalid, no frame count found.')
+
+		sparse = SPARSE.search(header) or SPARSE.search(footer)
+
+		return int(frame_count.group(1)), sparse is not None
 
-			
-		
 	def create_detection_object(self,detection_json):
 
 		"""
@@ -59,8 +229,6 @@ class AnnotationLoader:
 			To use different detection formats, override this method
 		"""
 
-		print(f"Creating detection object with annotation class {self.annotation_class}")
-
 		return self.annotation_class.from_detection_json(detection_json)
 
 
@@ -69,26 +237,124 @@ class AnnotationLoader:
 		"""
 			Calls the detection objects to json method for each detection.
 			Allows different detection classes 
+
+			The frames are written one per line, frames that have not been accessed
+			in a FrameStore are copied without creating the annotation objects.
+			In sparse mode only the frames with annotations are written.
+			The file is written next to the target and moved in place. When the
+			annotations are read lazily from the file being replaced, the store
+			closes the file for the replace and reads the saved file after it.
+		"""
+
+		if self.binary or file_path.endswith(BINARY_EXTENSION):
+			save_binary_file(file_path, annotations)
+			return
+
+		if is_sqlite_file(file_path):
+			save_sqlite_file(file_path, annotations)
+			return
+
+		tmp_path = file_path + '.tmp'
+
+		# frame index -> (byte offset, byte length) and number of detections of the saved frames with detections
+		frame_offsets = dict()
+		detection_counts = dict()
+
+		# written in binary so that the offsets are byte offsets on every platform
+		with open(tmp_path, 'wb') as f:
+
+			if not self.sparse:
+				frame_indices = range(len(annotations))
+			elif isinstance(annotations, FrameStore):
+				frame_indices = annotations.annotated_frame_indices()
+			else:
+				frame_indices = [ind for ind, frame in enumerate(annotations) if len(frame) > 0]
+
+			f.write(b'{\n')
+			f.write(f'  "frame_count": {len(annotations)},\n'.encode())
+			if self.sparse:
+				f.write(b'  "sparse": true,\n')
+			f.write(b'  "frames": [')
+
+			for count, frame_ind in enumerate(frame_indices):
+
+				if isinstance(annotations, FrameStore):
+					objects = annotations.frame_json(frame_ind)
+				else:
+					objects = [ detection.detection_to_json() for detection in annotations[frame_ind] ]
+
+				frame_dict ={
+							 'frame_index' : frame_ind,
+							 'objects' : objects
+							}
+
+				f.write(b',\n    ' if count > 0 else b'\n    ')
+
+				data = json.dumps(frame_dict).encode()
+
+				if len(objects) > 0:
+					frame_offsets[frame_ind] = (f.tell(), len(data))
+					detection_counts[frame_ind] = len(objects)
+
+				f.write(data)
+
+			f.write(b'\n  ]\n}\n')
+
+		storage = annotations.storage if isinstance(annotations, FrameStore) else None
+
+		if isinstance(storage, JsonFrameStore) and os.path.exists(file_path) and \
+		   os.path.samefile(storage.file_path, file_path):
+			storage.replace_file(tmp_path, frame_offsets, detection_counts, annotations.accessed_frame_indices())
+		else:
+			os.replace(tmp_path, file_path)
+
+
+class SqliteAnnotationLoader(AnnotationLoader):
+	"""
+		Keeps the annotations in a SQLite database, the frames are read on demand
+		and saving writes the accessed frames to the database. Saving to a json
+		or binary file exports the annotations.
+	"""
+
+	def __init__(self, database_file, annotation_class=BoxAnnotation):
+
+		super().__init__(annotation_class)
+
+		self.database_file = database_file
+
+
+	def create_annotations(self, frame_count):
+
 		"""
+			Continue with the annotations in the database, or create a new database
+		"""
+
+		if os.path.exists(self.database_file):
+			return self.load_annotation_file(self.database_file)
+
+		frame_annotations = SqliteFrameStore(self.database_file, self.create_detection_object, frame_count=frame_count)
 
-		root = {
-				'frame_count' : len(annotations),
-				'frames' : []
-				}
-		
-		
-		for frame_ind, frame in enumerate(annotations):
+		return frame_annotations, set(), set()
+
+	def load_annotation_file(self, file_path):
+
+		"""
+			A json or binary annotation file is imported to a new database
+		"""
 
-			frame_dict ={
-						 'frame_index' : frame_ind,
-						 'objects' : [ detection.detection_to_json() for detection in frame ]
-						}
+		if is_sqlite_file(file_path):
+			return super().load_annotation_file(file_path)
 
-			root['frames'].append(frame_dict)
+		if os.path.exists(self.database_file):
+			raise RuntimeError(f'Annotation database {self.database_file} already exists, not importing {file_path} over it.')
 
-		with open(file_path, 'w') as f:			
-			json.dump(root, f, indent=2)
+		imported, class_names, obj_ids = super().load_annotation_file(file_path)
 
+		frame_annotations = SqliteFrameStore(self.database_file, self.create_detection_object, frame_count=len(imported))
+		frame_annotations.import_frames(imported)
 
+		imported.close()
 
+		print(f"Imported {file_path} to annotation database {self.database_file}")
 
+		return frame_annotations, class_names, obj_ids
@@ -1,6 +1,6 @@
 
 import cv2
-import tkinter
+import colorsys
 import logging
 
 
@@ -10,6 +10,33 @@ logger = logging.getLogger("AnnotationObject")
 def hex_to_rgb(hex_color):
     return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
 
+def class_colors(class_names):
+    """
+        dictionary of class name -> distinct hex color, created in hsv space
+    """
+    colors = dict()
+
+    nclasses = len(class_names)
+
+    for ind, class_name in enumerate(class_names):
+        hsv_color = (1.0*ind / nclasses,  .5, .5 )
+        rgb_color = tuple([int(255*clr) for clr in colorsys.hsv_to_rgb(*hsv_color)])
+        colors[class_name] = '#%02x%02x%02x' % rgb_color
+
+    return colors
+
+def merge_class_names(class_names, new_class_names):
+    """
+        class_names followed by the new class names not in it yet, in sorted order.
+        The order of the existing classes is kept, it gives the class ids and colors
+    """
+    new_names = sorted(set(new_class_names).difference(class_names))
+
+    if len(new_names) == 0:
+        return class_names
+
+    return list(class_names) + new_names
+
 class BoxAnnotation:
 
     def __init__(self, points, class_name, class_id, obj_id, color='#ffffff'):
@@ -36,6 +63,9 @@ class BoxAnnotation:
         # is the annotation visible
         self.visible = True
 
+        # derived boxes are interpolated from the keyframes of the object
+        self.derived = False
+
         logger.debug(f"creating annotation box with tag {self.tag}")
 
     def draw_annotation_to_array(self, frame, color, active=False):
@@ -52,36 +82,32 @@ class BoxAnnotation:
 
 
 
-    def draw_annotation(self, canvas,color):
+    def draw_annotation(self, canvas,color, scale=1.0, active=False):
         """
             Given a tkinter canvas object, draw this object.
+            tkinter is imported here, so that drawing to arrays works without it.
 
             For finding the same object but drawn in different frames,
             the object tag is used to find the correct object.
-        """
 
-        # update color 
-        self.color = color
-
-        # if the draw reference is not None, the annotation has been drawn
-        if self.draw_ref is not None:
-
-            state = tkinter.NORMAL if self.visible else tkinter.HIDDEN
-
-            # update color
-            canvas.itemconfig(self.draw_ref, outline=color)
+            scale is the size of the shown frame relative to the frame 
+            the coordinates are in.
+        """
 
-            # update visibility
-            canvas.itemconfig(self.draw_ref, state=state)
+        import tkinter
 
-            # update location
-            canvas.coords(self.draw_ref, *self.coords)
+        canvas_coords = [coord * scale for coord in self.coords]
 
+        # the active annotation is drawn with a thicker outline and derived boxes dashed
+        width = 4 if active else 2
+        dash = (6, 4) if self.derived else ''
 
+        # update color 
+        self.color = color
 
-        # if the annotation has not been draw yet, create a new box
-        # First check if the object with this id (and tag) has been drawn already
-        else:
+        # if the annotation has not been draw yet, 
+        # first check if the object with this id (and tag) has been drawn already
+        if self.draw_ref is None:
 
              # find boxes that correspond to this object and are already drawn on canvas
             drawn_tags = canvas.find_withtag(self.tag)
@@ -91,18 +117,36 @@ class BoxAnnotation:
                 logger.debug(f"Not creating new box for annotation because found one drawn with tags {drawn_tags}")
                 self.draw_ref = drawn_tags[0]
 
+        # if the draw ref is still None, this object has not been drawn
+        if self.draw_ref is None:
+        
+            self.draw_ref = canvas.create_rectangle(canvas_coords,
+                                                    tags=self.tag,
+                                                    fill="",
+                                                    width=width,
+                                                    dash=dash,
+                                                    outline=color)
 
-            # if the draw ref is still None, this object has not been drawn
-            if self.draw_ref is None:
-            
-                self.draw_ref = canvas.create_rectangle(self.coords,
-                                                        tags=self.tag,
-                                                        fill="",
-                                                        width=2,
-                                                        outline=color)
+            # move the recently created item to the top
+            canvas.tag_raise(self.draw_ref)
 
-                # move the recently created item to the top
-                canvas.tag_raise(self.draw_ref)
+        else:
+
+            state = tkinter.NORMAL if self.visible else tkinter.HIDDEN
+
+            # update color, visibility and outline width
+            canvas.itemconfig(self.draw_ref, outline=color, state=state, width=width, dash=dash)
+
+            # update location
+            canvas.coords(self.draw_ref, *canvas_coords)
+
+    def erase_annotation(self, canvas):
+        """
+            Remove the drawing of this object from the canvas
+        """
+        if self.draw_ref is not None:
+            canvas.delete(self.draw_ref)
+            self.draw_ref = None
 
     def update_annotation(self, coords=None, visible=True, color=None, class_name=None, class_id=None):
         """
@@ -161,7 +205,8 @@ class BoxAnnotation:
                     ]
         }
 
-
+        if self.derived:
+            det_dict['derived'] = True
 
         return det_dict
 
@@ -176,7 +221,11 @@ class BoxAnnotation:
         points = (detection_json['object_coords'][0]['x'], detection_json['object_coords'][0]['y'], 
                 detection_json['object_coords'][1]['x'], detection_json['object_coords'][1]['y'])		
 
-        return cls(points, detection_json['class_name'], detection_json['class_id'], detection_json['object_id'])
+        box = cls(points, detection_json['class_name'], detection_json['class_id'], detection_json['object_id'])
+
+        box.derived = detection_json.get('derived', False)
+
+        return box
 
 
     def __repr__(self):
@@ -214,7 +263,7 @@ class TextBoxAnnotation(BoxAnnotation):
 
         basic_annotation.update_annotation(text=detection_json['text'])
 
-        print(f"Loaded annotation {basic_annotation}")
+        logger.debug(f"Loaded annotation {basic_annotation}")
 
         return basic_annotation
 
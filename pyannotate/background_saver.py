@@ -0,0 +1,100 @@
+import time
+import logging
+import threading
+
+# load logger
+logger = logging.getLogger("BackgroundSaver")
+
+
+class BackgroundSaver(threading.Thread):
+    """
+        Runs the saves of the annotations in a worker thread, one at a time.
+
+        A save is a function and a snapshot of the annotations taken on the UI
+        thread, the function is called with the snapshot in the worker. While
+        a save is running, the requested saves wait in a queue, and a request
+        with the same function as the last waiting one replaces it, or is
+        merged into it with the merge function given with the request.
+
+        If a save fails, the failed callbacks of the request and of the
+        requests merged into it are called with the error in the worker.
+    """
+
+    def __init__(self):
+
+        super().__init__(daemon=True)
+
+        self._condition = threading.Condition()
+        # list of [save_function, snapshot, failed callbacks]
+        self._pending = []
+        self._saving = False
+        self._stopped = False
+
+        self.last_save_time = None
+        self.last_save_duration = 0.0
+        self.last_error = None
+
+        # number of requests merged into a waiting save
+        self.coalesced = 0
+
+    def request(self, save_function, snapshot, merge=None, failed=None):
+
+        failed_callbacks = [failed] if failed is not None else []
+
+        with self._condition:
+
+            if self._pending and self._pending[-1][0] == save_function:
+                waiting = self._pending[-1]
+                waiting[1] = merge(waiting[1], snapshot) if merge is not None else snapshot
+                waiting[2].extend(failed_callbacks)
+                self.coalesced += 1
+            else:
+                self._pending.append([save_function, snapshot, failed_callbacks])
+
+            self._condition.notify_all()
+
+    @property
+    def busy(self):
+        with self._condition:
+            return self._saving or len(self._pending) > 0
+
+    def run(self):
+
+        while True:
+
+            with self._condition:
+
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+
+                if not self._pending:
+                    return
+
+                save_function, snapshot, failed_callbacks = self._pending.pop(0)
+                self._saving = True
+
+            start = time.monotonic()
+
+            try:
+                save_function(snapshot)
+                self.last_error = None
+            except Exception as e:
+                logger.exception("Saving annotations failed")
+                self.last_error = e
+                for failed in failed_callbacks:
+                    failed(e)
+
+            with self._condition:
+                self._saving = False
+                self.last_save_duration = time.monotonic() - start
+                self.last_save_time = time.time()
+                self._condition.notify_all()
+
+    def stop(self):
+        """Finish the requested saves and stop the thread"""
+
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+        self.join()
@@ -0,0 +1,322 @@
+import os
+import logging
+import threading
+
+import numpy as np
+
+from pyannotate.columnar_store import ColumnBuilder, ColumnarFrameStore, COLUMNS
+from pyannotate.frame_store import FrameStore
+
+# load logger
+logger = logging.getLogger("BinaryFormat")
+
+BINARY_EXTENSION = '.annbin'
+BINARY_MAGIC = b'PYANNBIN'
+BINARY_VERSION = 2
+
+HEADER_DTYPE = np.dtype([('magic', 'S8'),
+                         ('version', '<u4'),
+                         ('frame_count', '<u4'),
+                         ('record_count', '<u8'),
+                         ('class_name_count', '<u8'),
+                         ('text_count', '<u8'),
+                         ('object_id_count', '<u8')])
+
+# one fixed width record per detection, class_name and text are indices to the string tables, text -1 for no text
+RECORD_DTYPE = np.dtype([(name, '<i4') for name in COLUMNS] + [('text', '<i4'), ('flags', '<i4')])
+
+# version 1 files have no flags
+RECORD_DTYPES = {1: np.dtype([(name, '<i4') for name in COLUMNS] + [('text', '<i4')]),
+                 2: RECORD_DTYPE}
+
+# bits of the flags field
+DERIVED_FLAG = 1
+
+# keys of the detection json that can be stored in the records
+RECORD_KEYS = ('class_name', 'class_id', 'object_id', 'object_coords', 'text', 'derived')
+
+
+def is_binary_file(file_path):
+    """Check the magic bytes in the beginning of the file"""
+    with open(file_path, 'rb') as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def pad_to_8(f):
+    f.write(b'\0' * (-f.tell() % 8))
+
+
+def write_string_table(f, strings):
+    """The table is the byte offsets of the strings, followed by the utf-8 encoded strings"""
+
+    encoded = [string.encode('utf-8') for string in strings]
+
+    offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(data) for data in encoded])
+
+    f.write(offsets.tobytes())
+    f.write(b''.join(encoded))
+    pad_to_8(f)
+
+
+def save_binary_file(file_path, annotations):
+    """
+        Write the annotations in the binary format. Sections, each aligned to 8 bytes:
+
+            header          HEADER_DTYPE
+            frame starts    uint64 [frame_count + 1], the records of frame i are frame_starts[i]:frame_starts[i+1]
+            records         RECORD_DTYPE [record_count], sorted by frame
+            object ids      int32 [object_id_count], the unique object ids
+            class names     string table
+            texts           string table
+
+        annotations is a list of lists of annotation objects or a FrameStore
+    """
+
+    frame_count = len(annotations)
+
+    builder = ColumnBuilder()
+    if isinstance(annotations, FrameStore):
+        for frame_ind in annotations.annotated_frame_indices():
+            builder.add_frame(frame_ind, annotations.frame_json(frame_ind))
+    else:
+        for frame_ind, frame in enumerate(annotations):
+            builder.add_frame(frame_ind, [detection.detection_to_json() for detection in frame])
+
+    store = builder.build(frame_count, None)
+    columns, class_names = store.columns()
+
+    records = np.zeros(len(columns['frame']), dtype=RECORD_DTYPE)
+    for name in COLUMNS:
+        records[name] = columns[name]
+
+    texts = []
+    records['text'] = -1
+    for row, extras in builder.extras.items():
+        unknown = set(extras) - set(RECORD_KEYS)
+        if unknown:
+            raise ValueError(f"Detection keys {sorted(unknown)} can not be stored in the binary annotation format")
+        if 'text' in extras:
+            records['text'][row] = len(texts)
+            texts.append(extras['text'])
+        if extras.get('derived'):
+            records['flags'][row] |= DERIVED_FLAG
+
+    object_ids = np.unique(records['object_id']).astype('<i4')
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = BINARY_MAGIC
+    header['version'] = BINARY_VERSION
+    header['frame_count'] = frame_count
+    header['record_count'] = len(records)
+    header['class_name_count'] = len(class_names)
+    header['text_count'] = len(texts)
+    header['object_id_count'] = len(object_ids)
+
+    tmp_path = file_path + '.tmp'
+
+    with open(tmp_path, 'wb') as f:
+        f.write(header.tobytes())
+        pad_to_8(f)
+        f.write(store.frame_starts.astype('<u8').tobytes())
+        f.write(records.tobytes())
+        pad_to_8(f)
+        f.write(object_ids.tobytes())
+        pad_to_8(f)
+        write_string_table(f, class_names)
+        write_string_table(f, texts)
+
+    storage = annotations.storage if isinstance(annotations, FrameStore) else None
+
+    if isinstance(storage, BinaryFrameStore) and os.path.exists(file_path) and \
+       os.path.samefile(storage.binary_file.file_path, file_path):
+        storage.replace_file(tmp_path, annotations.accessed_frame_indices())
+    else:
+        os.replace(tmp_path, file_path)
+
+
+class BinaryFile:
+    """
+        Sections of a binary annotation file mapped with numpy.memmap,
+        the pages of the file are read when they are accessed.
+    """
+
+    def __init__(self, file_path):
+
+        self.file_path = file_path
+
+        header = np.fromfile(file_path, dtype=HEADER_DTYPE, count=1)
+
+        if len(header) == 0 or header['magic'][0] != BINARY_MAGIC:
+            raise RuntimeError(f'{file_path} is not a binary annotation file.')
+
+        if header['version'][0] not in RECORD_DTYPES:
+            raise RuntimeError(f'Unsupported binary annotation file version {header["version"][0]}.')
+
+        self.header = header[0]
+        self.version = int(self.header['version'])
+        self._offset = HEADER_DTYPE.itemsize + (-HEADER_DTYPE.itemsize % 8)
+
+        self.frame_count = int(self.header['frame_count'])
+        self.frame_starts = self.map_section('<u8', self.frame_count + 1)
+        self.records = self.map_section(RECORD_DTYPES[self.version], int(self.header['record_count']))
+        self.object_ids = self.map_section('<i4', int(self.header['object_id_count']))
+        self.class_names = self.map_string_table(int(self.header['class_name_count']))
+        self.texts = self.map_string_table(int(self.header['text_count']))
+
+    def map_section(self, dtype, count):
+
+        dtype = np.dtype(dtype)
+        offset = self._offset
+        self._offset += dtype.itemsize * count
+        self._offset += -self._offset % 8
+
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+
+        return np.memmap(self.file_path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+
+    def map_string_table(self, count):
+
+        offsets = self.map_section('<u8', count + 1)
+        data_size = int(offsets[-1]) if count > 0 else 0
+        data = self.map_section(np.uint8, data_size)
+
+        return offsets, data
+
+    @staticmethod
+    def get_string(string_table, index):
+        offsets, data = string_table
+        return bytes(data[offsets[index]:offsets[index + 1]]).decode('utf-8')
+
+
+class BinaryFrameStore(ColumnarFrameStore):
+    """
+        The columns of a memory-mapped binary annotation file.
+
+        Saving over the mapped file unmaps it for the replace and maps the
+        saved file, the columns are read under a lock so that they are not
+        read while they are switched.
+    """
+
+    def __init__(self, binary_file, create_object):
+
+        super().__init__(binary_file.frame_count, *self.file_columns(binary_file), dict(), create_object,
+                         frame_starts=binary_file.frame_starts)
+
+        self.binary_file = binary_file
+
+        # frames that are empty in the loaded file but not in the saved file mapped after it
+        self._empty_frames = set()
+
+        # the columns are also read by the thread saving a snapshot
+        self._file_lock = threading.RLock()
+
+    @staticmethod
+    def file_columns(binary_file):
+        """The columns and the class name table of a binary file"""
+
+        class_names = [binary_file.get_string(binary_file.class_names, ind)
+                       for ind in range(int(binary_file.header['class_name_count']))]
+
+        return {name: binary_file.records[name] for name in COLUMNS}, class_names
+
+    def replace_file(self, tmp_path, saved_frames):
+        """
+            Move a saved binary file from tmp_path over the mapped file and map it.
+            A mapped file can not be replaced on every platform, so the columns are
+            unmapped for the replace.
+
+            saved_frames are the frames that were saved from annotation objects,
+            those of them that are empty in the replaced file stay empty, as in
+            JsonFrameStore.replace_file.
+        """
+
+        with self._file_lock:
+
+            file_path = self.binary_file.file_path
+
+            empty_frames = {frame_ind for frame_ind in saved_frames if self.stored_detection_count(frame_ind) == 0}
+
+            # the maps are closed when the last array using them is gone
+            self.binary_file = self._columns = self._frame_starts = None
+
+            try:
+                os.replace(tmp_path, file_path)
+            finally:
+                self.binary_file = BinaryFile(file_path)
+                self._columns, self._class_names = self.file_columns(self.binary_file)
+                self._frame_starts = self.binary_file.frame_starts
+
+            self._empty_frames.update(empty_frames)
+
+    def resize(self, frame_count):
+        with self._file_lock:
+            self._empty_frames = {frame_ind for frame_ind in self._empty_frames if frame_ind < frame_count}
+            super().resize(frame_count)
+
+    def load_frame_json(self, frame_ind):
+        with self._file_lock:
+            if frame_ind in self._empty_frames:
+                return []
+            return super().load_frame_json(frame_ind)
+
+    def stored_detection_count(self, frame_ind):
+        with self._file_lock:
+            if frame_ind in self._empty_frames:
+                return 0
+            return super().stored_detection_count(frame_ind)
+
+    def detection_counts(self):
+        with self._file_lock:
+            counts = super().detection_counts()
+            for frame_ind in self._empty_frames:
+                if frame_ind not in self._materialized:
+                    counts[frame_ind] = 0
+            return counts
+
+    def stored_object_frames(self):
+        with self._file_lock:
+            return super().stored_object_frames()
+
+    def columns(self):
+
+        with self._file_lock:
+
+            empty_frames = [frame_ind for frame_ind in self._empty_frames if frame_ind not in self._materialized]
+
+            if not empty_frames:
+                return super().columns()
+
+            # the rows of the frames that are empty are left out like the rows of edited frames
+            for frame_ind in empty_frames:
+                self._materialized[frame_ind] = []
+            try:
+                return super().columns()
+            finally:
+                for frame_ind in empty_frames:
+                    del self._materialized[frame_ind]
+
+    def row_extras(self, row):
+
+        extras = dict()
+
+        text_ind = self.binary_file.records['text'][row]
+
+        if text_ind >= 0:
+            extras['text'] = self.binary_file.get_string(self.binary_file.texts, text_ind)
+
+        if self.binary_file.version >= 2 and self.binary_file.records['flags'][row] & DERIVED_FLAG:
+            extras['derived'] = True
+
+        return extras
+
+
+def load_binary_file(file_path, create_object):
+    """Returns the frame store, the class names and the object ids of the file"""
+
+    binary_file = BinaryFile(file_path)
+
+    frame_annotations = BinaryFrameStore(binary_file, create_object)
+
+    return frame_annotations, set(frame_annotations.class_names), set(binary_file.object_ids.tolist())
@@ -0,0 +1,232 @@
+import array
+import logging
+
+import numpy as np
+
+from pyannotate.frame_store import FrameStore
+
+# load logger
+logger = logging.getLogger("ColumnarStore")
+
+# int32 columns with one row per detection, class_name is an index to the class name table
+COLUMNS = ('frame', 'object_id', 'class_id', 'class_name', 'x1', 'y1', 'x2', 'y2')
+
+# keys of the detection json stored in the columns, other keys are stored per row as they are
+COLUMN_KEYS = ('class_name', 'class_id', 'object_id', 'object_coords')
+
+
+class ColumnBuilder:
+    """
+        Collects detections into columns frame by frame. The rows are kept in
+        compact arrays while the file is read, so that building the columns
+        does not hold a Python object per value.
+    """
+
+    def __init__(self, class_names=()):
+
+        self._columns = {name: array.array('i') for name in COLUMNS}
+
+        self._class_names = list(class_names)
+        self._class_name_index = {name: ind for ind, name in enumerate(self._class_names)}
+
+        # row -> dict of the other keys of the detection json, for example the text of a TextBoxAnnotation
+        self._extras = dict()
+
+    def add_frame(self, frame_ind, detections, fix_string=None):
+        """
+            Add the detections of a frame as json dicts, frames have to be added in order.
+            fix_string is applied to the strings of the detections.
+        """
+
+        columns = self._columns
+
+        for detection in detections:
+
+            class_name = detection['class_name']
+            if fix_string is not None:
+                class_name = fix_string(class_name)
+
+            class_name_ind = self._class_name_index.get(class_name)
+            if class_name_ind is None:
+                class_name_ind = len(self._class_names)
+                self._class_name_index[class_name] = class_name_ind
+                self._class_names.append(class_name)
+
+            extras = {key: value for key, value in detection.items() if key not in COLUMN_KEYS}
+            if extras:
+                if fix_string is not None:
+                    extras = {key: fix_string(value) if isinstance(value, str) else value
+                              for key, value in extras.items()}
+                self._extras[len(columns['frame'])] = extras
+
+            point1, point2 = detection['object_coords']
+
+            columns['frame'].append(frame_ind)
+            columns['object_id'].append(detection['object_id'])
+            columns['class_id'].append(detection['class_id'])
+            columns['class_name'].append(class_name_ind)
+            columns['x1'].append(int(point1['x']))
+            columns['y1'].append(int(point1['y']))
+            columns['x2'].append(int(point2['x']))
+            columns['y2'].append(int(point2['y']))
+
+    @property
+    def extras(self):
+        """dict of row -> the keys of the detection json not stored in the columns"""
+        return self._extras
+
+    def build(self, frame_count, create_object):
+
+        columns = {name: np.frombuffer(column, dtype=np.int32) if len(column) > 0 else np.zeros(0, dtype=np.int32)
+                   for name, column in self._columns.items()}
+
+        return ColumnarFrameStore(frame_count, columns, self._class_names, self._extras, create_object)
+
+
+class ColumnarFrameStore(FrameStore):
+    """
+        Detections stored in int32 NumPy columns sorted by frame, with the row
+        of the first detection of each frame as the frame index.
+
+        A box takes 32 bytes in the columns. Annotation objects are created
+        only for the frames that are accessed, the edits to those frames are
+        kept in the objects and merged to the columns by columns().
+    """
+
+    def __init__(self, frame_count, columns, class_names, extras, create_object, frame_starts=None):
+        """
+            columns is a dict of column name -> int32 array sorted by frame,
+            class_names is the table of class names the class_name column refers to
+            and extras is a dict of row -> other keys of the detection json.
+            frame_starts is computed from the frame column if not given.
+        """
+
+        super().__init__(frame_count, create_object)
+
+        self._columns = columns
+        self._class_names = class_names
+        self._extras = extras
+
+        # rows of frame i are frame_starts[i]:frame_starts[i+1]
+        if frame_starts is None:
+            frame_starts = np.searchsorted(columns['frame'], np.arange(frame_count + 1))
+        self._frame_starts = frame_starts
+
+    def load_frame_json(self, frame_ind):
+
+        columns = self._columns
+
+        detections = []
+
+        for row in range(self._frame_starts[frame_ind], self._frame_starts[frame_ind + 1]):
+
+            detection = {
+                        'class_name' : self._class_names[columns['class_name'][row]],
+                        'class_id' : int(columns['class_id'][row]),
+                        'object_id' : int(columns['object_id'][row]),
+                        'object_coords' : [
+                            {'x' : int(columns['x1'][row]), 'y' : int(columns['y1'][row])},
+                            {'x' : int(columns['x2'][row]), 'y' : int(columns['y2'][row])}
+                        ]
+            }
+
+            detection.update(self.row_extras(row))
+
+            detections.append(detection)
+
+        return detections
+
+    def resize(self, frame_count):
+
+        frame_starts = self._frame_starts
+
+        if frame_count < self.frame_count:
+            # the rows are sorted by frame, the rows of the left out frames are at the end
+            rows = int(frame_starts[frame_count])
+            self._columns = {name: column[:rows] for name, column in self._columns.items()}
+            self._frame_starts = frame_starts[:frame_count + 1]
+        else:
+            padding = np.full(frame_count - self.frame_count, frame_starts[-1], dtype=frame_starts.dtype)
+            self._frame_starts = np.concatenate((frame_starts, padding))
+
+        super().resize(frame_count)
+
+    def row_extras(self, row):
+        """The keys of the detection json that are not stored in the columns"""
+        return self._extras.get(row, {})
+
+    def stored_detection_count(self, frame_ind):
+        return int(self._frame_starts[frame_ind + 1] - self._frame_starts[frame_ind])
+
+    def detection_counts(self):
+        """Number of detections in each frame, including the edits"""
+
+        counts = np.diff(self._frame_starts).astype(np.int64)
+
+        for frame_ind, annotations in self._materialized.items():
+            counts[frame_ind] = len(annotations)
+
+        return counts
+
+    def stored_object_frames(self):
+
+        # the rows are sorted by frame, a stable sort by object id keeps the frames of an object sorted
+        order = np.argsort(self._columns['object_id'], kind='stable')
+        object_ids = self._columns['object_id'][order]
+        frames = self._columns['frame'][order].astype(np.int32)
+
+        # rows where the object or the frame changes, an object is once per frame in the index
+        new_row = np.ones(len(order), dtype=bool)
+        new_row[1:] = (object_ids[1:] != object_ids[:-1]) | (frames[1:] != frames[:-1])
+        object_ids = object_ids[new_row]
+        frames = frames[new_row]
+
+        starts = np.flatnonzero(np.diff(object_ids, prepend=object_ids[:1] - 1))
+        ends = np.append(starts[1:], len(object_ids))
+
+        return {int(object_ids[start]): array.array('i', frames[start:end].tobytes())
+                for start, end in zip(starts, ends)}
+
+    def annotated_frame_indices(self):
+        return np.flatnonzero(self.detection_counts()).tolist()
+
+    def total_detection_count(self):
+        return int(self.detection_counts().sum())
+
+    @property
+    def frame_starts(self):
+        return self._frame_starts
+
+    @property
+    def class_names(self):
+        return self._class_names
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self._columns.values()) + self._frame_starts.nbytes
+
+    def columns(self):
+        """
+            All the detections as a dict of column name -> array sorted by frame,
+            with the edits of the accessed frames. Returns the columns and the
+            class name table.
+        """
+
+        if not self._materialized:
+            return self._columns, self._class_names
+
+        # rows of the frames that have not been accessed
+        keep = ~np.isin(self._columns['frame'], list(self._materialized))
+
+        builder = ColumnBuilder(self._class_names)
+
+        for frame_ind in sorted(self._materialized):
+            builder.add_frame(frame_ind, self.frame_json(frame_ind))
+
+        edited = builder.build(self.frame_count, self.create_object)
+
+        merged = {name: np.concatenate((self._columns[name][keep], edited._columns[name])) for name in COLUMNS}
+
+        order = np.argsort(merged['frame'], kind='stable')
+
+        return {name: column[order] for name, column in merged.items()}, edited._class_names
@@ -0,0 +1,52 @@
+import argparse
+import logging
+
+from pyannotate.annotation_loader import AnnotationLoader
+from pyannotate.binary_format import BINARY_EXTENSION
+
+# load logger
+logger = logging.getLogger("ConvertAnnotations")
+
+
+def convert_annotations(input_file, output_file, binary=False):
+    """
+        Convert an annotation file between the json, the binary and the SQLite
+        formats. The format of the input is recognized from the file, the output
+        format is binary if binary is set or the output file has the binary
+        extension and SQLite for the .sqlite and .db extensions
+    """
+
+    loader = AnnotationLoader(binary=binary)
+
+    frame_annotations, class_names, obj_ids = loader.load_annotation_file(input_file)
+
+    loader.save_annotation_file(output_file, frame_annotations)
+
+    print(f"Converted {frame_annotations.total_detection_count()} objects in {len(frame_annotations)} frames to {output_file}")
+
+    frame_annotations.close()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description=f'Convert annotation files between the json format, the binary {BINARY_EXTENSION} format and SQLite databases.')
+
+    parser.add_argument('input_file', type=str,
+                        help='json, binary or SQLite annotation file')
+
+    parser.add_argument('output_file', type=str,
+                        help=f'converted annotation file, binary if the extension is {BINARY_EXTENSION}, SQLite for .sqlite and .db')
+
+    parser.add_argument(
+        '--binary', action='store_true',
+        help='write the binary format regardless of the extension of the output file'
+    )
+
+    args = parser.parse_args()
+
+    convert_annotations(args.input_file, args.output_file, args.binary)
+
+
+if __name__ == '__main__':
+    main()
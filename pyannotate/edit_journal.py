@@ -0,0 +1,101 @@
+import os
+import json
+import logging
+
+# load logger
+logger = logging.getLogger("EditJournal")
+
+
+class EditJournal:
+    """
+        Append-only journal of the edited frames, kept next to the output file.
+
+        Saving appends a record with the detections of each frame edited since
+        the previous save, instead of rewriting the whole annotation file. On
+        startup the records are replayed over the annotation file the journal
+        was started from. Compaction writes the full annotation file and
+        removes the journal.
+
+        The first line is a header and the rest are records, one json object per line:
+            {"version": 1, "base": "/path/annotations.json", "frame_count": 3000}
+            {"frame": 12, "objects": [{"class_name": "car", ...}]}
+    """
+
+    version = 1
+
+    def __init__(self, output_file):
+
+        self.path = output_file + '.journal'
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def size(self):
+        return os.path.getsize(self.path) if self.exists() else 0
+
+    def read_header(self):
+        """Return the header of the journal, or None if there is no journal"""
+
+        if not self.exists():
+            return None
+
+        with open(self.path, 'r') as f:
+            header = json.loads(f.readline())
+
+        if header.get('version') != self.version:
+            raise RuntimeError(f"Unsupported edit journal version in {self.path}")
+
+        return header
+
+    def read_records(self):
+        """
+            Return a dict of frame index -> detections as json dicts, the latest
+            record of each frame. A partially written last record is ignored.
+        """
+
+        frames = dict()
+
+        with open(self.path, 'r') as f:
+
+            # skip header
+            f.readline()
+
+            for line_ind, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring an incomplete record on line {line_ind + 2} of edit journal {self.path}")
+                    break
+
+                frames[record['frame']] = record['objects']
+
+        return frames
+
+    def append(self, frames, base_file, frame_count):
+        """
+            Append a record for each frame in the dict of frame index -> detections
+            as json dicts. The journal is created with base_file as the annotation
+            file the records are replayed over.
+        """
+
+        new_journal = not self.exists()
+
+        with open(self.path, 'a') as f:
+
+            if new_journal:
+                header = {
+                         'version' : self.version,
+                         'base' : os.path.abspath(base_file) if base_file is not None else None,
+                         'frame_count' : frame_count
+                         }
+                f.write(json.dumps(header) + '\n')
+
+            for frame_ind, objects in frames.items():
+                f.write(json.dumps({'frame': frame_ind, 'objects': objects}) + '\n')
+
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remove(self):
+        if self.exists():
+            os.remove(self.path)
@@ -0,0 +1,282 @@
+import os
+import re
+import csv
+import time
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+from pyannotate.annotation_holder import ImageAnnotations
+from pyannotate.annotation_loader import AnnotationLoader
+from pyannotate.image_index import ImageIndex
+from pyannotate.keyframe_index import KeyframeIndex
+from pyannotate.video_reader import VideoReader
+
+# load logger
+logger = logging.getLogger("ExportCrops")
+
+MANIFEST_COLUMNS = ('crop_file', 'source', 'frame', 'object_id', 'class_name', 'class_id',
+                    'x1', 'y1', 'x2', 'y2', 'width', 'height')
+
+
+def crop_region(coords, frame_size, padding=0.0):
+    """
+        The (x1, y1, x2, y2) area of a box in a frame of (width, height), grown by
+        padding times the size of the box on every side and clipped to the frame.
+        None if nothing of the box is inside the frame.
+    """
+
+    x1, x2 = sorted((int(coords[0]), int(coords[2])))
+    y1, y2 = sorted((int(coords[1]), int(coords[3])))
+
+    pad_x = int(round((x2 - x1) * padding))
+    pad_y = int(round((y2 - y1) * padding))
+
+    x1, y1 = max(x1 - pad_x, 0), max(y1 - pad_y, 0)
+    x2, y2 = min(x2 + pad_x, frame_size[0]), min(y2 + pad_y, frame_size[1])
+
+    if x2 <= x1 or y2 <= y1:
+        return None
+
+    return (x1, y1, x2, y2)
+
+
+# characters not allowed in file names on some platforms
+INVALID_NAME_CHARACTERS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+# device names that can not be used as file names on Windows
+RESERVED_NAMES = {'CON', 'PRN', 'AUX', 'NUL'} | {f'{device}{ind}' for device in ('COM', 'LPT') for ind in range(1, 10)}
+
+
+def directory_name(name):
+    """
+        A class name made safe to use as one directory name on every platform,
+        the invalid characters and the path separators are replaced with _
+    """
+
+    # / and \ are replaced, they are os.sep and os.altsep on every platform
+    name = INVALID_NAME_CHARACTERS.sub('_', name)
+
+    # Windows drops trailing dots and spaces, this also leaves nothing of . and ..
+    name = name.rstrip('. ')
+
+    if name == '' or name.split('.')[0].upper() in RESERVED_NAMES:
+        name = '_' + name
+
+    return name
+
+
+def crop_file(output_dir, detection, frame_index, box_index, extension):
+    """The crops are in output_dir/<class name>/<object id>/"""
+
+    class_dir = directory_name(detection['class_name'])
+
+    return os.path.join(output_dir, class_dir, str(detection['object_id']),
+                        f"frame_{frame_index:07d}_{box_index}.{extension}")
+
+
+def export_chunk(source, frames, sources, output_dir, padding, size, extension, threads):
+    """
+        Crop the boxes of a chunk of frames in a worker process. frames is a dict of
+        frame index -> detections as json dicts, sources is a dict of frame index ->
+        image file for image folders or None for a video, which is then decoded in
+        order with one capture.
+
+        The crops are encoded and written in a thread pool.
+
+        @return: list of manifest rows
+    """
+
+    reader = None
+    if sources is None:
+        reader = VideoReader(cv2.VideoCapture(source), KeyframeIndex.load(source))
+
+    rows = []
+    writes = []
+    created_dirs = set()
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+
+        for frame_index in sorted(frames):
+
+            try:
+                if reader is not None:
+                    frame = reader.read_bgr(frame_index)
+                    frame_source = source
+                else:
+                    frame_source = sources[frame_index]
+                    frame = cv2.imread(frame_source)
+                    if frame is None:
+                        raise IOError(f"Could not read image file {frame_source}")
+            except IOError as e:
+                logger.warning(f"Skipping the boxes of frame {frame_index}: {e}")
+                continue
+
+            for box_index, detection in enumerate(frames[frame_index]):
+
+                point1, point2 = detection['object_coords']
+                region = crop_region((point1['x'], point1['y'], point2['x'], point2['y']),
+                                     (frame.shape[1], frame.shape[0]), padding)
+
+                if region is None:
+                    continue
+
+                x1, y1, x2, y2 = region
+                crop = frame[y1:y2, x1:x2]
+
+                if size is not None:
+                    crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+
+                path = crop_file(output_dir, detection, frame_index, box_index, extension)
+
+                if os.path.dirname(path) not in created_dirs:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    created_dirs.add(os.path.dirname(path))
+
+                # the slice is copied so that the frame can be released before the crop is written
+                writes.append((path, executor.submit(cv2.imwrite, path, crop.copy())))
+
+                rows.append((os.path.relpath(path, output_dir), frame_source, frame_index,
+                             detection['object_id'], detection['class_name'], detection['class_id'],
+                             x1, y1, x2, y2, crop.shape[1], crop.shape[0]))
+
+    if reader is not None:
+        reader.release()
+
+    failed = {path for path, write in writes if not write.result()}
+    if failed:
+        logger.error(f"Could not write {len(failed)} crops, for example {next(iter(failed))}")
+
+    return [row for row in rows if os.path.join(output_dir, row[0]) not in failed]
+
+
+def export_crops(source, annotation_file, output_dir, padding=0.0, size=None, extension='jpg',
+                 processes=1, threads=4, recursive=False, manifest_file=None):
+    """
+        Write a crop of every annotated box of a video or an image folder to
+        output_dir/<class name>/<object id>/ and a CSV manifest of the crops.
+
+        The boxes are grouped by frame and the annotated frames are split into
+        chunks of consecutive frames, each chunk is decoded in order in its own
+        process. Returns the number of crops written.
+    """
+
+    frame_annotations, _, _ = AnnotationLoader().load_annotation_file(annotation_file)
+
+    # the source folder is only read, the index manifest is not written to it
+    images = ImageIndex.scan(source, ImageAnnotations.supported_file_types, recursive,
+                             save_manifest=False) if os.path.isdir(source) else None
+
+    if images is not None and len(images) != len(frame_annotations):
+        raise RuntimeError(f"The annotation file has {len(frame_annotations)} frames but there are {len(images)} images in {source}")
+
+    annotated_frames = frame_annotations.annotated_frame_indices()
+
+    processes = max(min(processes, len(annotated_frames)), 1)
+    chunk_length = max(-(-len(annotated_frames) // processes), 1)
+
+    chunks = []
+    for start in range(0, len(annotated_frames), chunk_length):
+        chunk_frames = annotated_frames[start:start + chunk_length]
+        frames = {frame_ind: frame_annotations.frame_json(frame_ind) for frame_ind in chunk_frames}
+        sources = {frame_ind: images[frame_ind] for frame_ind in chunk_frames} if images is not None else None
+        chunks.append((source, frames, sources, output_dir, padding, size, extension, threads))
+
+    frame_annotations.close()
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"Exporting the boxes of {len(annotated_frames)} frames from {source} in {len(chunks)} chunks")
+
+    started = time.monotonic()
+
+    if processes == 1:
+        results = [export_chunk(*chunk) for chunk in chunks]
+    else:
+        # workers are started clean, like the thumbnail workers
+        with multiprocessing.get_context('spawn').Pool(processes) as pool:
+            results = pool.starmap(export_chunk, chunks)
+
+    rows = [row for result in results for row in result]
+
+    manifest_file = manifest_file if manifest_file is not None else os.path.join(output_dir, 'manifest.csv')
+
+    with open(manifest_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(MANIFEST_COLUMNS)
+        writer.writerows(rows)
+
+    elapsed = time.monotonic() - started
+
+    print(f"Wrote {len(rows)} crops to {output_dir} in {elapsed:.1f} s ({len(rows) / max(elapsed, 1e-9):.1f} crops/s), "
+          f"manifest {manifest_file}")
+
+    return len(rows)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Export a crop of every annotated box of a video or an image folder for training, '
+                    'with a CSV manifest of the crops.')
+
+    parser.add_argument('source', type=str,
+                        help='the annotated video or image folder')
+
+    parser.add_argument('annotation_file', type=str,
+                        help='json, binary or SQLite annotation file of the source')
+
+    parser.add_argument('output_dir', type=str,
+                        help='the crops are written to output_dir/<class name>/<object id>/')
+
+    parser.add_argument(
+        '--padding', type=float, default=0.0,
+        help='grow the crops by this fraction of the box size on every side'
+    )
+
+    parser.add_argument(
+        '--size', type=int, nargs=2, default=None, metavar=('WIDTH', 'HEIGHT'),
+        help='resize the crops to this size'
+    )
+
+    parser.add_argument(
+        '--format', type=str, default='jpg', choices=['jpg', 'png'],
+        help='image format of the crops'
+    )
+
+    parser.add_argument(
+        '--processes', type=int, default=max(multiprocessing.cpu_count() - 1, 1),
+        help='number of processes decoding chunks of the frames'
+    )
+
+    parser.add_argument(
+        '--threads', type=int, default=4,
+        help='number of threads encoding and writing the crops in each process'
+    )
+
+    parser.add_argument(
+        '--recursive', action='store_true',
+        help='include the images in the subfolders of an image folder'
+    )
+
+    parser.add_argument(
+        '--manifest', type=str, default=None,
+        help='path of the CSV manifest, output_dir/manifest.csv by default'
+    )
+
+    args = parser.parse_args()
+
+    export_crops(args.source, args.annotation_file, args.output_dir,
+                 padding=args.padding,
+                 size=tuple(args.size) if args.size is not None else None,
+                 extension=args.format,
+                 processes=args.processes,
+                 threads=args.threads,
+                 recursive=args.recursive,
+                 manifest_file=args.manifest)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import logging
+from collections import OrderedDict
+
+# load logger
+logger = logging.getLogger("FrameCache")
+
+
+class FrameCache:
+    """
+        Least recently used cache of decoded frames keyed by frame index.
+
+        The cache is bounded by the total size of the cached frames in bytes
+        instead of the number of frames, so the same budget works for small
+        and 4K frames. A budget of 0 disables caching.
+
+        Cached frames are shared with the callers, they should not be modified.
+    """
+
+    def __init__(self, max_bytes=0):
+
+        self.max_bytes = max_bytes
+
+        # frame index -> frame, the least recently used first
+        self._frames = OrderedDict()
+        self._size_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @property
+    def size_bytes(self):
+        return self._size_bytes
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, frame_index):
+        return frame_index in self._frames
+
+    def get(self, frame_index):
+        """
+            Return the cached frame or None if the frame is not cached
+        """
+        if not self.enabled:
+            return None
+
+        frame = self._frames.get(frame_index)
+
+        if frame is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._frames.move_to_end(frame_index)
+        return frame
+
+    def put(self, frame_index, frame):
+        """
+            Add a frame to the cache, evicting the least recently used frames
+            until the cache fits the budget. Frames larger than the whole
+            budget are not cached.
+        """
+        if not self.enabled or frame.nbytes > self.max_bytes:
+            return
+
+        if frame_index in self._frames:
+            self._size_bytes -= self._frames.pop(frame_index).nbytes
+
+        self._frames[frame_index] = frame
+        self._size_bytes += frame.nbytes
+
+        while self._size_bytes > self.max_bytes:
+            _, evicted = self._frames.popitem(last=False)
+            self._size_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        self._frames.clear()
+        self._size_bytes = 0
+
+    def __repr__(self):
+        return f"hits {self.hits}, misses {self.misses}, evictions {self.evictions}, {self._size_bytes // 2**20} MB"
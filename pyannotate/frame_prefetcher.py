@@ -0,0 +1,183 @@
+import threading
+import logging
+from collections import OrderedDict
+
+# load logger
+logger = logging.getLogger("FramePrefetcher")
+
+
+class FramePrefetcher(threading.Thread):
+    """
+        A worker thread that owns a VideoReader and decodes frames ahead of
+        the current frame into a bounded buffer.
+
+        The window is described by the current frame index, the step between
+        frames (1 + frame skip count) and the direction of travel. The worker
+        decodes window_ahead frames in the direction of travel and
+        window_behind frames in the other direction. Frames that fall out of
+        the window are dropped from the buffer.
+
+        If a requested frame is not part of the current window (a far jump or
+        a changed step) the window is discarded and refilled around the new
+        frame. The window ahead can be shrunk for a move, for skipping frames
+        when playback has fallen behind.
+    """
+
+    def __init__(self, reader, window_ahead=16, window_behind=0):
+
+        super().__init__(daemon=True)
+
+        self.reader = reader
+        self.window_ahead = window_ahead
+        self.window_behind = window_behind
+
+        # frame index -> rgb frame, at most window_ahead + window_behind + 1 frames
+        self._buffer = OrderedDict()
+
+        # frame index -> exception raised while decoding it
+        self._errors = dict()
+
+        self._center = 0
+        self._step = 1
+        self._direction = 1
+        # frames decoded ahead in the current window
+        self._ahead = window_ahead
+
+        self._condition = threading.Condition()
+        self._running = True
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def capacity(self):
+        return self.window_ahead + self.window_behind + 1
+
+    @property
+    def hit_rate(self):
+        requests = self.hits + self.misses
+        if requests > 0:
+            return self.hits / requests
+        else:
+            return 0.0
+
+    def move_to(self, frame_index, step=1, direction=1, ahead=None):
+        """
+            Move the window to frame_index without waiting for the frame.
+            ahead limits the frames decoded ahead to fewer than window_ahead.
+        """
+
+        with self._condition:
+
+            if step != self._step or frame_index not in self.window_indices():
+                logger.debug(f"Discarding prefetch window for frame {frame_index} with step {step}")
+                self._buffer.clear()
+
+            self._center = frame_index
+            self._step = step
+            self._direction = direction
+            self._ahead = self.window_ahead if ahead is None else min(ahead, self.window_ahead)
+            self._condition.notify_all()
+
+    def get_frame(self, frame_index, step=1, direction=1, ahead=None):
+        """
+            Return the rgb frame at frame_index and move the window there.
+
+            Blocks until the frame is decoded if it is not buffered yet.
+        """
+
+        with self._condition:
+
+            if frame_index in self._buffer:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+            self._errors.pop(frame_index, None)
+            self.move_to(frame_index, step, direction, ahead)
+
+            while frame_index not in self._buffer and frame_index not in self._errors:
+                if not self._running:
+                    raise RuntimeError("Frame prefetcher has been stopped")
+                self._condition.wait()
+
+            if frame_index in self._errors:
+                raise self._errors.pop(frame_index)
+
+            return self._buffer[frame_index]
+
+    def window_indices(self):
+        """
+            The frame indices in the current window in decoding priority order,
+            the current frame first, then the frames ahead and the frames behind.
+        """
+
+        indices = [self._center]
+
+        offset = self._direction * self._step
+
+        for ind in range(1, self._ahead + 1):
+            indices.append(self._center + ind * offset)
+
+        for ind in range(1, self.window_behind + 1):
+            indices.append(self._center - ind * offset)
+
+        return [ind for ind in indices if 0 <= ind < self.reader.frame_count]
+
+    def next_missing_index(self):
+        for ind in self.window_indices():
+            if ind not in self._buffer and ind not in self._errors:
+                return ind
+        return None
+
+    def run(self):
+
+        while True:
+
+            with self._condition:
+
+                frame_index = self.next_missing_index()
+
+                while self._running and frame_index is None:
+                    self._condition.wait()
+                    frame_index = self.next_missing_index()
+
+                if not self._running:
+                    return
+
+            # decode outside of the lock so that buffered frames can be served meanwhile
+            try:
+                frame = self.reader.read(frame_index)
+                error = None
+            except IOError as e:
+                frame = None
+                error = e
+
+            with self._condition:
+
+                if error is not None:
+                    self._errors[frame_index] = error
+                elif frame_index in self.window_indices():
+                    self._buffer[frame_index] = frame
+
+                # drop the frames that the window has moved past
+                window = set(self.window_indices())
+                for ind in list(self._buffer.keys()):
+                    if ind not in window:
+                        del self._buffer[ind]
+
+                while len(self._buffer) > self.capacity:
+                    self._buffer.popitem(last=False)
+
+                self._condition.notify_all()
+
+    def stop(self):
+
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+        if self.is_alive():
+            self.join()
+
+        self.reader.release()
@@ -0,0 +1,346 @@
+import os
+import json
+import array
+import logging
+import threading
+
+# load logger
+logger = logging.getLogger("FrameStore")
+
+
+class FrameStore:
+    """
+        The annotations of every frame, used in place of a list of lists of
+        annotation objects in Annotations.frame_annotations.
+
+        The annotation objects of a frame are created only when the frame is
+        accessed, after that the same list of objects is returned and edited
+        in place. Frames that have not been accessed are read from the backing
+        storage implemented by the subclasses.
+
+        Frames without annotations are not stored, a frame that is left empty
+        can be dropped from memory with discard_if_empty.
+    """
+
+    def __init__(self, frame_count, create_object):
+        """
+            create_object creates an annotation object from the json dict of a
+            detection, AnnotationLoader.create_detection_object
+        """
+
+        self.frame_count = frame_count
+        self.create_object = create_object
+
+        # frame index -> list of annotation objects
+        self._materialized = dict()
+
+    def __len__(self):
+        return self.frame_count
+
+    def __getitem__(self, frame_ind):
+
+        if frame_ind < 0:
+            frame_ind += self.frame_count
+
+        if not 0 <= frame_ind < self.frame_count:
+            raise IndexError(f"Frame index {frame_ind} out of range")
+
+        annotations = self._materialized.get(frame_ind)
+
+        if annotations is None:
+            annotations = [self.create_object(detection)
+                           for detection in self.load_frame_json(frame_ind)]
+            self._materialized[frame_ind] = annotations
+
+        return annotations
+
+    def __setitem__(self, frame_ind, annotations):
+
+        if not 0 <= frame_ind < self.frame_count:
+            raise IndexError(f"Frame index {frame_ind} out of range")
+
+        self._materialized[frame_ind] = annotations
+
+    def __iter__(self):
+        for frame_ind in range(self.frame_count):
+            yield self[frame_ind]
+
+    def is_materialized(self, frame_ind):
+        return frame_ind in self._materialized
+
+    def resize(self, frame_count):
+        """
+            Change the number of frames, for annotations saved for a different
+            number of frames than the video has. New frames are empty, the
+            frames from frame_count on are left out of the annotations.
+        """
+
+        for frame_ind in [ind for ind in self._materialized if ind >= frame_count]:
+            del self._materialized[frame_ind]
+
+        self.frame_count = frame_count
+
+    def load_frame_json(self, frame_ind):
+        """
+            Return the stored detections of a frame as json dicts
+        """
+        raise NotImplementedError("Implement this in child class")
+
+    def stored_detection_count(self, frame_ind):
+        """
+            Number of stored detections in a frame that has not been accessed
+        """
+        raise NotImplementedError("Implement this in child class")
+
+    def stored_frame_indices(self):
+        """
+            Indices of the stored frames that can have detections, all the frames by default
+        """
+        return range(self.frame_count)
+
+    def stored_object_frames(self):
+        """
+            dict of object id -> ascending indices of the stored frames the object appears in
+        """
+        object_frames = dict()
+
+        for frame_ind in sorted(ind for ind in self.stored_frame_indices() if ind < self.frame_count):
+            for object_id in dict.fromkeys(detection['object_id'] for detection in self.load_frame_json(frame_ind)):
+                object_frames.setdefault(object_id, array.array('i')).append(frame_ind)
+
+        return object_frames
+
+    def accessed_frame_indices(self):
+        """Indices of the frames that have annotation objects"""
+        return list(self._materialized)
+
+    def discard_if_empty(self, frame_ind):
+        """
+            Drop the list of annotation objects of a frame that has no annotations,
+            neither in memory nor stored
+        """
+        annotations = self._materialized.get(frame_ind)
+        if annotations is not None and len(annotations) == 0 and self.stored_detection_count(frame_ind) == 0:
+            del self._materialized[frame_ind]
+
+    def detection_count(self, frame_ind):
+        if frame_ind in self._materialized:
+            return len(self._materialized[frame_ind])
+        return self.stored_detection_count(frame_ind)
+
+    def frame_json(self, frame_ind):
+        """
+            The detections of a frame as json dicts, without creating
+            annotation objects for frames that have not been accessed
+        """
+        if frame_ind in self._materialized:
+            return [detection.detection_to_json() for detection in self._materialized[frame_ind]]
+        return self.load_frame_json(frame_ind)
+
+    def annotated_frame_indices(self):
+
+        frames = {ind for ind in self.stored_frame_indices()
+                  if ind < self.frame_count and ind not in self._materialized and self.stored_detection_count(ind) > 0}
+
+        frames.update(ind for ind, annotations in self._materialized.items() if len(annotations) > 0)
+
+        return sorted(frames)
+
+    def total_detection_count(self):
+
+        stored = sum(self.stored_detection_count(ind) for ind in self.stored_frame_indices()
+                     if ind < self.frame_count and ind not in self._materialized)
+
+        return stored + sum(len(annotations) for annotations in self._materialized.values())
+
+    @property
+    def storage(self):
+        """The store whose storage the frames that have not been accessed are read from"""
+        return self
+
+    def accessed_frames_json(self):
+        """dict of frame index -> detections as json dicts of the frames that have been accessed"""
+        return {frame_ind: self.frame_json(frame_ind) for frame_ind in self._materialized}
+
+    def snapshot(self):
+        """Copy of the current annotations that can be saved in another thread"""
+        return SnapshotFrameStore(self.frame_count, self.accessed_frames_json(), self)
+
+    def close(self):
+        pass
+
+
+class MemoryFrameStore(FrameStore):
+    """
+        Annotations that are only in memory, for example when annotating
+        without an annotation file. Only the accessed frames are kept.
+    """
+
+    def load_frame_json(self, frame_ind):
+        return []
+
+    def stored_detection_count(self, frame_ind):
+        return 0
+
+    def stored_frame_indices(self):
+        return []
+
+
+class SnapshotFrameStore(FrameStore):
+    """
+        Read-only copy of annotations for saving them in a worker thread.
+
+        The accessed frames are copied as json when the snapshot is taken, the
+        other frames are read from the storage of the copied store, which does
+        not change after loading.
+    """
+
+    def __init__(self, frame_count, frames, base=None):
+        """
+            frames is a dict of frame index -> detections as json dicts,
+            the frames not in it are read from the base store or are empty
+        """
+
+        super().__init__(frame_count, None)
+
+        self._frames = frames
+        self._base = base
+
+    def load_frame_json(self, frame_ind):
+
+        if frame_ind in self._frames:
+            return self._frames[frame_ind]
+
+        if self._base is None:
+            return []
+
+        return self._base.load_frame_json(frame_ind)
+
+    def stored_detection_count(self, frame_ind):
+
+        if frame_ind in self._frames:
+            return len(self._frames[frame_ind])
+
+        if self._base is None:
+            return 0
+
+        return self._base.stored_detection_count(frame_ind)
+
+    def stored_frame_indices(self):
+
+        if self._base is None:
+            return list(self._frames)
+
+        return sorted(set(self._base.stored_frame_indices()).union(self._frames))
+
+    @property
+    def storage(self):
+        return self._base.storage if self._base is not None else self
+
+    def accessed_frame_indices(self):
+        return list(self._frames)
+
+    def accessed_frames_json(self):
+        return dict(self._frames)
+
+
+class JsonFrameStore(FrameStore):
+    """
+        Frames read on demand from an annotation json file.
+
+        The file is indexed once with the byte offset and length of every
+        frame object that has detections, a frame is parsed only when it is
+        accessed. The file is kept open, so the frames can be read even if the
+        file is replaced by a save (on POSIX systems).
+    """
+
+    def __init__(self, file_path, frame_count, frame_offsets, detection_counts, create_object, object_frames=None):
+        """
+            frame_offsets is a dict of frame index -> (byte offset, byte length) of the frame object
+            detection_counts is a dict of frame index -> number of detections in the frame,
+            the frames not in them have no detections.
+            object_frames is stored_object_frames gathered while indexing the file,
+            otherwise the frames are parsed for it
+        """
+
+        super().__init__(frame_count, create_object)
+
+        self.file_path = file_path
+        self._frame_offsets = frame_offsets
+        self._detection_counts = detection_counts
+        self._object_frames = object_frames
+
+        self._file = open(file_path, 'rb')
+        # frames are also read by the thread saving a snapshot
+        self._file_lock = threading.Lock()
+
+    def load_frame_json(self, frame_ind):
+
+        with self._file_lock:
+
+            if frame_ind not in self._frame_offsets:
+                return []
+
+            offset, length = self._frame_offsets[frame_ind]
+
+            self._file.seek(offset)
+            data = self._file.read(length)
+
+        frame = json.loads(data)
+
+        return frame['objects']
+
+    def stored_detection_count(self, frame_ind):
+        return self._detection_counts.get(frame_ind, 0)
+
+    def stored_frame_indices(self):
+        return self._detection_counts.keys()
+
+    def stored_object_frames(self):
+
+        if self._object_frames is None:
+            return super().stored_object_frames()
+
+        return self._object_frames
+
+    def resize(self, frame_count):
+
+        # gathered for the frames of the whole file, parsed again without the left out frames
+        if frame_count < self.frame_count:
+            self._object_frames = None
+
+        super().resize(frame_count)
+
+    def replace_file(self, tmp_path, frame_offsets, detection_counts, saved_frames):
+        """
+            Move a saved annotation file from tmp_path over the file the frames are read from
+            and read the frames from it. An open file can not be replaced on every platform,
+            so the file is closed for the replace.
+
+            frame_offsets and detection_counts are those of the saved file and saved_frames
+            the frames that were saved from annotation objects. Those of them that are empty
+            in the replaced file stay empty, they are not read again unless they are emptied
+            and discarded after the save was taken, and then they are empty.
+        """
+
+        with self._file_lock:
+
+            self._file.close()
+
+            try:
+                os.replace(tmp_path, self.file_path)
+            finally:
+                self._file = open(self.file_path, 'rb')
+
+            for frame_ind in saved_frames:
+                if frame_ind not in self._detection_counts:
+                    frame_offsets.pop(frame_ind, None)
+                    detection_counts.pop(frame_ind, None)
+
+            self._frame_offsets = frame_offsets
+            self._detection_counts = detection_counts
+            # gathered from the replaced file, the file is parsed if they are needed again
+            self._object_frames = None
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,59 @@
+import logging
+
+# load logger
+logger = logging.getLogger("GuiUpdate")
+
+
+class GuiUpdateScheduler:
+    """
+        Coalesces GUI updates of a tkinter widget.
+
+        Event handlers mark the parts of the GUI they changed as dirty and the
+        update runs once on the next idle cycle of tkinter for all the events
+        handled before it. A burst of mouse motion or key repeat events then
+        causes one update instead of one per event.
+    """
+
+    # parts of the GUI that can be marked dirty
+    LABELS = 1
+    MENUS = 2
+    OVERLAY = 4
+    FRAME = 8
+    # only the box of the active annotation has changed
+    ACTIVE_BOX = 16
+    ALL = LABELS | MENUS | OVERLAY | FRAME | ACTIVE_BOX
+
+    def __init__(self, widget, update_callback):
+        """
+            update_callback is called with the dirty flags as argument
+        """
+
+        self.widget = widget
+        self.update_callback = update_callback
+
+        self._dirty = 0
+        self._scheduled = False
+
+        # number of update requests merged into an already scheduled update
+        self.coalesced = 0
+        self.updates = 0
+
+    def schedule(self, flags=ALL):
+
+        if self._scheduled:
+            self.coalesced += 1
+        else:
+            self._scheduled = True
+            self.widget.after_idle(self.flush)
+
+        self._dirty |= flags
+
+    def flush(self):
+
+        flags = self._dirty
+
+        self._dirty = 0
+        self._scheduled = False
+
+        self.updates += 1
+        self.update_callback(flags)
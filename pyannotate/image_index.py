@@ -0,0 +1,231 @@
+import os
+import re
+import json
+import bisect
+import logging
+
+# load logger
+logger = logging.getLogger("ImageIndex")
+
+
+def natural_sort_key(name):
+    """Sort key where the numbers in the name compare as numbers, img2.png < img10.png"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+class ImageIndex:
+    """
+        Deterministically ordered list of the image files in a folder.
+
+        The files of a directory are in natural order and come before the files
+        of its subdirectories, which are also visited in natural order. The
+        paths are stored compactly as a table of directories and the basenames
+        of the files grouped by directory. Symlinked directories are followed,
+        a directory reached again through a link, as in a symlink loop, is
+        indexed only the first time.
+
+        The listing of each directory is cached in a manifest file in the
+        folder. On the next scan only the directories whose modification time
+        has changed are listed again.
+
+        Example manifest:
+            {
+              "version" : 1,
+              "recursive" : true,
+              "extensions" : ["jpeg", "jpg", "png"],
+              "directories" : {
+                "." : {"mtime" : 1571234567.0, "files" : ["img1.png"], "subdirs" : ["day2"]},
+                "day2" : {"mtime" : 1571234568.0, "files" : ["img1.png"], "subdirs" : []}
+              }
+            }
+    """
+
+    manifest_name = '.pyannotate_index.json'
+    manifest_version = 1
+
+    def __init__(self, root, directories, directory_starts, basenames):
+
+        self.root = root
+
+        # directory paths relative to the root
+        self._directories = directories
+
+        # index of the first file of each directory in basenames
+        self._directory_starts = directory_starts
+
+        self._basenames = basenames
+
+    def __len__(self):
+        return len(self._basenames)
+
+    def __getitem__(self, index):
+
+        if index < 0:
+            index += len(self._basenames)
+
+        if not 0 <= index < len(self._basenames):
+            raise IndexError(f"Image index {index} out of range")
+
+        directory = self._directories[bisect.bisect_right(self._directory_starts, index) - 1]
+
+        return os.path.normpath(os.path.join(self.root, directory, self._basenames[index]))
+
+    def __iter__(self):
+        for index in range(len(self._basenames)):
+            yield self[index]
+
+    @classmethod
+    def manifest_path(cls, root):
+        return os.path.join(root, cls.manifest_name)
+
+    @classmethod
+    def scan(cls, root, extensions, recursive=False, use_manifest=True, save_manifest=True):
+        """
+            List the image files with the given extensions in root.
+
+            The listings in the manifest of a previous scan are reused for the
+            directories that have not changed. With save_manifest False an
+            existing manifest is used but nothing is written to the folder,
+            for folders that are only read.
+        """
+
+        extensions = sorted(ext.lower() for ext in extensions)
+
+        save_manifest = use_manifest and save_manifest
+
+        cached = dict()
+        if use_manifest:
+            cached = cls.load_manifest(root, extensions, recursive)
+        if save_manifest:
+            cls.create_manifest_file(root)
+
+        listings = dict()
+        rescanned = 0
+
+        # depth first in natural order, directory paths relative to the root
+        pending = ['.']
+        directories = []
+
+        # (device, inode) of the listed directories, a symlink loop or a second link to a directory is skipped
+        visited = set()
+
+        while pending:
+
+            directory = pending.pop()
+            path = os.path.join(root, directory)
+
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            if (stat.st_dev, stat.st_ino) in visited:
+                logger.info(f"Skipping directory {path}, it has already been indexed")
+                continue
+            visited.add((stat.st_dev, stat.st_ino))
+
+            mtime = stat.st_mtime
+
+            listing = cached.get(directory)
+
+            if listing is None or listing['mtime'] != mtime:
+                listing = cls.list_directory(path, extensions, mtime)
+                rescanned += 1
+
+            listings[directory] = listing
+            directories.append(directory)
+
+            if recursive:
+                # reversed so that the first subdirectory is popped first
+                for subdir in reversed(listing['subdirs']):
+                    pending.append(os.path.normpath(os.path.join(directory, subdir)))
+
+        directory_starts = []
+        basenames = []
+        for directory in directories:
+            directory_starts.append(len(basenames))
+            basenames.extend(listings[directory]['files'])
+
+        logger.info(f"Indexed {len(basenames)} images in {len(directories)} directories, listed {rescanned} directories")
+
+        if save_manifest and rescanned > 0:
+            cls.save_manifest(root, extensions, recursive, listings)
+
+        return cls(root, directories, directory_starts, basenames)
+
+    @staticmethod
+    def list_directory(path, extensions, mtime):
+
+        files = []
+        subdirs = []
+
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                # take extension without dot, .png -> png
+                elif os.path.splitext(entry.name)[1][1:].lower() in extensions:
+                    files.append(entry.name)
+
+        files.sort(key=natural_sort_key)
+        subdirs.sort(key=natural_sort_key)
+
+        return {'mtime': mtime, 'files': files, 'subdirs': subdirs}
+
+    @classmethod
+    def load_manifest(cls, root, extensions, recursive):
+        """Return the cached directory listings, or an empty dict if there is no usable manifest"""
+
+        manifest = cls.manifest_path(root)
+
+        if not os.path.exists(manifest):
+            return dict()
+
+        try:
+            with open(manifest, 'r') as f:
+                json_data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read image index manifest {manifest}: {e}")
+            return dict()
+
+        if json_data.get('version') != cls.manifest_version or \
+           json_data.get('extensions') != extensions or \
+           json_data.get('recursive') != recursive:
+            return dict()
+
+        return json_data['directories']
+
+    @classmethod
+    def create_manifest_file(cls, root):
+        """
+            Creating a file changes the modification time of the directory, create
+            the manifest before the root directory is listed so that writing the
+            manifest does not invalidate the listing of the root directory
+        """
+        manifest = cls.manifest_path(root)
+
+        if os.path.exists(manifest):
+            return
+
+        try:
+            open(manifest, 'a').close()
+        except OSError as e:
+            logger.warning(f"Could not create image index manifest {manifest}: {e}")
+
+    @classmethod
+    def save_manifest(cls, root, extensions, recursive, listings):
+
+        manifest = cls.manifest_path(root)
+
+        root_json = {
+                    'version' : cls.manifest_version,
+                    'recursive' : recursive,
+                    'extensions' : extensions,
+                    'directories' : listings
+                    }
+
+        try:
+            with open(manifest, 'w') as f:
+                json.dump(root_json, f)
+        except OSError as e:
+            logger.warning(f"Could not store image index manifest {manifest}: {e}")
@@ -0,0 +1,84 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+# load logger
+logger = logging.getLogger("ImagePrefetcher")
+
+
+def load_image(image_path):
+    """
+        Read an image file
+
+        @return: rgb image as numpy array
+    """
+    frame = cv2.imread(image_path)
+
+    if frame is None:
+        raise OSError(f"Could not read image file at path: {image_path}")
+
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+class ImagePrefetcher:
+    """
+        Loads the images around the current image in a thread pool.
+
+        opencv releases the GIL while reading and decoding, so the images load
+        in parallel with each other and with the GUI. Loads that are not
+        started yet are cancelled when the window moves past them.
+    """
+
+    def __init__(self, image_paths, window=4, workers=4):
+
+        self.image_paths = image_paths
+        self.window = window
+
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+        # frame index -> Future of the rgb image
+        self._futures = dict()
+
+    def request(self, frame_index):
+        """Start loading the image if it is not loaded or loading yet"""
+
+        future = self._futures.get(frame_index)
+
+        if future is None or future.cancelled():
+            future = self._executor.submit(load_image, self.image_paths[frame_index])
+            self._futures[frame_index] = future
+
+        return future
+
+    def move_to(self, frame_index):
+        """
+            Load the image at frame_index first, then window images before and
+            after it. Cancel the loads outside of the window.
+        """
+
+        first = max(frame_index - self.window, 0)
+        last = min(frame_index + self.window, len(self.image_paths) - 1)
+
+        for ind in list(self._futures.keys()):
+            if ind < first or ind > last:
+                self._futures.pop(ind).cancel()
+
+        self.request(frame_index)
+
+        for offset in range(1, self.window + 1):
+            for ind in (frame_index + offset, frame_index - offset):
+                if first <= ind <= last:
+                    self.request(ind)
+
+    def is_ready(self, frame_index):
+        future = self._futures.get(frame_index)
+        return future is not None and future.done()
+
+    def get(self, frame_index):
+        """Return the image at frame_index, waits if it has not loaded yet"""
+        return self.request(frame_index).result()
+
+    def shutdown(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._executor.shutdown(wait=False)
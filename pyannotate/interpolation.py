@@ -0,0 +1,56 @@
+import logging
+
+import numpy as np
+
+# load logger
+logger = logging.getLogger("Interpolation")
+
+
+def linear_interpolation(key_frames, key_boxes, frames):
+    """
+        Boxes moving linearly between the keyframes.
+
+        key_frames is an ascending int array of the keyframe indices, key_boxes
+        a float array [keyframes, 4] of their (x1, y1, x2, y2) coordinates and
+        frames the int array of the frames to interpolate, between the first
+        and the last keyframe. Returns a float array [frames, 4].
+    """
+
+    # keyframe before each frame
+    ind = np.clip(np.searchsorted(key_frames, frames, side='right') - 1, 0, len(key_frames) - 2)
+
+    t = (frames - key_frames[ind]) / (key_frames[ind + 1] - key_frames[ind])
+
+    return key_boxes[ind] + t[:, None] * (key_boxes[ind + 1] - key_boxes[ind])
+
+
+def hold_interpolation(key_frames, key_boxes, frames):
+    """Boxes staying where they are on the previous keyframe"""
+
+    ind = np.searchsorted(key_frames, frames, side='right') - 1
+
+    return key_boxes[ind]
+
+
+# name -> interpolation function, the functions are called with the keyframes of a whole track
+INTERPOLATIONS = {
+    'linear': linear_interpolation,
+    'hold': hold_interpolation,
+}
+
+
+def interpolate_track(key_frames, key_boxes, frames, interpolation=linear_interpolation):
+    """
+        Coordinates of the boxes of a track in frames as a list of int tuples.
+        key_frames and frames are lists of frame indices, key_boxes the coordinates
+        of the boxes on the keyframes.
+    """
+
+    if len(frames) == 0:
+        return []
+
+    boxes = interpolation(np.asarray(key_frames, dtype=np.int64),
+                          np.asarray(key_boxes, dtype=np.float64),
+                          np.asarray(frames, dtype=np.int64))
+
+    return [tuple(box) for box in np.rint(boxes).astype(int).tolist()]
@@ -0,0 +1,160 @@
+import os
+import json
+import bisect
+import logging
+import cv2
+
+# load logger
+logger = logging.getLogger("KeyframeIndex")
+
+
+class KeyframeIndex:
+    """
+        The true frame count and the keyframe positions of a video.
+
+        CAP_PROP_FRAME_COUNT is only the estimate stored in the container, the
+        index is built by going through every packet of the video once. The
+        index is stored in a sidecar file next to the video and it is rebuilt
+        if the size or the modification time of the video changes.
+
+        Example sidecar file:
+            {
+              "video_size" : 123456,
+              "video_mtime" : 1571234567.0,
+              "frame_count" : 300,
+              "keyframes" : [0, 12, 24]
+            }
+    """
+
+    sidecar_suffix = '.keyframes.json'
+
+    def __init__(self, frame_count, keyframes, video_size=None, video_mtime=None):
+
+        self.frame_count = frame_count
+
+        # sorted list of the frame indices of keyframes
+        self.keyframes = keyframes
+
+        self.video_size = video_size
+        self.video_mtime = video_mtime
+
+    @classmethod
+    def sidecar_path(cls, video_file):
+        return video_file + cls.sidecar_suffix
+
+    @classmethod
+    def load_or_build(cls, video_file):
+        """
+            Load the index from the sidecar file of the video if it is up to date,
+            otherwise index the video and store the index for the next time.
+        """
+
+        index = cls.load(video_file)
+
+        if index is None:
+            index = cls.build(video_file)
+            index.save(video_file)
+
+        return index
+
+    @classmethod
+    def load(cls, video_file):
+        """
+            Return the index stored next to the video or None if there is no
+            index or the video has changed after indexing
+        """
+
+        sidecar = cls.sidecar_path(video_file)
+
+        if not os.path.exists(sidecar):
+            return None
+
+        try:
+            with open(sidecar, 'r') as f:
+                json_data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read keyframe index {sidecar}: {e}")
+            return None
+
+        stat = os.stat(video_file)
+        if json_data.get('video_size') != stat.st_size or json_data.get('video_mtime') != stat.st_mtime:
+            logger.info(f"Video {video_file} has changed after indexing, indexing again")
+            return None
+
+        return cls(json_data['frame_count'], json_data['keyframes'], stat.st_size, stat.st_mtime)
+
+    @classmethod
+    def build(cls, video_file):
+        """
+            Go through the video once to count the frames and find the keyframes.
+
+            The capture is opened in raw mode so that the packets are only demuxed
+            and not decoded. If the opencv build does not report keyframes, 
+            the keyframe list is left empty and only the frame count is indexed.
+        """
+
+        stat = os.stat(video_file)
+
+        logger.info(f"Indexing keyframes of {video_file}")
+
+        has_key_frame_prop = hasattr(cv2, 'CAP_PROP_LRF_HAS_KEY_FRAME')
+
+        cap = None
+        if has_key_frame_prop:
+            cap = cv2.VideoCapture(video_file, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+            if not cap.isOpened():
+                cap = None
+
+        if cap is None:
+            has_key_frame_prop = False
+            cap = cv2.VideoCapture(video_file)
+
+        if not cap.isOpened():
+            raise IOError(f"Couldn't open video {video_file} for indexing")
+
+        frame_count = 0
+        keyframes = []
+
+        while cap.grab():
+            if has_key_frame_prop and cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                keyframes.append(frame_count)
+            frame_count += 1
+
+        cap.release()
+
+        logger.info(f"Found {frame_count} frames and {len(keyframes)} keyframes")
+
+        return cls(frame_count, keyframes, stat.st_size, stat.st_mtime)
+
+    def save(self, video_file):
+
+        sidecar = self.sidecar_path(video_file)
+
+        root = {
+                'video_size' : self.video_size,
+                'video_mtime' : self.video_mtime,
+                'frame_count' : self.frame_count,
+                'keyframes' : self.keyframes
+                }
+
+        try:
+            with open(sidecar, 'w') as f:
+                json.dump(root, f)
+        except OSError as e:
+            logger.warning(f"Could not store keyframe index to {sidecar}: {e}")
+
+    @property
+    def has_keyframes(self):
+        return len(self.keyframes) > 0
+
+    def preceding_keyframe(self, frame_index):
+        """
+            Return the index of the last keyframe at or before frame_index
+        """
+
+        position = bisect.bisect_right(self.keyframes, frame_index)
+
+        if position == 0:
+            return 0
+
+        return self.keyframes[position - 1]
@@ -0,0 +1,115 @@
+import tkinter
+import logging
+
+# load logger
+logger = logging.getLogger("ObjectSelector")
+
+
+class ObjectSelector(tkinter.Frame):
+    """
+        Selector for the object ids of the current frame.
+
+        Frames with a few objects get an OptionMenu. For crowded frames with more
+        than list_threshold objects the OptionMenu is replaced by a list that
+        can be filtered by typing a part of the object id.
+
+        The options are only rebuilt when the key given to set_options changes,
+        for example the frame index and the version of the annotations in it.
+    """
+
+    def __init__(self, parent, variable, command, list_threshold=30, width=20):
+        """
+            variable holds the selected object id and command is called with
+            the selected object id as argument
+        """
+
+        super().__init__(parent)
+
+        self.variable = variable
+        self.command = command
+        self.list_threshold = list_threshold
+
+        self._options = []
+        self._shown_options = []
+        self._key = None
+        self._list_mode = False
+
+        # few objects
+        self.option_menu = tkinter.OptionMenu(self, self.variable, -1)
+        self.option_menu.config(width=width)
+
+        # many objects
+        self.search_parent = tkinter.Frame(self)
+
+        self.filter_string = tkinter.StringVar()
+        self.filter_string.trace_add('write', lambda *args: self.apply_filter())
+        self.filter_entry = tkinter.Entry(self.search_parent, textvariable=self.filter_string, width=width)
+        # do not pass the typed characters on to the keyboard shortcuts of the window
+        self.filter_entry.bindtags((str(self.filter_entry), 'Entry'))
+        self.filter_entry.pack(fill=tkinter.X)
+
+        self.listbox = tkinter.Listbox(self.search_parent, height=6, width=width, exportselection=False)
+        self.scrollbar = tkinter.Scrollbar(self.search_parent, command=self.listbox.yview)
+        self.listbox.config(yscrollcommand=self.scrollbar.set)
+        self.listbox.pack(side=tkinter.LEFT, fill=tkinter.BOTH)
+        self.scrollbar.pack(side=tkinter.LEFT, fill=tkinter.Y)
+        self.listbox.bind('<<ListboxSelect>>', self.list_selected)
+
+        self.option_menu.pack()
+
+    def set_options(self, options, key=None):
+        """
+            Show the options, does nothing if key is the same as for the
+            previous call. Returns whether the options were rebuilt.
+        """
+
+        if key is not None and key == self._key:
+            return False
+
+        self._key = key
+        self._options = list(options)
+
+        list_mode = len(self._options) > self.list_threshold
+
+        if list_mode != self._list_mode:
+            if list_mode:
+                self.option_menu.pack_forget()
+                self.search_parent.pack()
+            else:
+                self.search_parent.pack_forget()
+                self.option_menu.pack()
+            self._list_mode = list_mode
+
+        if list_mode:
+            self.apply_filter()
+        else:
+            menu = self.option_menu['menu']
+
+            # delete previous values
+            menu.delete(0, "end")
+
+            # add new options
+            for option in self._options:
+                menu.add_command(label=option, command=tkinter._setit(self.variable, option, self.command))
+
+        return True
+
+    def apply_filter(self):
+
+        text = self.filter_string.get().strip()
+
+        self._shown_options = [option for option in self._options if text in str(option)]
+
+        self.listbox.delete(0, "end")
+        self.listbox.insert("end", *self._shown_options)
+
+    def list_selected(self, event):
+
+        selection = self.listbox.curselection()
+
+        if len(selection) == 0:
+            return
+
+        option = self._shown_options[selection[0]]
+        self.variable.set(option)
+        self.command(option)
@@ -0,0 +1,119 @@
+import os
+import threading
+import logging
+import cv2
+
+# load logger
+logger = logging.getLogger("ProxyVideo")
+
+
+class ProxyTranscoder(threading.Thread):
+    """
+        Transcodes a video once in the background into a downscaled MJPEG proxy
+        video next to the original video.
+
+        Every frame of a MJPEG video is an intra frame, so seeking in the proxy is
+        cheap and the small frames are fast to decode and display. The proxy has
+        the same frames as the original, frame n of the proxy is frame n of the
+        original video.
+
+        The proxy is written to a temporary file that is renamed when the whole
+        video has been transcoded, so a proxy file always is complete. An
+        existing proxy newer than the video is reused.
+    """
+
+    def __init__(self, video_file, proxy_width=960):
+
+        super().__init__(daemon=True)
+
+        self.video_file = video_file
+        self.proxy_width = proxy_width
+        self.proxy_file = f"{video_file}.proxy{proxy_width}.avi"
+
+        # the proxy frame size divided by the original frame size
+        self.scale = 1.0
+
+        self.frames_done = 0
+        self.frame_count = 0
+
+        # set when the proxy file is complete and can be opened
+        self.finished = threading.Event()
+
+        self._running = True
+
+    @property
+    def progress(self):
+        if self.finished.is_set():
+            return 1.0
+        if self.frame_count > 0:
+            return min(self.frames_done / self.frame_count, 1.0)
+        return 0.0
+
+    def proxy_up_to_date(self):
+        return os.path.exists(self.proxy_file) and \
+            os.path.getmtime(self.proxy_file) >= os.path.getmtime(self.video_file)
+
+    def run(self):
+
+        cap = cv2.VideoCapture(self.video_file)
+
+        if not cap.isOpened():
+            logger.error(f"Couldn't open video {self.video_file} for transcoding a proxy")
+            return
+
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        self.scale = self.proxy_width / width
+        proxy_size = (self.proxy_width, max(int(round(height * self.scale)), 1))
+
+        if self.proxy_up_to_date():
+            logger.info(f"Using existing proxy video {self.proxy_file}")
+            cap.release()
+            self.finished.set()
+            return
+
+        logger.info(f"Transcoding proxy video {self.proxy_file} with frame size {proxy_size}")
+
+        # the writer chooses the container from the extension, keep .avi at the end
+        temp_file = self.proxy_file + '.part.avi'
+
+        writer = cv2.VideoWriter(temp_file, cv2.VideoWriter_fourcc(*'MJPG'), fps, proxy_size)
+
+        # the partial proxy is removed unless it is moved in place, also when reading or writing raises
+        try:
+            if not writer.isOpened():
+                logger.error(f"Couldn't open proxy video {temp_file} for writing")
+                return
+
+            completed = False
+            while self._running:
+                success, frame = cap.read()
+                if not success:
+                    completed = True
+                    break
+                writer.write(cv2.resize(frame, proxy_size, interpolation=cv2.INTER_AREA))
+                self.frames_done += 1
+
+            writer.release()
+
+            if completed:
+                os.replace(temp_file, self.proxy_file)
+                logger.info(f"Proxy video {self.proxy_file} ready")
+                self.finished.set()
+
+        except Exception:
+            logger.exception(f"Transcoding proxy video {self.proxy_file} failed")
+
+        finally:
+            writer.release()
+            cap.release()
+            if not self.finished.is_set() and os.path.exists(temp_file):
+                os.remove(temp_file)
+
+    def stop(self):
+        self._running = False
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,248 @@
+import os
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+import cv2
+
+from pyannotate.annotation_holder import Annotations
+from pyannotate.annotation_loader import AnnotationLoader
+from pyannotate.annotation_object import BoxAnnotation, class_colors, hex_to_rgb, merge_class_names
+from pyannotate.keyframe_index import KeyframeIndex
+from pyannotate.video_reader import VideoReader
+
+# load logger
+logger = logging.getLogger("RenderAnnotations")
+
+# output extension -> fourcc of the codec the video and its segments are written with
+FOURCCS = {
+    '.avi': 'MJPG',
+    '.mp4': 'mp4v',
+    '.mkv': 'mp4v',
+}
+
+
+def draw_detections(frame, detections, colors):
+    """Draw the boxes with their class names and object ids on an rgb frame"""
+
+    for detection in detections:
+
+        annotation = BoxAnnotation.from_detection_json(detection)
+        annotation.color = colors.get(annotation.class_name, '#ffffff')
+
+        annotation.draw_annotation_to_array(frame, annotation.color)
+
+        x1, y1 = min(annotation.coords[0], annotation.coords[2]), min(annotation.coords[1], annotation.coords[3])
+
+        cv2.putText(frame, f"{annotation.class_name} {annotation.obj_id}", (x1, max(y1 - 5, 12)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, hex_to_rgb(annotation.color[1:]), 1, cv2.LINE_AA)
+
+
+def render_segment(video_file, start, end, frames, colors, segment_file, fourcc, fps):
+    """
+        Render the frames start:end of the video to segment_file in a worker process.
+
+        The worker opens its own capture and decodes its frames in order. frames
+        is a dict of frame index -> detections as json dicts of the annotated frames.
+
+        @return: number of frames written
+    """
+
+    reader = VideoReader(cv2.VideoCapture(video_file), KeyframeIndex.load(video_file))
+
+    writer = cv2.VideoWriter(segment_file, cv2.VideoWriter_fourcc(*fourcc), fps,
+                             (reader.frame_width, reader.frame_height))
+
+    written = 0
+
+    for frame_index in range(start, end):
+
+        try:
+            frame = reader.read(frame_index)
+        except IOError:
+            logger.warning(f"Could not read frame {frame_index}, the segment ends there")
+            break
+
+        draw_detections(frame, frames.get(frame_index, ()), colors)
+
+        writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        written += 1
+
+    writer.release()
+    reader.release()
+
+    return written
+
+
+def concatenate_segments(segment_files, output_file, fourcc, fps):
+    """
+        Join the segments into the output video. With ffmpeg the segments are copied
+        without encoding, otherwise they are decoded and written again with OpenCV.
+    """
+
+    if len(segment_files) == 1:
+        shutil.move(segment_files[0], output_file)
+        return
+
+    ffmpeg = shutil.which('ffmpeg')
+
+    if ffmpeg is not None:
+
+        list_file = output_file + '.segments.txt'
+        with open(list_file, 'w') as f:
+            for segment_file in segment_files:
+                f.write(f"file '{os.path.abspath(segment_file)}'\n")
+
+        result = subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                                 '-i', list_file, '-c', 'copy', output_file])
+        os.remove(list_file)
+
+        if result.returncode == 0:
+            return
+
+        logger.warning("Concatenating the segments with ffmpeg failed, writing them again with OpenCV")
+
+    writer = None
+
+    for segment_file in segment_files:
+
+        cap = cv2.VideoCapture(segment_file)
+
+        while True:
+            success, frame = cap.read()
+            if not success:
+                break
+            if writer is None:
+                writer = cv2.VideoWriter(output_file, cv2.VideoWriter_fourcc(*fourcc), fps,
+                                         (frame.shape[1], frame.shape[0]))
+            writer.write(frame)
+
+        cap.release()
+
+    if writer is not None:
+        writer.release()
+
+
+def render_annotations(video_file, annotation_file, output_file, processes=None, segment_count=None,
+                       start=0, end=None, annotation_class_file=None):
+    """
+        Write a copy of the video with the annotations drawn on it. The frame range is split
+        into segments that are rendered in parallel in a process pool and then concatenated.
+        Returns the number of frames rendered.
+
+        The classes are listed as in Annotations, the class file or the default classes
+        followed by the other classes of the annotation file, so the colors are the ones
+        the annotator shows with the same class file.
+    """
+
+    fourcc = FOURCCS.get(os.path.splitext(output_file)[1].lower(), 'mp4v')
+
+    loader = AnnotationLoader()
+    frame_annotations, file_class_names, _ = loader.load_annotation_file(annotation_file)
+
+    reader = VideoReader(cv2.VideoCapture(video_file), KeyframeIndex.load(video_file))
+    fps = reader.fps
+    frame_count = min(reader.frame_count, len(frame_annotations))
+    reader.release()
+
+    end = frame_count if end is None else min(end, frame_count)
+
+    if end <= start:
+        raise ValueError(f"No frames to render between {start} and {end}")
+
+    processes = processes if processes is not None else max(multiprocessing.cpu_count() - 1, 1)
+    segment_count = segment_count if segment_count is not None else processes
+    segment_length = max(-(-(end - start) // segment_count), 1)
+
+    class_names = Annotations.load_class_names(Annotations._defaults['annotation_classes'], annotation_class_file)
+    colors = class_colors(merge_class_names(class_names, file_class_names))
+
+    # the workers get the detections of their frames, they do not load the annotation file
+    annotated_frames = frame_annotations.annotated_frame_indices()
+
+    started = time.monotonic()
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_file))) as segment_dir:
+
+        segments = []
+        for segment_start in range(start, end, segment_length):
+            segment_end = min(segment_start + segment_length, end)
+            frames = {frame_ind: frame_annotations.frame_json(frame_ind) for frame_ind in annotated_frames
+                      if segment_start <= frame_ind < segment_end}
+            segment_file = os.path.join(segment_dir, f"segment_{len(segments):04d}{os.path.splitext(output_file)[1]}")
+            segments.append((video_file, segment_start, segment_end, frames, colors, segment_file, fourcc, fps))
+
+        frame_annotations.close()
+
+        print(f"Rendering frames {start}-{end} of {video_file} in {len(segments)} segments with {processes} processes")
+
+        # workers are started clean, like the thumbnail workers
+        with multiprocessing.get_context('spawn').Pool(min(processes, len(segments))) as pool:
+            frames_written = sum(pool.starmap(render_segment, segments))
+
+        rendered = time.monotonic()
+
+        concatenate_segments([segment[5] for segment in segments], output_file, fourcc, fps)
+
+    finished = time.monotonic()
+
+    print(f"Rendered {frames_written} frames in {rendered - started:.1f} s ({frames_written / max(rendered - started, 1e-9):.1f} fps), "
+          f"concatenated in {finished - rendered:.1f} s, total {frames_written / max(finished - started, 1e-9):.1f} fps")
+
+    return frames_written
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Draw the annotations on a video without the user interface, the frames are rendered in parallel.')
+
+    parser.add_argument('video', type=str,
+                        help='the annotated video')
+
+    parser.add_argument('annotation_file', type=str,
+                        help='json, binary or SQLite annotation file of the video')
+
+    parser.add_argument('output_file', type=str,
+                        help='rendered video, MJPG for .avi and mp4v for other extensions')
+
+    parser.add_argument(
+        '--class_file', type=str,
+        help='path to annotation classes file given to the annotator, the colors follow its order'
+    )
+
+    parser.add_argument(
+        '--processes', type=int, default=None,
+        help='number of worker processes, by default one less than the number of cpus'
+    )
+
+    parser.add_argument(
+        '--segments', type=int, default=None,
+        help='number of segments the frames are split into, by default one per process'
+    )
+
+    parser.add_argument(
+        '--start', type=int, default=0,
+        help='first frame to render'
+    )
+
+    parser.add_argument(
+        '--end', type=int, default=None,
+        help='frame to stop rendering at, by default the end of the video'
+    )
+
+    args = parser.parse_args()
+
+    render_annotations(args.video, args.annotation_file, args.output_file,
+                       processes=args.processes,
+                       segment_count=args.segments,
+                       start=args.start,
+                       end=args.end,
+                       annotation_class_file=args.class_file)
+
+
+if __name__ == '__main__':
+    main()
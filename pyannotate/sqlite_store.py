@@ -0,0 +1,266 @@
+import os
+import array
+import json
+import sqlite3
+import logging
+import threading
+
+from pyannotate.frame_store import FrameStore, SnapshotFrameStore
+
+# load logger
+logger = logging.getLogger("SqliteStore")
+
+SQLITE_EXTENSIONS = ('.sqlite', '.sqlite3', '.db')
+SQLITE_MAGIC = b'SQLite format 3\0'
+SQLITE_VERSION = 1
+
+# keys of the detection json stored in their own columns, the rest are stored as json in the extras column
+DETECTION_KEYS = ('class_name', 'class_id', 'object_id', 'object_coords')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS detections (
+    frame INTEGER NOT NULL,
+    object_id INTEGER NOT NULL,
+    class_name TEXT NOT NULL,
+    class_id INTEGER NOT NULL,
+    x1 INTEGER NOT NULL,
+    y1 INTEGER NOT NULL,
+    x2 INTEGER NOT NULL,
+    y2 INTEGER NOT NULL,
+    extras TEXT
+);
+CREATE INDEX IF NOT EXISTS detections_frame ON detections (frame);
+CREATE INDEX IF NOT EXISTS detections_object ON detections (object_id, frame);
+CREATE INDEX IF NOT EXISTS detections_class ON detections (class_name, frame);
+"""
+
+
+def is_sqlite_file(file_path):
+    """Check the extension or the magic bytes in the beginning of an existing file"""
+
+    if os.path.exists(file_path):
+        with open(file_path, 'rb') as f:
+            return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+    return os.path.splitext(file_path)[1].lower() in SQLITE_EXTENSIONS
+
+
+def detection_to_row(frame_ind, detection):
+
+    point1, point2 = detection['object_coords']
+
+    extras = {key: value for key, value in detection.items() if key not in DETECTION_KEYS}
+
+    return (frame_ind, detection['object_id'], detection['class_name'], detection['class_id'],
+            point1['x'], point1['y'], point2['x'], point2['y'],
+            json.dumps(extras) if extras else None)
+
+
+def row_to_detection(row):
+
+    object_id, class_name, class_id, x1, y1, x2, y2, extras = row
+
+    detection = {
+                'class_name' : class_name,
+                'class_id' : class_id,
+                'object_id' : object_id,
+                'object_coords' : [
+                    {'x' : x1, 'y' : y1},
+                    {'x' : x2, 'y' : y2}
+                ]
+    }
+
+    if extras is not None:
+        detection.update(json.loads(extras))
+
+    return detection
+
+
+class SqliteFrameStore(FrameStore):
+    """
+        Frames read on demand from a SQLite database with one row per detection.
+
+        The detections are indexed by frame, object id and class name, so the
+        frames of an object or the boxes of a class are found without reading
+        all the frames. Saving replaces the rows of the accessed frames in one
+        transaction. The rows of frames past the frame count, left out by
+        resize, stay in the database but are not read.
+    """
+
+    # rows inserted per executemany call when importing
+    batch_size = 10000
+
+    def __init__(self, database_file, create_object, frame_count=None):
+        """
+            Opens the database, a new database is created if frame_count is given
+        """
+
+        self.database_file = database_file
+
+        # the connection is also used by the thread saving a snapshot
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(database_file, check_same_thread=False)
+
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+            if frame_count is not None:
+                self._connection.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                             [('version', str(SQLITE_VERSION)), ('frame_count', str(frame_count))])
+
+            meta = dict(self._connection.execute("SELECT key, value FROM meta"))
+
+        if 'frame_count' not in meta:
+            raise RuntimeError(f"No frame count in annotation database {database_file}")
+
+        super().__init__(int(meta['frame_count']), create_object)
+
+    def query(self, sql, parameters=()):
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def load_frame_json(self, frame_ind):
+
+        rows = self.query("SELECT object_id, class_name, class_id, x1, y1, x2, y2, extras "
+                          "FROM detections WHERE frame = ? ORDER BY rowid", (frame_ind,))
+
+        return [row_to_detection(row) for row in rows]
+
+    def stored_detection_count(self, frame_ind):
+        return self.query("SELECT count(*) FROM detections WHERE frame = ?", (frame_ind,))[0][0]
+
+    def stored_detection_counts(self):
+        """dict of frame index -> number of stored detections, for the frames that have detections"""
+        return dict(self.query("SELECT frame, count(*) FROM detections WHERE frame < ? GROUP BY frame",
+                               (self.frame_count,)))
+
+    def annotated_frame_indices(self):
+
+        frames = set(self.stored_detection_counts())
+
+        for frame_ind, annotations in self._materialized.items():
+            if len(annotations) > 0:
+                frames.add(frame_ind)
+            else:
+                frames.discard(frame_ind)
+
+        return sorted(frames)
+
+    def total_detection_count(self):
+
+        counts = self.stored_detection_counts()
+
+        for frame_ind, annotations in self._materialized.items():
+            counts[frame_ind] = len(annotations)
+
+        return sum(counts.values())
+
+    def stored_object_frames(self):
+
+        object_frames = dict()
+
+        rows = self.query("SELECT DISTINCT object_id, frame FROM detections WHERE frame < ? ORDER BY object_id, frame",
+                          (self.frame_count,))
+
+        for object_id, frame_ind in rows:
+            object_frames.setdefault(object_id, array.array('i')).append(frame_ind)
+
+        return object_frames
+
+    def class_names(self):
+        return {row[0] for row in self.query("SELECT DISTINCT class_name FROM detections")}
+
+    def object_ids(self):
+        return {row[0] for row in self.query("SELECT DISTINCT object_id FROM detections")}
+
+    def frames_with_object(self, object_id):
+        """Indices of the frames that contain the object"""
+
+        frames = {row[0] for row in self.query("SELECT DISTINCT frame FROM detections WHERE object_id = ? AND frame < ?",
+                                               (object_id, self.frame_count))}
+
+        for frame_ind, annotations in self._materialized.items():
+            if any(annotation.obj_id == object_id for annotation in annotations):
+                frames.add(frame_ind)
+            else:
+                frames.discard(frame_ind)
+
+        return sorted(frames)
+
+    def detections_of_class(self, class_name):
+        """List of (frame index, detection json) of the boxes of the class"""
+
+        rows = self.query("SELECT frame, object_id, class_name, class_id, x1, y1, x2, y2, extras "
+                          "FROM detections WHERE class_name = ? AND frame < ? ORDER BY frame, rowid",
+                          (class_name, self.frame_count))
+
+        detections = [(row[0], row_to_detection(row[1:])) for row in rows if row[0] not in self._materialized]
+
+        for frame_ind, annotations in self._materialized.items():
+            detections.extend((frame_ind, annotation.detection_to_json())
+                              for annotation in annotations if annotation.class_name == class_name)
+
+        return sorted(detections, key=lambda detection: detection[0])
+
+    def write_frames(self, frames):
+        """Replace the stored detections of the frames in a dict of frame index -> detections as json dicts"""
+
+        rows = [detection_to_row(frame_ind, detection)
+                for frame_ind, detections in frames.items() for detection in detections]
+
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM detections WHERE frame = ?", [(frame_ind,) for frame_ind in frames])
+            self._connection.executemany("INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def import_frames(self, annotations):
+        """Insert the detections of all the frames of another store, committed in batches"""
+
+        rows = []
+
+        for frame_ind in annotations.annotated_frame_indices():
+
+            rows.extend(detection_to_row(frame_ind, detection) for detection in annotations.frame_json(frame_ind))
+
+            if len(rows) >= self.batch_size:
+                self.insert_rows(rows)
+                rows = []
+
+        self.insert_rows(rows)
+
+    def insert_rows(self, rows):
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def close(self):
+        self._connection.close()
+
+
+def save_sqlite_file(file_path, annotations):
+    """
+        Save the annotations to a SQLite database. When the annotations were loaded
+        from the same database, only the frames that have been accessed are written.
+        Otherwise a new database is written next to the target and moved in place.
+    """
+
+    storage = annotations.storage if isinstance(annotations, FrameStore) else None
+
+    if isinstance(storage, SqliteFrameStore) and os.path.exists(file_path) and \
+       os.path.samefile(storage.database_file, file_path):
+        storage.write_frames(annotations.accessed_frames_json())
+        return
+
+    tmp_path = file_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    if not isinstance(annotations, FrameStore):
+        annotations = SnapshotFrameStore(len(annotations),
+                                         {frame_ind: [detection.detection_to_json() for detection in frame]
+                                          for frame_ind, frame in enumerate(annotations) if len(frame) > 0})
+
+    database = SqliteFrameStore(tmp_path, None, frame_count=len(annotations))
+    database.import_frames(annotations)
+    database.close()
+
+    os.replace(tmp_path, file_path)
@@ -0,0 +1,239 @@
+import os
+import json
+import hashlib
+import queue
+import logging
+import threading
+import multiprocessing
+import cv2
+
+from pyannotate.keyframe_index import KeyframeIndex
+from pyannotate.video_reader import VideoReader
+
+# load logger
+logger = logging.getLogger("ThumbnailTimeline")
+
+
+def thumbnail_path(cache_dir, frame_index, thumbnail_size):
+    width, height = thumbnail_size
+    return os.path.join(cache_dir, f"thumb_{width}x{height}_{frame_index}.jpg")
+
+
+def user_cache_dir(video_file):
+    """Thumbnail cache directory of a video in the cache directory of the user"""
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    video_hash = hashlib.sha1(os.path.abspath(video_file).encode('utf-8')).hexdigest()
+
+    return os.path.join(cache_home, 'pyannotate', 'thumbs', video_hash)
+
+
+def decode_segment(video_file, frame_indices, thumbnail_size, cache_dir):
+    """
+        Decode the thumbnails of one segment of the video in a worker process.
+
+        Each worker opens its own capture and goes through its frames in order,
+        the thumbnails are written to the cache directory.
+
+        @return: list of (frame_index, thumbnail_path), the path is None for frames that could not be read
+    """
+
+    reader = VideoReader(cv2.VideoCapture(video_file), KeyframeIndex.load(video_file))
+
+    thumbnails = []
+
+    for frame_index in sorted(frame_indices):
+        try:
+            frame = reader.read_bgr(frame_index)
+        except IOError:
+            thumbnails.append((frame_index, None))
+            continue
+
+        path = thumbnail_path(cache_dir, frame_index, thumbnail_size)
+        cv2.imwrite(path, cv2.resize(frame, thumbnail_size, interpolation=cv2.INTER_AREA))
+        thumbnails.append((frame_index, path))
+
+    reader.release()
+
+    return thumbnails
+
+
+class ThumbnailGenerator:
+    """
+        Generates evenly spaced thumbnails of a video with a process pool.
+
+        The thumbnails are split into segments of consecutive thumbnails that
+        are decoded in parallel. Thumbnails are cached in a directory next to
+        the video, or in the user cache directory if the folder of the video
+        can not be written. Without a usable cache directory the thumbnails are
+        given as failed. Finished thumbnails are collected with poll() without
+        blocking, so a GUI can show them as they arrive.
+
+        The cache is discarded if the size or the modification time of the
+        video has changed after caching, like the keyframe index. A segment
+        whose worker fails is decoded again max_retries times, after that its
+        thumbnails are given as failed.
+
+        Example cache manifest:
+            {
+              "video_size" : 123456,
+              "video_mtime" : 1571234567.0
+            }
+    """
+
+    manifest_name = 'manifest.json'
+
+    # times a failed segment is decoded again
+    max_retries = 1
+
+    def __init__(self, video_file, frame_count, thumbnail_count, thumbnail_size, segment_count=None, processes=None):
+
+        self.video_file = video_file
+        self.thumbnail_size = thumbnail_size
+        self.cache_dir = video_file + '.thumbs'
+
+        self.frame_indices = [frame_count * ind // thumbnail_count for ind in range(thumbnail_count)]
+
+        self.processes = processes if processes is not None else max(multiprocessing.cpu_count() - 1, 1)
+        self.segment_count = segment_count if segment_count is not None else 2 * self.processes
+
+        # (frame_index, thumbnail_path) tuples from the worker processes, the path is None for failed thumbnails
+        self._finished = queue.Queue()
+        self._pool = None
+
+        # segments submitted to the pool and not finished, the pool is closed when it reaches 0
+        self._pending_segments = 0
+        self._pending_lock = threading.Lock()
+
+    def validate_cache(self):
+        """Remove the cached thumbnails if the video has changed after they were cached"""
+
+        stat = os.stat(self.video_file)
+        video_stat = {'video_size': stat.st_size, 'video_mtime': stat.st_mtime}
+
+        manifest_path = os.path.join(self.cache_dir, self.manifest_name)
+
+        try:
+            with open(manifest_path, 'r') as f:
+                if json.load(f) == video_stat:
+                    return
+        except (OSError, ValueError):
+            pass
+
+        stale = [name for name in os.listdir(self.cache_dir) if name.startswith('thumb_')]
+        if stale:
+            logger.info(f"Video {self.video_file} has changed after caching the thumbnails, decoding them again")
+
+        for name in stale:
+            os.remove(os.path.join(self.cache_dir, name))
+
+        with open(manifest_path, 'w') as f:
+            json.dump(video_stat, f)
+
+    def open_cache(self):
+        """Create and validate the cache directory, returns False if no cache directory can be written"""
+
+        for cache_dir in (self.cache_dir, user_cache_dir(self.video_file)):
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                if os.access(cache_dir, os.W_OK):
+                    self.cache_dir = cache_dir
+                    self.validate_cache()
+                    return True
+                logger.warning(f"Could not use thumbnail cache {cache_dir}: the directory is not writable")
+            except OSError as e:
+                logger.warning(f"Could not use thumbnail cache {cache_dir}: {e}")
+
+        return False
+
+    def start(self):
+
+        if not self.open_cache():
+            logger.warning(f"No thumbnail cache for video {self.video_file}, the thumbnails are not shown")
+            for frame_index in self.frame_indices:
+                self._finished.put((frame_index, None))
+            return
+
+        missing = []
+        for frame_index in self.frame_indices:
+            path = thumbnail_path(self.cache_dir, frame_index, self.thumbnail_size)
+            if os.path.exists(path):
+                self._finished.put((frame_index, path))
+            else:
+                missing.append(frame_index)
+
+        if len(missing) == 0:
+            return
+
+        logger.info(f"Decoding {len(missing)} thumbnails in {self.processes} processes")
+
+        segment_length = max(-(-len(missing) // self.segment_count), 1)
+
+        # the gui process should not be forked, start clean worker processes
+        self._pool = multiprocessing.get_context('spawn').Pool(min(self.processes, len(missing)))
+
+        for start in range(0, len(missing), segment_length):
+            self.submit_segment(missing[start:start + segment_length])
+
+    def submit_segment(self, frame_indices, retries=0):
+        """Decode a segment in the pool, the callbacks run in the result thread of the pool"""
+
+        def segment_finished(thumbnails):
+            for thumbnail in thumbnails:
+                self._finished.put(thumbnail)
+            self.segment_done()
+
+        def segment_failed(error):
+
+            if retries < self.max_retries and self._pool is not None:
+                logger.error(f"Decoding the thumbnails of frames {frame_indices[0]}-{frame_indices[-1]} failed, "
+                             f"decoding them again: {error}")
+                self.submit_segment(frame_indices, retries + 1)
+            else:
+                logger.error(f"Decoding the thumbnails of frames {frame_indices[0]}-{frame_indices[-1]} failed: {error}")
+                for frame_index in frame_indices:
+                    self._finished.put((frame_index, None))
+
+            self.segment_done()
+
+        with self._pending_lock:
+            self._pending_segments += 1
+
+        self._pool.apply_async(decode_segment,
+                               (self.video_file, frame_indices, self.thumbnail_size, self.cache_dir),
+                               callback=segment_finished, error_callback=segment_failed)
+
+    def segment_done(self):
+
+        with self._pending_lock:
+            self._pending_segments -= 1
+            # let the workers exit when nothing is left to decode
+            if self._pending_segments == 0 and self._pool is not None:
+                self._pool.close()
+
+    def poll(self):
+        """
+            Return the thumbnails finished after the previous call as a list of
+            (frame_index, rgb thumbnail) tuples, the thumbnail is None if it failed
+        """
+
+        thumbnails = []
+
+        while True:
+            try:
+                frame_index, path = self._finished.get_nowait()
+            except queue.Empty:
+                break
+
+            thumbnail = cv2.imread(path) if path is not None else None
+            if thumbnail is not None:
+                thumbnails.append((frame_index, cv2.cvtColor(thumbnail, cv2.COLOR_BGR2RGB)))
+            else:
+                thumbnails.append((frame_index, None))
+
+        return thumbnails
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
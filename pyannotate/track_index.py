@@ -0,0 +1,117 @@
+import array
+import bisect
+import logging
+
+# load logger
+logger = logging.getLogger("TrackIndex")
+
+
+class TrackIndex:
+    """
+        Index of object id -> the sorted frame indices the object appears in,
+        and the position of the objects in the frames that have been looked up.
+
+        The index is built from the stored frames, the frames edited after that
+        are given to update_frame. An object removed from an edited frame is
+        dropped from the index when a lookup comes across it.
+    """
+
+    def __init__(self, object_frames):
+        """
+            object_frames is a dict of object id -> ascending frame indices,
+            FrameStore.stored_object_frames
+        """
+
+        # object id -> array of the frame indices, may contain frames the object was removed from
+        self._frames = {object_id: frames if isinstance(frames, array.array) else array.array('i', frames)
+                        for object_id, frames in object_frames.items()}
+
+        # frame index -> object ids of the frames updated after building
+        self._frame_objects = dict()
+
+        # frame index -> {object id: position in the frame}
+        self._positions = dict()
+
+    def update_frame(self, frame_ind, object_ids):
+        """Call with the object ids of a frame after its annotations have changed"""
+
+        self._frame_objects[frame_ind] = set(object_ids)
+        self._positions.pop(frame_ind, None)
+
+        for object_id in self._frame_objects[frame_ind]:
+
+            frames = self._frames.setdefault(object_id, array.array('i'))
+
+            ind = bisect.bisect_left(frames, frame_ind)
+            if ind == len(frames) or frames[ind] != frame_ind:
+                frames.insert(ind, frame_ind)
+
+    def is_current(self, object_id, frame_ind):
+        """Whether an entry of the object is still valid, the frames not updated are as stored"""
+        frame_objects = self._frame_objects.get(frame_ind)
+        return frame_objects is None or object_id in frame_objects
+
+    def next_frame(self, object_id, frame_ind):
+        """The first frame after frame_ind the object appears in, or None"""
+
+        frames = self._frames.get(object_id)
+        if frames is None:
+            return None
+
+        ind = bisect.bisect_right(frames, frame_ind)
+
+        while ind < len(frames):
+            if self.is_current(object_id, frames[ind]):
+                return frames[ind]
+            del frames[ind]
+
+        return None
+
+    def previous_frame(self, object_id, frame_ind):
+        """The last frame before frame_ind the object appears in, or None"""
+
+        frames = self._frames.get(object_id)
+        if frames is None:
+            return None
+
+        ind = bisect.bisect_left(frames, frame_ind) - 1
+
+        while ind >= 0:
+            if self.is_current(object_id, frames[ind]):
+                return frames[ind]
+            del frames[ind]
+            ind -= 1
+
+        return None
+
+    def first_frame(self, object_id):
+        return self.next_frame(object_id, -1)
+
+    def last_frame(self, object_id):
+
+        frames = self._frames.get(object_id)
+        if not frames:
+            return None
+
+        return self.previous_frame(object_id, frames[-1] + 1)
+
+    def object_frames(self, object_id):
+        """The sorted frame indices the object appears in"""
+        return [frame_ind for frame_ind in self._frames.get(object_id, ()) if self.is_current(object_id, frame_ind)]
+
+    def position(self, frame_ind, object_id, annotations):
+        """
+            Index of the object in annotations, the annotation objects of the frame, or -1.
+            The positions are computed once per frame and kept until the frame is updated.
+        """
+
+        positions = self._positions.get(frame_ind)
+
+        if positions is None:
+            positions = {annotation.obj_id: ind for ind, annotation in enumerate(annotations)}
+            self._positions[frame_ind] = positions
+
+        return positions.get(object_id, -1)
+
+    def forget_positions(self, frame_ind):
+        self._positions.pop(frame_ind, None)
@@ -0,0 +1,203 @@
+import threading
+import logging
+import cv2
+import numpy as np
+
+from pyannotate.video_reader import VideoReader
+
+# load logger
+logger = logging.getLogger("TrackerPropagation")
+
+# tracker name -> factory functions in cv2, the first one found is used. MOSSE is only in the legacy module
+TRACKERS = {
+    'CSRT': ('TrackerCSRT_create', 'legacy.TrackerCSRT_create'),
+    'KCF': ('TrackerKCF_create', 'legacy.TrackerKCF_create'),
+    'MOSSE': ('legacy.TrackerMOSSE_create', 'TrackerMOSSE_create'),
+}
+
+
+def create_tracker(name):
+
+    for factory_name in TRACKERS[name]:
+
+        module = cv2
+        *modules, function = factory_name.split('.')
+        for module_name in modules:
+            module = getattr(module, module_name, None)
+
+        factory = getattr(module, function, None)
+        if factory is not None:
+            return factory()
+
+    raise RuntimeError(f"The {name} tracker is not available, it needs the opencv-contrib-python package")
+
+
+def box_to_rect(box):
+    """(x1, y1, x2, y2) corners in any order to an (x, y, width, height) rectangle"""
+    x1, x2 = sorted((int(box[0]), int(box[2])))
+    y1, y2 = sorted((int(box[1]), int(box[3])))
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
+def rect_to_box(rect):
+    x, y, width, height = (int(round(value)) for value in rect)
+    return (x, y, x + width, y + height)
+
+
+class TrackerPropagator(threading.Thread):
+    """
+        Tracks a box forward from a frame in the background with an OpenCV
+        tracker, reading the video sequentially with its own capture.
+
+        The tracked boxes are collected for the UI thread, which takes them with
+        take_boxes and adds them to the annotations. Tracking stops after
+        frame_count frames, at the end of the video, when cancelled or when the
+        confidence of the tracker falls below min_confidence.
+
+        CSRT, KCF and MOSSE give no tracking score, for them the confidence is
+        the normalized correlation of the tracked patch with the patch of the
+        box on the first frame.
+    """
+
+    # size the patches are compared in
+    patch_size = (32, 32)
+
+    def __init__(self, video_file, start_frame, box, frame_count, tracker='CSRT', min_confidence=0.3,
+                 keyframe_index=None):
+
+        super().__init__(daemon=True)
+
+        self.video_file = video_file
+        self.start_frame = start_frame
+        self.box = box
+        self.frame_count = frame_count
+        self.tracker_name = tracker
+        self.min_confidence = min_confidence
+        self.keyframe_index = keyframe_index
+
+        self.frames_done = 0
+        self.last_confidence = 1.0
+        # why the tracking ended, None while running
+        self.stop_reason = None
+
+        # set when the tracking has ended
+        self.finished = threading.Event()
+
+        # list of (frame index, box) tracked but not yet taken
+        self._boxes = []
+        self._lock = threading.Lock()
+
+        self._running = True
+        self._cancel_reason = "cancelled"
+
+    @property
+    def progress(self):
+        if self.frame_count > 0:
+            return min(self.frames_done / self.frame_count, 1.0)
+        return 1.0
+
+    def take_boxes(self):
+        """The boxes tracked since the last call as a list of (frame index, (x1, y1, x2, y2))"""
+        with self._lock:
+            boxes = self._boxes
+            self._boxes = []
+        return boxes
+
+    def patch(self, frame, rect):
+        """The area of the rectangle in the frame as a grayscale patch of patch_size, None if outside the frame"""
+
+        x, y, width, height = (int(round(value)) for value in rect)
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x + width, frame.shape[1]), min(y + height, frame.shape[0])
+
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return None
+
+        gray = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+
+        return cv2.resize(gray, self.patch_size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def confidence(self, tracker, template, patch):
+
+        # trackers without a score of their own return -1
+        score = float(tracker.getTrackingScore()) if hasattr(tracker, 'getTrackingScore') else -1.0
+        if score >= 0:
+            return score
+
+        if patch is None:
+            return 0.0
+
+        score = float(cv2.matchTemplate(patch, template, cv2.TM_CCOEFF_NORMED)[0, 0])
+
+        # a flat patch has no correlation to measure
+        return score if np.isfinite(score) else 1.0
+
+    def run(self):
+
+        try:
+            self.track()
+        except Exception as e:
+            logger.exception("Tracking failed")
+            self.stop_reason = f"failed: {e}"
+        finally:
+            self.finished.set()
+
+    def track(self):
+
+        reader = VideoReader(cv2.VideoCapture(self.video_file), self.keyframe_index)
+
+        if not reader.cap.isOpened():
+            raise IOError(f"Couldn't open video {self.video_file} for tracking")
+
+        last_frame = min(self.start_frame + self.frame_count, reader.frame_count - 1)
+
+        frame = reader.read_bgr(self.start_frame)
+        rect = box_to_rect(self.box)
+
+        template = self.patch(frame, rect)
+        if template is None:
+            reader.release()
+            self.stop_reason = "box too small to track"
+            return
+
+        tracker = create_tracker(self.tracker_name)
+        tracker.init(frame, rect)
+
+        logger.info(f"Tracking box {self.box} from frame {self.start_frame} to {last_frame} with {self.tracker_name}")
+
+        for frame_ind in range(self.start_frame + 1, last_frame + 1):
+
+            if not self._running:
+                self.stop_reason = self._cancel_reason
+                break
+
+            frame = reader.read_bgr(frame_ind)
+
+            success, rect = tracker.update(frame)
+
+            self.last_confidence = self.confidence(tracker, template, self.patch(frame, rect)) if success else 0.0
+
+            if self.last_confidence < self.min_confidence:
+                self.stop_reason = f"low confidence at frame {frame_ind}"
+                break
+
+            with self._lock:
+                self._boxes.append((frame_ind, rect_to_box(rect)))
+
+            self.frames_done += 1
+
+        else:
+            self.stop_reason = "done"
+
+        reader.release()
+
+        logger.info(f"Tracking ended after {self.frames_done} frames, {self.stop_reason}")
+
+    def cancel(self, reason="cancelled"):
+        self._cancel_reason = reason
+        self._running = False
+
+    def stop(self):
+        self.cancel()
+        if self.is_alive():
+            self.join()
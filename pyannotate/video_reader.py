@@ -0,0 +1,144 @@
+import cv2
+import logging
+
+# load logger
+logger = logging.getLogger("VideoReader")
+
+
+class VideoReader:
+    """
+        Reads frames from a cv2.VideoCapture by index.
+
+        The decoder position is tracked so that stepping forward reads the
+        next frame directly and short forward jumps only grab() the frames
+        in between without converting them. Only jumps backwards or further
+        than max_sequential_skip frames seek the capture, with a keyframe
+        index the limit is sequential_skip_gops times the average GOP.
+
+        With a KeyframeIndex, a seek goes to the keyframe preceding the
+        requested frame and grabs forward from there. This costs at most one
+        GOP and lands exactly on the requested frame, unlike seeking to the
+        frame itself which is inaccurate on some containers. The position is
+        read back after seeking to the keyframe, a keyframe the capture does
+        not land on is not used again and the seek goes to an earlier
+        keyframe, or decodes from the start of the video.
+
+        A reader is not thread safe, only one thread should use it at a time.
+    """
+
+    # forward jumps of at most this many frames are done with grab() instead of seeking,
+    # a seek decodes from the previous keyframe which is slower for short jumps
+    max_sequential_skip = 32
+
+    # with a keyframe index, forward jumps of at most this many GOPs are done with grab().
+    # grab() still decodes the frames it skips, and a seek costs about two GOPs of decoding
+    sequential_skip_gops = 2
+
+    def __init__(self, cap, keyframe_index=None):
+
+        self.cap = cap
+
+        self.keyframe_index = keyframe_index
+
+        # longest forward jump done with grab()
+        self.sequential_skip = self.max_sequential_skip
+        if keyframe_index is not None and keyframe_index.has_keyframes:
+            average_gop = keyframe_index.frame_count / len(keyframe_index.keyframes)
+            self.sequential_skip = max(int(self.sequential_skip_gops * average_gop), 1)
+
+        # keyframes a seek did not land on
+        self._inaccurate_keyframes = set()
+
+        # index of the frame the next cap.read() returns, -1 if unknown
+        self._decoder_index = 0
+
+        # read the container properties once, querying the capture from
+        # another thread while it is decoding is not safe
+        if keyframe_index is not None:
+            self.frame_count = keyframe_index.frame_count
+        else:
+            self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = cap.get(cv2.CAP_PROP_FPS)
+        self.frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    def read(self, frame_index):
+        """
+            Decode the frame at frame_index
+
+            @return: rgb image as numpy array
+        """
+        return cv2.cvtColor(self.read_bgr(frame_index), cv2.COLOR_BGR2RGB)
+
+    def read_bgr(self, frame_index):
+        """
+            Decode the frame at frame_index in the BGR channel order of opencv
+        """
+
+        distance = frame_index - self._decoder_index
+
+        if self._decoder_index >= 0 and 0 <= distance <= self.sequential_skip:
+            self.grab_until(frame_index)
+
+        elif self.keyframe_index is not None and self.keyframe_index.has_keyframes:
+
+            keyframe = self.keyframe_index.preceding_keyframe(frame_index)
+
+            # if the decoder is already in the same GOP before the frame, going forward is cheaper than seeking
+            if not (keyframe <= self._decoder_index <= frame_index):
+                self.seek_keyframe(frame_index)
+
+            self.grab_until(frame_index)
+
+        else:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+
+        success, frame = self.cap.read()
+
+        if not success:
+            # the decoder position is unknown after a failed read, seek on the next read
+            self._decoder_index = -1
+            raise IOError(f"Could not read frame {frame_index} from video")
+
+        self._decoder_index = frame_index + 1
+
+        return frame
+
+    def seek_keyframe(self, frame_index):
+        """
+            Seek to the last keyframe at or before frame_index that the capture
+            lands on exactly, or to the start of the video
+        """
+
+        keyframe = self.keyframe_index.preceding_keyframe(frame_index)
+
+        while keyframe > 0:
+
+            if keyframe not in self._inaccurate_keyframes:
+
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+
+                position = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+                if position == keyframe:
+                    self._decoder_index = keyframe
+                    return
+
+                logger.warning(f"Seeking to keyframe {keyframe} landed on frame {position}, using an earlier keyframe")
+                self._inaccurate_keyframes.add(keyframe)
+
+            keyframe = self.keyframe_index.preceding_keyframe(keyframe - 1)
+
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self._decoder_index = 0
+
+    def grab_until(self, frame_index):
+        """
+            Go forward to frame_index without decoding the frames in between
+        """
+        while self._decoder_index < frame_index:
+            if not self.cap.grab():
+                break
+            self._decoder_index += 1
+
+    def release(self):
+        self.cap.release()
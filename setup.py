@@ -20,12 +20,16 @@ setuptools.setup(
     ],
     install_requires=[
         'opencv-contrib-python',
-        'pillow'
+        'pillow',
+        'numpy'
     ],
     entry_points={
         'console_scripts': [
             'ann_images = pyannotate.annotate_images:main',
             'ann_video = pyannotate.annotate_video:main',
+            'ann_convert = pyannotate.convert_annotations:main',
+            'ann_render = pyannotate.render_annotations:main',
+            'ann_export_crops = pyannotate.export_crops:main',
         ],
     },
     python_requires='>=3.6',        